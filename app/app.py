@@ -19,25 +19,68 @@ bot.
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from telegram.ext import Updater, CommandHandler
-from conf import Configuration
+from conf import Configuration, ConfigOverlay
 from exchange import ExchangeInterface
 from notification import Notifier
 from behaviour import Behaviour
+from rules import RuleEngine, SignalTable, get_signal_names
+from refresh import RefreshScheduler
+from outbox import NotificationOutbox
+from store import NotificationStore
+from users import UserRepository
+from results import ResultsPublisher
+from subscriptions import SubscriptionIndex
+from planner import AnalysisPlanner
+from scheduling import NotificationScheduler
+from templates import template_registry
+from charts import ChartCache, ChartPool, ChartService, get_chart_profiles
 from math import ceil
 
 import concurrent.futures
+import functools
+import threading
 import logs
 import structlog
-import copy
 
-#To store config per user
+#To store config per user, only what each user changed over the global config
 users_config = dict()
+users_chats = dict()
+
+#Market data of the users who chose their own market pairs, the rest use market_data
 users_market_data = dict()
 users_exchanges = dict()
 users_indicators = dict()
 
-#New analysis results updated each 5min
-new_results = dict()
+#Settings each user changed from the global config, kept between restarts
+users_repository = None
+users_lock = threading.RLock()
+
+#Long-lived notifier of each user
+users_notifiers = dict()
+
+#Users subscribed to each exchange, market pair, indicator and candle period
+subscriptions = SubscriptionIndex()
+
+#Only what someone is subscribed to is fetched and analyzed
+planner = AnalysisPlanner()
+subscriptions.add_listener(planner.update)
+
+#Subscriber standing for the slack, discord, twilio, gmail, webhook and stdout notifiers
+CHANNELS_ID = 'channels'
+
+#New analysis results updated each 5min, shared by all users as read only snapshots, the
+#alerts of each user wait there until its next notification
+results = ResultsPublisher(subscriptions)
+
+#Wakes the notification of users with new results, created with the Telegram job queue
+notifications = None
+
+#Sends the alerts of every update to the configured slack, discord, twilio, gmail, webhook and stdout
+channels_notifier = None
+
+#Latest signal values of every market pair, used by user rules
+signal_values = dict()
+signal_table = None
 
 # Load settings and create the config object
 config = Configuration()
@@ -52,17 +95,65 @@ logger.info('udate interval %d ', update_interval)
 
 config_indicators = config.indicators
 
+#Compound alert rules defined by users, over the signals of the configured indicators and informants
+#Disabled informants are never analyzed, their signals can't be used
+rule_engine = RuleEngine(get_signal_names(config.indicators, {
+    informant: [conf for conf in confs if conf['enabled']] for informant, confs in config.informants.items()
+}))
+users_rule_matches = dict()
+
+#Indicator and candle period computing each indicator signal, enabled informants are always analyzed
+rule_indicators = {
+    '{}_{}'.format(signal, conf['candle_period']): (indicator, conf['candle_period'])
+    for indicator, confs in config.indicators.items() for conf in confs for signal in conf['signal']
+}
+
+#Analysis keys planned for the rules of each user, they are not subscriptions so no alert is sent for them
+users_rule_keys = dict()
+
 # Configure and run configured behaviour.
 exchange_interface = ExchangeInterface(config.exchanges)
 
+#Screener mode only analyzes the top ranked markets when no markets are configured
+screener_enabled = not settings['market_pairs'] and settings['screener'].get('enabled', False)
+screener_args = {
+    'rank_by': settings['screener'].get('rank_by', 'quoteVolume'),
+    'top_n': settings['screener'].get('top_n', 50),
+    'min_quote_volume': settings['screener'].get('min_quote_volume', 0),
+    'quote_currencies': settings['screener'].get('quote_currencies')
+}
+
 if settings['market_pairs']:
     market_pairs = settings['market_pairs']
     logger.info("Found configured markets: %s", market_pairs)
     market_data = exchange_interface.get_exchange_markets(markets=market_pairs)
+elif screener_enabled:
+    logger.info("No configured markets, screening markets on exchange by %s.", screener_args['rank_by'])
+    market_data = exchange_interface.get_top_markets(**screener_args)
 else:
     logger.info("No configured markets, using all available on exchange.")
     market_data = exchange_interface.get_exchange_markets()
 
+#Candle refresh priorities per exchange, kept between updates
+refresh_schedulers = dict()
+
+#Rendered chart files and the worker processes rendering them, started before any other thread
+chart_cache = ChartCache()
+chart_pool = None
+chart_service = None
+
+#Sizes, panels and encodings of the charts, selectable per user and per /chart command
+chart_profiles = get_chart_profiles(settings['chart_profiles'])
+
+#Telegram messages and charts wait here to be sent within the rate limits
+outbox = None
+
+#Last status of every indicator and the messages not sent yet, kept between restarts
+store = None
+
+#Markets of the pairs added by users, analyzed while someone watches them
+users_markets = dict()
+
 #Dict to save user defined fibonacci levels
 fibonacci = None
 
@@ -98,6 +189,24 @@ def add_to_fibonnaci(exchange, market_pair):
     fibonacci[exchange][market_pair]['78.60'] = 0
     fibonacci[exchange][market_pair]['100.00'] = 0
 
+    #Levels set with /fibo before the last stop
+    levels = users_repository.get(str()).get('fibonacci:{}:{}'.format(exchange, market_pair))
+    if levels is not None:
+        fibonacci[exchange][market_pair].update(levels)
+
+def add_market_pairs(user_market_data):
+    """Keeps the markets of the pairs added by a user, so they can be analyzed."""
+    global users_markets, fibonacci
+
+    for exchange in user_market_data:
+        if exchange not in fibonacci:
+            fibonacci[exchange] = dict()
+
+        for market_pair, market in user_market_data[exchange].items():
+            users_markets.setdefault(exchange, dict())[market_pair] = market
+
+            if market_pair not in fibonacci[exchange]:
+                add_to_fibonnaci(exchange, market_pair)
 
 # Define a few command handlers. These usually take the two arguments bot and
 # update. Error handlers also receive the raised TelegramError object in error.
@@ -105,75 +214,283 @@ def add_to_fibonnaci(exchange, market_pair):
 def start(bot, update):    
     """Mainly used to set a general config per user."""
     
-    global config, users_config, users_market_data, users_exchanges 
-    global exchange_interface
-    
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
     
     logger.info('Starting chat with id: %s' % chat_id)
     
-    if user_id not in users_config:
-        users_config[user_id] = copy.deepcopy(config)
-        #replace chat id
-        users_config[user_id].notifiers['telegram']['required']['chat_id'] = chat_id
-        users_config[user_id].notifiers['telegram']['required']['user_id'] = user_id
-     
-    users_config[user_id].exchanges = exchange_interface.get_default_exchanges()
-    users_exchanges[user_id] = list(users_config[user_id].exchanges.keys())
-    users_indicators[user_id] = get_user_indicators(users_config[user_id].indicators)
+    user_id = load_user(chat_id)
     
     logger.info('Users exchanges ... ')
     logger.info( users_exchanges[user_id] )
     
     logger.info('Users indicators ... ')
     logger.info( users_indicators[user_id] ) 
-           
-    if user_id not in users_market_data:
-        users_market_data[user_id] = copy.deepcopy(market_data)
         
     update.message.reply_text('Hi! Welcome to Crypto Signals Bot')
     update.message.reply_text('Dont forget to set the update interval. Type /help for more info.')
         
 def help(bot, update):
     update.message.reply_text('Available commands:')
-    update.message.reply_text('/timeout to set the update interval')
-    update.message.reply_text('/unset to reset the timeout value - removes timer.')
+    update.message.reply_text('/timeout to set the minimum seconds between notifications')
+    update.message.reply_text('/unset to stop the notifications')
     update.message.reply_text('/markets to get a list of market pairs')
     update.message.reply_text('/market to add or remove a market pair')
     update.message.reply_text('/indicators to get a list of configured indicators')
     update.message.reply_text('/indicator to disable/enable an indicator')
     update.message.reply_text('/exchanges to get a list of configured Exchanges')
     update.message.reply_text('/exchange to disable/enable an Exchange')    
+    update.message.reply_text('/chart to get the chart of a market pair')
+    update.message.reply_text('/charts to enable/disable the charts sent with alerts or choose their profile')
+    update.message.reply_text('/digest to merge the alerts of each update into a few messages')
+    update.message.reply_text('/rules to get a list of your alert rules')
+    update.message.reply_text('/rule to add or remove an alert rule')
+
+def load_user(chat_id):
+    """Builds the config of a user from the global config and its stored settings.
+
+    Users are loaded on their first command or notification, so the bot starts in the same
+    time however many users it has.
+
+    Returns:
+        str: The id of the user.
+    """
+    global config, market_data, exchange_interface, rule_engine, notifications, users_repository
+    global users_config, users_chats, users_market_data, users_exchanges, users_indicators
+
+    user_id = 'usr_{}'.format(chat_id)
+
+    with users_lock:
+        if user_id in users_config:
+            return user_id
+
+        overrides = users_repository.get(chat_id)
+
+        #Changes are written to the repository as they happen
+        _config = ConfigOverlay(config, overrides)
+        _config.add_listener(functools.partial(users_repository.set, chat_id))
 
-def alarm(bot, job):
+        _exchanges = exchange_interface.get_default_exchanges()
+        disabled_exchanges = _config.get('disabled_exchanges', list())
+        users_exchanges[user_id] = [_exchange for _exchange in _exchanges if _exchange not in disabled_exchanges]
+        users_indicators[user_id] = _config.get_indicators()
+
+        #Users follow the shared market data until they choose their own market pairs
+        if 'market_pairs' in overrides:
+            users_market_data[user_id] = get_user_markets(_config.get('market_pairs'))
+            add_market_pairs(users_market_data[user_id])
+
+        users_config[user_id] = _config
+        users_chats[user_id] = chat_id
+
+        for expression in overrides.get('rules', list()):
+            try:
+                rule_engine.add_rule(user_id, expression)
+            except ValueError as err:
+                logger.error('Stored rule %s of user %s is not valid: %s', expression, user_id, err)
+
+        if 'timeout' in overrides:
+            notifications.set_spacing(user_id, overrides['timeout'])
+
+        update_subscriptions(user_id)
+
+    logger.info('Loaded user %s with %d stored settings', user_id, len(overrides))
+
+    return user_id
+
+def get_user_market_data(user_id):
+    """The market data of a user, the shared one, read when needed, unless it chose its pairs."""
+    global market_data, users_market_data
+
+    return users_market_data.get(user_id, market_data)
+
+def get_user_markets(market_pairs):
+    """Market data of the market pairs chosen by a user, on the default exchanges.
+
+    An empty list means the user removed every pair, not every market of the exchanges.
+    """
+    global exchange_interface
+
+    if not market_pairs:
+        return dict()
+
+    return exchange_interface.get_exchange_markets(
+                                    exchanges = exchange_interface.get_default_exchanges(),
+                                    markets = market_pairs
+                                    )
+
+def restore_users(bot, job):
+    """Loads the users with notifications enabled before the last stop, so they get alerts again."""
+    global users_repository
+
+    chat_ids = users_repository.get_chats('timeout')
+    for chat_id in chat_ids:
+        load_user(int(chat_id))
+
+    logger.info('Restored %d users with notifications enabled', len(chat_ids))
+
+def update_subscriptions(user_id):
+    """Applies the exchanges, market pairs and indicators of a user to the subscription index.
+
+    Users without notifications are not subscribed, so nothing is analyzed for them.
+    """
+    global subscriptions, notifications, users_exchanges, users_market_data, users_indicators
+
+    if not notifications.is_enabled(user_id):
+        subscriptions.remove_user(user_id)
+        update_rule_keys(user_id, set())
+        return
+
+    subscriptions.update_user(user_id, users_exchanges[user_id], get_user_market_data(user_id),
+                              users_indicators[user_id])
+    update_rule_keys(user_id, get_rule_keys(user_id))
+
+def get_rule_keys(user_id):
+    """Returns the analysis keys of the indicators used by the rules of a user, on its markets."""
+    global rule_engine, users_exchanges
+
+    work_items = set(
+        rule_indicators[name] for name in rule_engine.get_signals(user_id) if name in rule_indicators
+    )
+    if not work_items:
+        return set()
+
+    _market_data = get_user_market_data(user_id)
+    return set(
+        (exchange, market_pair, indicator, candle_period)
+        for exchange in users_exchanges[user_id]
+        for market_pair in _market_data.get(exchange, dict())
+        for indicator, candle_period in work_items
+    )
+
+def update_rule_keys(user_id, keys):
+    """Plans the analysis of the indicators used by the rules of a user."""
+    global planner, users_rule_keys
+
+    with users_lock:
+        old_keys = users_rule_keys.pop(user_id, set())
+        if keys:
+            users_rule_keys[user_id] = keys
+        planner.update(keys - old_keys, old_keys - keys)
+
+def update_channels_subscriptions():
+    """Subscribes the notifiers of the config file to every configured signal, if there is one."""
+    global subscriptions, channels_notifier, config, market_data
+
+    if channels_notifier is None:
+        return
+
+    if not channels_notifier.enabled_notifiers:
+        return
+
+    subscriptions.update_user(CHANNELS_ID, list(market_data), market_data, ConfigOverlay(config).get_indicators())
+
+def get_notifier(user_id):
+    """The notifier of a user, created once and kept in sync with the user settings."""
+    global users_notifiers, users_config, users_chats, users_market_data
+
+    _config = users_config[user_id]
+
+    if user_id not in users_notifiers:
+        #replace chat id
+        _telegram = dict(config.notifiers['telegram'])
+        _telegram['required'] = dict(_telegram['required'], chat_id=users_chats[user_id], user_id=user_id)
+
+        #Only the Telegram client, the other notifiers are shared by channels_notifier
+        _notifier = Notifier({'telegram': _telegram}, get_user_market_data(user_id),
+                             _config.get('enable_charts'), chart_cache, _config.get('chart_profile'))
+        _notifier.telegram_client.set_updater(updater)
+        _notifier.telegram_client.set_outbox(outbox)
+        users_notifiers[user_id] = _notifier
+
+    _notifier = users_notifiers[user_id]
+    _notifier.market_data = get_user_market_data(user_id)
+    _notifier.enable_charts = _config.get('enable_charts')
+    _notifier.chart_profile = _config.get('chart_profile')
+
+    return _notifier
+
+def tick_notifications(bot, job):
+    """Fires the slots of the notification timer wheel that are due."""
+    global notifications
+
+    notifications.tick()
+
+    #Users still waiting in each level of the wheel, the higher levels hold the longer timeouts
+    backlog = dict()
+    for (level, _), amount in notifications.get_backlog().items():
+        backlog[level] = backlog.get(level, 0) + amount
+    if backlog:
+        logger.debug('Notification backlog per wheel level: %s', backlog)
+
+def notify_users(user_ids):
+    """Notifies the users due in the same slot, one after the other."""
+
+    for user_id in user_ids:
+        try:
+            alarm(user_id)
+        except Exception as exc:
+            logger.error('Error notifying user %s: %s', user_id, exc)
+
+def wake_users(snapshot, exchange, user_ids):
+    """Schedules the notification of the users with alerts in a new results snapshot."""
+    global notifications
+
+    logger.info('Waking %d users for new results of %s', len(user_ids), exchange)
+    notifications.wake(user_ids)
+
+def alarm(user_id):
     
-    global exchange_interface, fibonacci, new_results,  updater, logger
+    global exchange_interface, fibonacci, results,  updater, logger, notifications
     global users_config, users_exchanges, users_market_data, users_indicators
     
-    chat_id = job.context
-    user_id = 'usr_{}'.format(chat_id)
-    
-    _market_data = users_market_data[user_id]
+    #Notifications disabled while this one was waiting
+    if not notifications.is_enabled(user_id):
+        return
+
     _config = users_config[user_id]
-        
-    _notifier = Notifier(_config.notifiers, _market_data, _config.settings['enable_charts'])
-    _notifier.telegram_client.set_updater(updater)
+    _notifier = get_notifier(user_id)
     
+    #Merge all the alerts of this cycle into as few messages as possible
+    if _config.get('digest', False):
+        _notifier.start_digest()
 
-    #Getting custom results for each user
-    messages = dict()
+    #Every alert published since the last notification, already grouped by the subscription index
+    messages = results.get_view(user_id).get_messages()
     
-    for _exchange in _market_data:
-        if _exchange in users_exchanges[user_id] :
-            messages[_exchange] = dict()
+    for _exchange in messages:
+        _notifier.notify_telegram({_exchange: messages[_exchange]}, users_indicators[user_id])
+
+    notify_rules(_notifier, user_id)
 
-            for _market_pair in _market_data[_exchange]:
-                if len(new_results[_exchange][_market_pair]) > 0:
-                    messages[_exchange][_market_pair] = copy.deepcopy(new_results[_exchange][_market_pair])
+    _notifier.flush_digest()
 
-        if len(messages[_exchange]) > 0 :
-            _notifier.notify_telegram(messages, users_indicators[user_id])
+
+def notify_rules(notifier, user_id):
+    """Send a message for each market pair that started matching one of the user rules."""
+    global rule_engine, signal_table, users_rule_matches, users_exchanges, users_market_data
+
+    if signal_table is None:
+        return
+
+    last_matches = users_rule_matches.get(user_id, dict())
+    current_matches = dict()
+
+    for expression, rows in rule_engine.get_matches(user_id, signal_table):
+        current_matches[expression] = set()
+
+        for _exchange, _market_pair in rows:
+            if _exchange not in users_exchanges[user_id]:
+                continue
+            if _market_pair not in get_user_market_data(user_id).get(_exchange, dict()):
+                continue
+
+            current_matches[expression].add((_exchange, _market_pair))
+
+            if (_exchange, _market_pair) not in last_matches.get(expression, set()):
+                message = '{} {} matches rule: {}'.format(_exchange, _market_pair, expression)
+                notifier.notify_telegram_message(message, None)
+
+    users_rule_matches[user_id] = current_matches
 
 
 def fibo(bot, update, args):
@@ -208,6 +525,7 @@ def fibo(bot, update, args):
                     level['61.80'] = price_max - 0.618 * diff
                     level['78.60'] = price_max - 0.786 * diff
 
+                users_repository.set(str(), 'fibonacci:binance:{}'.format(market_pair), level)
 
                 update.message.reply_text('Successfully set %s as %s value for %s!' % (args[2], args[1], market_pair))
             
@@ -220,15 +538,14 @@ def fibo(bot, update, args):
 
 def chart(bot, update, args):
     """Send a chart image for a specific market pair and candle period."""
-    global market_data, users_config
+    global market_data, users_config, users_market_data
     
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
-    _market_data = users_market_data[user_id]
     _config = users_config[user_id]
-    _notifier = Notifier(_config.notifiers, _market_data, _config.settings['enable_charts'])
-    _notifier.telegram_client.set_updater(updater)    
+    _notifier = get_notifier(user_id)
+    _market_data = get_user_market_data(user_id)
     
     logger.info('Processing command for chat_id %s' % str(chat_id))
 
@@ -236,24 +553,109 @@ def chart(bot, update, args):
         exchange = args[0].strip().lower()
         market_pair = args[1].strip().upper()
         
-        if market_pair in market_data[exchange]: 
+        if market_pair in _market_data.get(exchange, dict()) or market_pair in market_data.get(exchange, dict()): 
             candle_period = args[2].strip().lower()
 
-            _notifier.notify_telegram_chart(chat_id, exchange, market_pair, candle_period)
+            profile_name = args[3].strip().lower() if len(args) > 3 else _config.get('chart_profile')
+            if profile_name not in chart_profiles:
+                update.message.reply_text('Unknown chart profile %s, use one of: %s' % (profile_name, ', '.join(chart_profiles)))
+                return
+
+            candles = get_cached_candles(exchange, market_pair, candle_period)
+            if len(candles) == 0:
+                update.message.reply_text('No candle data for %s %s on %s!' % (market_pair, candle_period, exchange))
+                return
+
+            #Fibonacci levels are added with the first analysis of a market pair
+            _fibonacci = fibonacci.get(exchange, dict()).get(market_pair)
+            if _fibonacci is None:
+                update.message.reply_text('No data for %s on %s yet, try again later!' % (market_pair, exchange))
+                return
+
+            version = chart_service.get_chart(exchange, market_pair, candle_period, candles, _fibonacci,
+                                              chart_profiles[profile_name])
+            if version is None:
+                update.message.reply_text('Error creating the chart of %s %s on %s, try again later!' % (market_pair, candle_period, exchange))
+                return
+
+            #The version just rendered, even if a newer one is on its way
+            _notifier.notify_telegram_chart(chat_id, exchange, market_pair, candle_period, profile_name, version)
         else:
             update.message.reply_text('Market pair %s is not configured!' % market_pair)
 
     except (IndexError, ValueError) as err:
         logger.error('Error on chart() command... %s', err)
-        update.message.reply_text('Usage: /chart <exchange> <market_pair> <candle_period>')
-        update.message.reply_text('Usage: /chart binance xrp/usdt 4h')
+        update.message.reply_text('Usage: /chart <exchange> <market_pair> <candle_period> [profile]')
+        update.message.reply_text('Usage: /chart binance xrp/usdt 4h full')
+
+def get_cached_candles(exchange, market_pair, candle_period):
+    """Candles of the last analysis, fetched from the exchange only if they are not cached."""
+    global refresh_schedulers, exchange_interface
+
+    if exchange in refresh_schedulers:
+        candles = refresh_schedulers[exchange].get_candles((market_pair, candle_period))
+        if len(candles) > 0:
+            return candles
+
+    try:
+        return exchange_interface.get_historical_data(market_pair, exchange, candle_period)
+    except Exception as exc:
+        logger.info('Error fetching candles for %s %s on %s: %s', market_pair, candle_period, exchange, exc)
+        return list()
+
+def charts(bot, update, args):
+    """Enable/Disable the charts sent with the alerts or select their profile."""
+    global users_config
+
+    chat_id = update.message.chat_id
+    user_id = load_user(chat_id)
+
+    try:
+        # args[0] is on, off or a chart profile
+        operation = args[0].strip().lower()
+        if operation in chart_profiles:
+            users_config[user_id].set('chart_profile', operation)
+            update.message.reply_text('Charts are now sent with the %s profile!' % operation)
+            return
+
+        if operation not in ('on', 'off'):
+            raise ValueError('Unknown operation %s' % operation)
+
+        users_config[user_id].set('enable_charts', operation == 'on')
+
+        update.message.reply_text('Charts with alerts are now %s!' % operation)
+    except (IndexError, ValueError) as err:
+        logger.error('Error on charts() command... %s', err)
+        update.message.reply_text('Usage: /charts <on|off|profile>')
+        update.message.reply_text('Profiles: %s' % ', '.join(chart_profiles))
+        update.message.reply_text('Charts are always available with /chart')
+
+def digest(bot, update, args):
+    """Enable/Disable merging the alerts of each update into digest messages."""
+    global users_config
+
+    chat_id = update.message.chat_id
+    user_id = load_user(chat_id)
+
+    try:
+        # args[0] is on or off
+        operation = args[0].strip().lower()
+        if operation not in ('on', 'off'):
+            raise ValueError('Unknown operation %s' % operation)
+
+        users_config[user_id].set('digest', operation == 'on', False)
+
+        update.message.reply_text('Digest of alerts is now %s!' % operation)
+    except (IndexError, ValueError) as err:
+        logger.error('Error on digest() command... %s', err)
+        update.message.reply_text('Usage: /digest <on|off>')
 
 def exchanges(bot, update):
     """ Return a list with the configured exchanges"""
     global users_config, users_exchanges
         
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
     _exchanges = users_exchanges[user_id]
         
@@ -265,7 +667,7 @@ def exchange(bot, update, args):
     global users_config, users_exchanges
     
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
     _exchanges = users_exchanges[user_id]
     
@@ -276,6 +678,10 @@ def exchange(bot, update, args):
         if operation == 'disable':
             if exchange in _exchanges:
                 _exchanges.remove(exchange)
+                update_subscriptions(user_id)
+
+                disabled_exchanges = users_config[user_id].get('disabled_exchanges', list())
+                users_config[user_id].set('disabled_exchanges', disabled_exchanges + [exchange], list())
                 update.message.reply_text('Exchange %s was disabled sucessfully!' % exchange)
                 
                 logger.info('Exchange %s disabled for user %s' % (exchange, user_id))
@@ -296,9 +702,9 @@ def markets(bot, update):
     global users_config
         
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
-    _market_pairs = users_config[user_id].settings['market_pairs']
+    _market_pairs = users_config[user_id].get('market_pairs')
         
     update.message.reply_text('List of market pairs to analyze ... ')
     update.message.reply_text(str(_market_pairs))
@@ -306,23 +712,16 @@ def markets(bot, update):
     
 def market(bot, update, args):
     """Add/Remove a marker pair."""
-    global users_config, settings, exchange_interface
-    
-    #To store all exchanges/market_pairs to analyze
-    global market_data
+    global users_config, exchange_interface
     
     #To store custom exchanges/market_pairs for each user
     global users_market_data
     
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id) 
+    user_id = load_user(chat_id)
      
     _config = users_config[user_id]
-    _settings  = _config.settings
-    _exchanges = _config.exchanges
-    
-    #TODO: call get_default_exchange()
-    exchange = 'binance'
+    _exchanges = exchange_interface.get_default_exchanges()
 
     try:
         # args[0] is the operation to do
@@ -332,11 +731,8 @@ def market(bot, update, args):
         
                 
         if operation == 'add':
-            _settings['market_pairs'].append(market_pair)
-            _market_data = exchange_interface.get_exchange_markets(
-                                                    exchanges = _exchanges, 
-                                                    markets = _settings['market_pairs']
-                                                    )
+            _market_pairs = list(_config.get('market_pairs') or list()) + [market_pair]
+            _market_data = get_user_markets(_market_pairs)
             exists = False
             for _exchange in _market_data:
                 for _pair in _market_data[_exchange]:
@@ -347,33 +743,31 @@ def market(bot, update, args):
             #Is a valid market pair
             if exists == True:
                 users_market_data[user_id] = _market_data
+                update_subscriptions(user_id)
+                _config.set('market_pairs', _market_pairs)
                 
-                #Save user market pair in global config to be part of analysis
-                if market_pair not in settings['market_pairs']:
-                    settings['market_pairs'].append(market_pair)
-                    
-                    #by default takes global config.exchanges
-                    market_data = exchange_interface.get_exchange_markets(markets=settings['market_pairs'])
-            
-                #TODO: fix it
-                add_to_fibonnaci(exchange, market_pair)
+                #Save user market pair to be part of analysis
+                add_market_pairs(_market_data)
 
                 update.message.reply_text('%s successfully added!' % market_pair)
             else:
-                _settings['market_pairs'].remove(market_pair)
                 update.message.reply_text('%s doesnt exist on your exchanges %s!' % (market_pair, str(_exchanges)))
                 return
                 
 
         if operation == 'remove':
             
-            if market_pair not in _settings['market_pairs']:
+            _market_pairs = list(_config.get('market_pairs') or list())
+            if market_pair not in _market_pairs:
                 update.message.reply_text('%s is not in your market pairs list.' % market_pair)
+                return
                 
-            _settings['market_pairs'].remove(market_pair)
-            _market_data = exchange_interface.get_exchange_markets(markets=_settings['market_pairs'])
+            _market_pairs.remove(market_pair)
+            _market_data = get_user_markets(_market_pairs)
             
             users_market_data[user_id] = _market_data
+            update_subscriptions(user_id)
+            _config.set('market_pairs', _market_pairs)
             
             update.message.reply_text('%s successfully removed!' % market_pair)
 
@@ -386,28 +780,22 @@ def indicators(bot, update):
     """ Display enabled indicators """
     
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
-    _config = users_config[user_id]
+    _indicators = users_indicators[user_id]
         
     update.message.reply_text('Configured indicators ... ')
 
-    for indicator in _config.indicators:
-        msg = indicator
-
-        for conf in _config.indicators[indicator] :
-            if conf['enabled']:
-                msg = '%s %s' % (msg, conf['candle_period'])
-
-        if msg != indicator :
-            update.message.reply_text(msg)
+    for indicator in _indicators:
+        if _indicators[indicator]:
+            update.message.reply_text(' '.join([indicator] + _indicators[indicator]))
 
 def indicator(bot, update, args):
     """ Manage indicators """
     global users_indicators
     
     chat_id = update.message.chat_id
-    user_id = 'usr_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
     _config = users_config[user_id]
         
@@ -422,20 +810,78 @@ def indicator(bot, update, args):
             # args[2] the operation
             enabled = args[2] == 'enable'
 
-            for idx, conf in enumerate(_config.indicators[indicator]) :
-                if conf['candle_period'] == candle_period:
-                    _config.indicators[indicator][idx]['enabled'] = enabled
+            _config.set_indicator(indicator, candle_period, enabled)
             
-            users_indicators[user_id] = get_user_indicators(_config.indicators)
+            users_indicators[user_id] = _config.get_indicators()
+            update_subscriptions(user_id)
             
             update.message.reply_text('Changes applied successfully!')
         except (IndexError, ValueError) as err:
             logger.error('Error on indicator() command... %s', err)
             update.message.reply_text('Usage: /indicator <indicator> <15m|30m|1h|4h> <enable|disable>')
 
-def set_timeout(bot, update, args, job_queue, chat_data):
-    """Add a job to the queue."""
+def rules(bot, update):
+    """ Return a list with the user alert rules"""
+    global rule_engine
+
     chat_id = update.message.chat_id
+    user_id = load_user(chat_id)
+
+    _rules = rule_engine.get_rules(user_id)
+
+    if len(_rules) == 0:
+        update.message.reply_text('You have no alert rules. Type /rule to add one.')
+        return
+
+    update.message.reply_text('Your alert rules ... ')
+    for idx, expression in enumerate(_rules):
+        update.message.reply_text('%d: %s' % (idx + 1, expression))
+
+def rule(bot, update, args):
+    """Add/Remove a compound alert rule."""
+    global rule_engine
+
+    chat_id = update.message.chat_id
+    user_id = load_user(chat_id)
+
+    try:
+        # args[0] is the operation to do
+        operation = args[0].lower()
+
+        if operation == 'add':
+            # the rest of args is the rule expression
+            expression = ' '.join(args[1:])
+            rule_engine.add_rule(user_id, expression)
+            users_repository.set(chat_id, 'rules', rule_engine.get_rules(user_id), list())
+            update_subscriptions(user_id)
+
+            update.message.reply_text('Rule %s successfully added!' % expression)
+
+        elif operation == 'remove':
+            # args[1] is the number of the rule as listed by /rules
+            position = int(args[1]) - 1
+            if position < 0:
+                raise IndexError('Invalid rule number')
+
+            rule_engine.remove_rule(user_id, position)
+            users_repository.set(chat_id, 'rules', rule_engine.get_rules(user_id), list())
+            update_subscriptions(user_id)
+
+            update.message.reply_text('Rule successfully removed!')
+        else:
+            raise ValueError('Unknown operation %s' % operation)
+
+    except (IndexError, ValueError) as err:
+        logger.error('Error on rule() command... %s', err)
+        update.message.reply_text('Usage: /rule <add|remove> <expression|number>')
+        update.message.reply_text('For example: /rule add rsi_1h < 30 and iiv_5m > 5 and close > vwap_1h')
+
+def set_timeout(bot, update, args):
+    """Enable the notifications, at most one each timeout seconds."""
+    global notifications
+
+    chat_id = update.message.chat_id
+    user_id = load_user(chat_id)
     
     try:
         # args[0] should contain the time for the timer in seconds
@@ -444,11 +890,10 @@ def set_timeout(bot, update, args, job_queue, chat_data):
             update.message.reply_text('Sorry we can not go back to future!')
             return
 
-        # Add job to queue
-        job = job_queue.run_repeating(alarm, due, context=chat_id)
-        
-        job_id = 'job_{}'.format(chat_id)
-        chat_data[job_id] = job
+        # New results wake the notification, no sooner than due seconds after the last one
+        notifications.set_spacing(user_id, due)
+        users_repository.set(chat_id, 'timeout', due)
+        update_subscriptions(user_id)
 
         update.message.reply_text('Timeout successfully set to %d!' % due)
 
@@ -456,19 +901,21 @@ def set_timeout(bot, update, args, job_queue, chat_data):
         update.message.reply_text('Usage: /timeout <seconds>')
 
 
-def unset(bot, update, chat_data):
-    """Remove the job if the user changed their mind."""
+def unset(bot, update):
+    """Stop the notifications if the user changed their mind."""
+    global notifications
     
     chat_id = update.message.chat_id
-    job_id = 'job_{}'.format(chat_id)
+    user_id = load_user(chat_id)
     
-    if job_id not in chat_data:
+    users_repository.delete(chat_id, 'timeout')
+
+    if not notifications.remove_user(user_id):
         update.message.reply_text('You have no active timer')
         return
 
-    job = chat_data[job_id]
-    job.schedule_removal()
-    del chat_data[job_id]
+    update_subscriptions(user_id)
+    results.discard(user_id)
 
     update.message.reply_text('Timer successfully unset!')
 
@@ -477,19 +924,9 @@ def error(bot, update, error):
     """Log Errors caused by Updates."""
     logger.warning('Update "%s" caused error "%s"', update, error)
 
-def get_user_indicators(config_indicators):
-    _indicators = dict()
-    
-    for _indicator in config_indicators:
-        _indicators[_indicator] = list()
-        for conf in config_indicators[_indicator]:
-            if conf['enabled']:
-                _indicators[_indicator].append(conf['candle_period'])
-        
-    return _indicators
-
 def load_exchange(exchange):
-    global config, market_data, fibonacci, new_results
+    global config, market_data, users_markets, fibonacci, results, signal_values, refresh_schedulers
+    global channels_notifier, planner
            
     try:
         single_config = dict()
@@ -498,13 +935,34 @@ def load_exchange(exchange):
         single_exchange_interface = ExchangeInterface(single_config)
             
         single_market_data = dict()
-        single_market_data[exchange] = market_data[exchange]
+        single_market_data[exchange] = {**users_markets.get(exchange, dict()), **market_data.get(exchange, dict())}
+                
+        if exchange not in refresh_schedulers:
+            refresh_schedulers[exchange] = RefreshScheduler(
+                budget=settings['refresh'].get('budget'),
+                max_staleness=settings['refresh'].get('max_staleness', 3600)
+            )
                 
-        behaviour = Behaviour(config, single_exchange_interface)
+        behaviour = Behaviour(config, single_exchange_interface, refresh_schedulers[exchange], chart_pool, store)
     
-        new_result = behaviour.run(exchange, single_market_data, fibonacci, config.settings['output_mode'])
+        #Only pre-render the chart profiles someone wants with the alerts
+        with users_lock:
+            user_configs = list(users_config.values())
+        profile_names = set(
+            _config.get('chart_profile') for _config in user_configs
+            if _config.get('enable_charts', True)
+        )
+        _chart_profiles = [chart_profiles[name] for name in profile_names if name in chart_profiles]
+
+        behaviour.run(exchange, single_market_data, fibonacci, config.settings['output_mode'], _chart_profiles,
+                      planner.get_plan(exchange))
         
-        new_results[exchange] = new_result[exchange]
+        results.publish(exchange, behaviour.alerts)
+        if channels_notifier is not None:
+            #Only the alerts of the indicators enabled in the config, not those only users enabled
+            channels_notifier.notify_all(results.get_view(CHANNELS_ID).get_alerts())
+            channels_notifier.notify_signals(exchange, behaviour.signal_values[exchange])
+        signal_values[exchange] = behaviour.signal_values[exchange]
         
         return True
     except Exception as exc:
@@ -513,12 +971,46 @@ def load_exchange(exchange):
         raise exc
         #return False
     
+def screen_markets():
+    """Refresh the screened market pairs from one bulk ticker request per exchange."""
+    global market_data, fibonacci, exchange_interface
+
+    try:
+        screened_data = exchange_interface.get_top_markets(**screener_args)
+    except Exception as exc:
+        logger.info('Exception screening markets, keeping previous ones: %s', exc)
+        return
+
+    for exchange in screened_data:
+        if exchange not in fibonacci:
+            fibonacci[exchange] = dict()
+
+        for market_pair in screened_data[exchange]:
+            if market_pair not in fibonacci[exchange]:
+                add_to_fibonnaci(exchange, market_pair)
+
+    market_data = screened_data
+    template_registry.clear_market_contexts()
+
+    #Users without their own market pairs follow the screened ones
+    with users_lock:
+        user_ids = [user_id for user_id in users_config if user_id not in users_market_data]
+
+    for user_id in user_ids:
+        update_subscriptions(user_id)
+
 @scheduler.scheduled_job('interval', minutes=update_interval)
 def load_exchanges():
-    global market_data, new_results
-        
+    global market_data, results, signal_values, signal_table, notifications
+    
+    if screener_enabled:
+        screen_markets()
+
+    update_channels_subscriptions()
+
+    #Exchanges nobody watches are not analyzed
     with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_exchange = {executor.submit(load_exchange, exchange): exchange for exchange in market_data}
+        future_to_exchange = {executor.submit(load_exchange, exchange): exchange for exchange in planner.get_exchanges()}
         
         for future in concurrent.futures.as_completed(future_to_exchange):
             try:      
@@ -531,34 +1023,57 @@ def load_exchanges():
                 logger.info('Exception processing exchanges: %s' % (exc))
                 raise exc
 
+    #One table per cycle, shared by the rules of all users
+    signal_table = SignalTable(signal_values)
+
+    #Rules are checked once the table is complete
+    notifications.wake(rule_engine.get_users())
+
     
 def main():
-    global market_data, updater
+    global market_data, updater, notifications, channels_notifier
 
     setup_fibonacci(market_data)
 
     """Run bot."""
     updater = Updater(config.notifiers['telegram']['required']['token'])
 
+    #Notifications are woken by new results and run in batches from a single repeating job
+    notifications = NotificationScheduler(notify_users)
+    results.add_listener(wake_users)
+    updater.job_queue.run_repeating(tick_notifications, notifications.resolution)
+
+    #Alerts are rendered once per update for every other notifier
+    channels_notifier = Notifier(
+        {name: notifier for name, notifier in config.notifiers.items() if name != 'telegram'}, market_data, False
+    )
+
+    #Messages not sent before the last stop
+    outbox.replay(lambda payload: functools.partial(updater.bot.send_message, **payload))
+
+    #Users with notifications enabled before the last stop, loaded once the bot is running
+    updater.job_queue.run_once(restore_users, 0)
+
     # Get the dispatcher to register handlers
     dp = updater.dispatcher
 
     # on different commands - answer in Telegram
     dp.add_handler(CommandHandler("start", start))
     dp.add_handler(CommandHandler("help", help))
-    dp.add_handler(CommandHandler("timeout", set_timeout,
-                                  pass_args=True,
-                                  pass_job_queue=True,
-                                  pass_chat_data=True))
+    dp.add_handler(CommandHandler("timeout", set_timeout, pass_args=True))
     dp.add_handler(CommandHandler("exchanges", exchanges))
     dp.add_handler(CommandHandler("exchange", exchange, pass_args=True))
     dp.add_handler(CommandHandler("markets", markets))
     dp.add_handler(CommandHandler("market", market, pass_args=True))
     dp.add_handler(CommandHandler("indicators", indicators))
     dp.add_handler(CommandHandler("indicator", indicator, pass_args=True))
-    dp.add_handler(CommandHandler("unset", unset, pass_chat_data=True))
+    dp.add_handler(CommandHandler("unset", unset))
     dp.add_handler(CommandHandler("fibo", fibo, pass_args=True))
     dp.add_handler(CommandHandler("chart", chart, pass_args=True))
+    dp.add_handler(CommandHandler("charts", charts, pass_args=True))
+    dp.add_handler(CommandHandler("digest", digest, pass_args=True))
+    dp.add_handler(CommandHandler("rules", rules))
+    dp.add_handler(CommandHandler("rule", rule, pass_args=True))
 
     # log all errors
     dp.add_error_handler(error)
@@ -575,6 +1090,25 @@ def main():
   
 
 if __name__ == '__main__':
+    chart_pool = ChartPool(settings['chart_workers'], chart_cache)
+    chart_service = ChartService(chart_pool, settings['timezone'])
+
+    if settings['store'].get('path'):
+        store = NotificationStore(settings['store']['path'])
+
+    users_repository = UserRepository(settings['store'].get('path') or ':memory:')
+
+    outbox = NotificationOutbox(
+        workers=settings['outbox'].get('workers', 4),
+        max_size=settings['outbox'].get('max_size', 10000),
+        global_rate=settings['outbox'].get('global_rate', 30),
+        chat_rate=settings['outbox'].get('chat_rate', 1),
+        group_rate=settings['outbox'].get('group_rate', 20 / 60),
+        max_attempts=settings['outbox'].get('max_attempts', 6),
+        retry_delay=settings['outbox'].get('retry_delay', 5),
+        store=store
+    )
+
     scheduler.start() 
     
     main()
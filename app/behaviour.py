@@ -5,44 +5,35 @@
 
 import traceback
 import structlog
-import os
 
-import numpy as np
-
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib.ticker as mticker
-
-from matplotlib.dates import DateFormatter
-from matplotlib.lines import Line2D
-from matplotlib.patches import Rectangle
-
-from datetime import datetime
-from pytz import timezone
 from copy import deepcopy
 from ccxt import ExchangeError
 from tenacity import RetryError
-from jinja2 import Template
 
-from stockstats import StockDataFrame
 from analysis import StrategyAnalyzer
 from outputs import Output
 from analyzers.utils import IndicatorUtils
-from analyzers.indicators.obv import OBV
+from charts import ChartPool, DEFAULT_PROFILE, get_candles_date, get_chart_series
+from results import Alert
+from templates import template_registry
 
 class Behaviour(IndicatorUtils):
     """Default analyzer which gives users basic trading information.
     """
 
-    def __init__(self, config, exchange_interface):
+    def __init__(self, config, exchange_interface, refresh_scheduler=None, chart_pool=None, store=None):
         """Initializes DefaultBehaviour class.
 
         Args:
             indicator_conf (dict): A dictionary of configuration for this analyzer.
             exchange_interface (ExchangeInterface): Instance of the ExchangeInterface class for
                 making exchange queries.
+            refresh_scheduler (RefreshScheduler, optional): Decides which candles are fetched
+                again, the rest are taken from its cache. Default is to fetch everything.
+            chart_pool (ChartPool, optional): Worker processes rendering the charts. Default is
+                to render them in the calling thread.
+            store (NotificationStore, optional): Where the last status of every indicator is
+                kept between updates and restarts. Default is to keep it in last_analysis.
         """
 
         self.logger = structlog.get_logger()
@@ -51,36 +42,62 @@ class Behaviour(IndicatorUtils):
         self.crossover_conf = config.crossovers
         self.notifiers_conf = config.notifiers
         self.exchange_interface = exchange_interface
+        self.refresh_scheduler = refresh_scheduler
+        self.chart_pool = chart_pool or ChartPool(workers=0)
+        self.store = store
         self.strategy_analyzer = StrategyAnalyzer()
         
         self.all_historical_data = dict()
         self.last_analysis = dict()
+        self.signal_values = dict()
+        self.alerts = list()
+        self.plan = None
         self.timezone = config.settings['timezone']
 
         output_interface = Output()
         self.output = output_interface.dispatcher
 
 
-    def run(self, exchange, market_data, fibonacci, output_mode):
+    def run(self, exchange, market_data, fibonacci, output_mode, chart_profiles=(DEFAULT_PROFILE,), plan=None):
         """The analyzer entrypoint
 
         Args:
             market_data (dict): Dict of exchanges and symbol pairs to operate on.
             fibonacci (dict): Dict with Fibonacci levels
             output_mode (str): Which console output mode to use.
+            chart_profiles (list, optional): Defaults to the full size chart. Profiles of the
+                charts pre-rendered for the market pairs with new messages, empty for none.
+            plan (dict, optional): Defaults to every enabled indicator of every market pair.
+                The (indicator, candle_period) tuples to analyze per market pair, market pairs
+                missing in it are skipped.
         """
 
         self.logger.info("Starting default analyzer for %s ...", exchange)
 
+        self.plan = plan
+        if plan is not None:
+            market_data = {
+                _exchange: {market_pair: market for market_pair, market in markets.items() if market_pair in plan}
+                for _exchange, markets in market_data.items()
+            }
+
         self.all_historical_data = self.get_all_historical_data(market_data)
 
         new_analysis = self._test_strategies(market_data, output_mode)
+
+        self.signal_values = self.get_signal_values(new_analysis)
+
+        if self.refresh_scheduler:
+            self.refresh_scheduler.update_priorities(
+                new_analysis[exchange], self.all_historical_data[exchange]
+            )
         
         template = self.notifiers_conf['telegram']['optional']['template']
         
         indicator_messages = self.get_indicator_messages(new_analysis, market_data, template)
         
-        self._create_charts(exchange, indicator_messages, fibonacci)
+        if chart_profiles:
+            self._create_charts(exchange, indicator_messages, fibonacci, chart_profiles, new_analysis)
         
         return indicator_messages
 
@@ -99,6 +116,9 @@ class Behaviour(IndicatorUtils):
             if exchange not in data:
                 data[exchange] = dict()
 
+            #Kept in order for fetching, the set only answers membership
+            items = list()
+            seen_items = set()
             for market_pair in market_data[exchange]:
                 if market_pair not in data[exchange]:
                     data[exchange][market_pair] = dict()
@@ -109,17 +129,34 @@ class Behaviour(IndicatorUtils):
                         continue
 
                     for indicator_conf in self.indicator_conf[indicator]:
-                        if indicator_conf['enabled']:
-                            candle_period = indicator_conf['candle_period']
+                        if self._is_planned(market_pair, indicator, indicator_conf):
+                            item = (market_pair, indicator_conf['candle_period'])
+                            if item not in seen_items:
+                                seen_items.add(item)
+                                items.append(item)
 
-                            if candle_period not in data[exchange][market_pair]:
-                                candle_data = self._get_historical_data(market_pair, exchange, candle_period)
-                                
-                                if len(candle_data) == 0:
-                                    self.logger.warn('No candle data for %s %s on %s', market_pair, candle_period, exchange)
-                                    continue
-                                    
-                                data[exchange][market_pair][candle_period] = candle_data
+            if self.refresh_scheduler and self.plan is not None:
+                self.refresh_scheduler.retain(items)
+
+            if self.refresh_scheduler:
+                due_items = self.refresh_scheduler.select(items)
+            else:
+                due_items = seen_items
+
+            for market_pair, candle_period in items:
+                if (market_pair, candle_period) in due_items:
+                    candle_data = self._get_historical_data(market_pair, exchange, candle_period)
+
+                    if self.refresh_scheduler and len(candle_data) > 0:
+                        self.refresh_scheduler.set_candles((market_pair, candle_period), candle_data)
+                else:
+                    candle_data = self.refresh_scheduler.get_candles((market_pair, candle_period))
+
+                if len(candle_data) == 0:
+                    self.logger.warn('No candle data for %s %s on %s', market_pair, candle_period, exchange)
+                    continue
+
+                data[exchange][market_pair][candle_period] = candle_data
         
         #Return after iterate all exchanges
         return data
@@ -192,8 +229,8 @@ class Behaviour(IndicatorUtils):
                 self.logger.warn("No such indicator %s, skipping.", indicator)
                 continue
 
-            for indicator_conf in self.indicator_conf[indicator]:
-                if not indicator_conf['enabled']:
+            for index, indicator_conf in enumerate(self.indicator_conf[indicator]):
+                if not self._is_planned(market_pair, indicator, indicator_conf):
                     continue
                     
                 candle_period = indicator_conf['candle_period']
@@ -223,11 +260,19 @@ class Behaviour(IndicatorUtils):
                             analysis_args,
                             market_pair
                         ),
-                        'config': indicator_conf
+                        'config': indicator_conf,
+                        'index': index
                     })
         return results
 
 
+    def _is_planned(self, market_pair, indicator, indicator_conf):
+        #Users may enable candle periods disabled in the config, the plan has the last word
+        if self.plan is None:
+            return indicator_conf['enabled']
+        return (indicator, indicator_conf['candle_period']) in self.plan.get(market_pair, ())
+
+
     def _get_informant_results(self, exchange, market_pair):
         """Execute the informant analysis on a particular exchange and pair.
 
@@ -249,7 +294,7 @@ class Behaviour(IndicatorUtils):
                 self.logger.warn("No such informant %s, skipping.", informant)
                 continue
 
-            for informant_conf in self.informant_conf[informant]:
+            for index, informant_conf in enumerate(self.informant_conf[informant]):
                 if not informant_conf['enabled']:
                     continue
                     
@@ -274,7 +319,8 @@ class Behaviour(IndicatorUtils):
                             analysis_args,
                             market_pair
                         ),
-                        'config': informant_conf
+                        'config': informant_conf,
+                        'index': index
                     })
         return results
 
@@ -298,13 +344,23 @@ class Behaviour(IndicatorUtils):
                 self.logger.warn("No such crossover %s, skipping.", crossover)
                 continue
 
-            for crossover_conf in self.crossover_conf[crossover]:
+            for index, crossover_conf in enumerate(self.crossover_conf[crossover]):
                 if not crossover_conf['enabled']:
                     self.logger.debug("%s is disabled, skipping.", crossover)
                     continue
 
-                key_indicator = new_result[crossover_conf['key_indicator_type']][crossover_conf['key_indicator']][crossover_conf['key_indicator_index']]
-                crossed_indicator = new_result[crossover_conf['crossed_indicator_type']][crossover_conf['crossed_indicator']][crossover_conf['crossed_indicator_index']]
+                key_indicator = self._get_analysis(
+                    new_result[crossover_conf['key_indicator_type']][crossover_conf['key_indicator']],
+                    crossover_conf['key_indicator_index']
+                )
+                crossed_indicator = self._get_analysis(
+                    new_result[crossover_conf['crossed_indicator_type']][crossover_conf['crossed_indicator']],
+                    crossover_conf['crossed_indicator_index']
+                )
+
+                #Nobody watches one of the crossed candle periods
+                if key_indicator is None or crossed_indicator is None:
+                    continue
 
                 dispatcher_args = {
                     'key_indicator': key_indicator['result'],
@@ -317,11 +373,25 @@ class Behaviour(IndicatorUtils):
 
                 results[crossover].append({
                     'result': crossover_dispatcher[crossover](**dispatcher_args),
-                    'config': crossover_conf
+                    'config': crossover_conf,
+                    'index': index
                 })
         return results
 
 
+    def _get_analysis(self, analyses, index):
+        """Returns the analysis of the config at a position, None if it wasn't analyzed.
+
+        Only the planned candle periods are analyzed, so the position of an analysis in the
+        results changes with the subscriptions, the position of its config doesn't.
+        """
+
+        for analysis in analyses:
+            if analysis['index'] == index:
+                return analysis
+        return None
+
+
     def _get_historical_data(self, market_pair, exchange, candle_period):
         """Gets a list of OHLCV data for the given pair and exchange.
 
@@ -392,34 +462,24 @@ class Behaviour(IndicatorUtils):
             results = str()
         return results
 
-    def _create_charts(self, exchange, indicator_messages, fibonacci):
-        """Create charts for each market_pair/candle_period
+    def _create_charts(self, exchange, indicator_messages, fibonacci, chart_profiles, new_analysis):
+        """Create charts for each market_pair/candle_period and chart profile
+
+        Charts whose candles and fibonacci levels didn't change since their last render are
+        skipped by the chart cache. Indicator series already computed by the analysis are
+        drawn as they are. Charts are only queued for the chart pool, Telegram deliveries of
+        the alerts wait for their render when they are sent.
 
         Args:
             market_data (dict): A dictionary containing the market data of the symbols
+            chart_profiles (list): The chart profiles to render.
+            new_analysis (dict): The analysis of the exchange market pairs.
         """
-                
-        charts_dir = './charts'
-
-        now = datetime.now(timezone(self.timezone))
-        creation_date = now.strftime("%Y-%m-%d %H:%M:%S")
 
-        if not os.path.exists(charts_dir):
-            os.mkdir(charts_dir)
 
         for market_pair in indicator_messages[exchange]:
             
             candle_messages = indicator_messages[exchange][market_pair]
-                               
-            #indicators = new_analysis[exchange][market_pair]['indicators']
-                        
-            #OBV indicators
-            #obv = dict()
-            #for index, analysis in enumerate(indicators['obv']):
-                #if analysis['result'].shape[0] == 0:
-                    #continue
-                
-                #obv[analysis['config']['candle_period']] = analysis['result']          
             
             historical_data = self.all_historical_data[exchange][market_pair]
 
@@ -430,317 +490,86 @@ class Behaviour(IndicatorUtils):
                     continue
 
                 candles_data = historical_data[candle_period]
+                creation_date = get_candles_date(candles_data, self.timezone)
                 self.logger.info('Creating chart for %s %s %s', exchange, market_pair, candle_period)
-                                   
-                self._create_chart(exchange, market_pair, candle_period, candles_data, 
-                                   fibonacci_levels, charts_dir, creation_date)
-
 
-    def _create_chart(self, exchange, market_pair, candle_period, candles_data, 
-                      fibonacci_levels, charts_dir, creation_date):
+                series = get_chart_series(new_analysis[exchange][market_pair], candle_period, len(candles_data))
 
-        df = self.convert_to_dataframe(candles_data)
-
-        plt.rc('axes', grid=True)
-        plt.rc('grid', color='#b0b0b0', linestyle='-', linewidth=0.2, alpha = 0.6)
-
-        left, width = 0.1, 0.8
-        rect1 = [left, 0.7, width, 0.25]
-        rect2 = [left, 0.5, width, 0.2]
-        rect3 = [left, 0.3, width, 0.2]
-        rect4 = [left, 0.1, width, 0.2]
-        
-        fig = plt.figure(facecolor='white')
-        fig.set_size_inches(10, 16, forward=True)
-        axescolor = '#f6f6f6'  # the axes background color
-
-        ax1 = fig.add_axes(rect1, facecolor=axescolor)  # left, bottom, width, height
-        ax2 = fig.add_axes(rect2, facecolor=axescolor, sharex=ax1)
-        ax3 = fig.add_axes(rect3, facecolor=axescolor, sharex=ax1)
-        ax4 = fig.add_axes(rect4, facecolor=axescolor, sharex=ax1)
-
-        if fibonacci_levels['0.00'] > 0 and fibonacci_levels['0.00'] > fibonacci_levels['100.00']:
-            ax1.axhline(fibonacci_levels['0.00'], color='steelblue', linestyle='-', alpha=0.3)
-            ax1.axhspan(fibonacci_levels['23.60'], fibonacci_levels['0.00'], alpha=0.2, color='steelblue')
-            ax1.axhspan(fibonacci_levels['38.20'], fibonacci_levels['23.60'], alpha=0.3, color='steelblue')
-            ax1.axhspan(fibonacci_levels['50.00'], fibonacci_levels['38.20'], alpha=0.2, color='steelblue')
-            ax1.axhspan(fibonacci_levels['61.80'], fibonacci_levels['50.00'], alpha=0.3, color='steelblue')
-            ax1.axhspan(fibonacci_levels['78.60'], fibonacci_levels['61.80'], alpha=0.2, color='steelblue')
-            ax1.axhspan(fibonacci_levels['100.00'], fibonacci_levels['78.60'], alpha=0.3, color='steelblue')
-        
-        #Plot Candles chart
-        self.plot_candlestick(ax1, df, candle_period)
-
-        #Plot RSI (14)
-        self.plot_rsi(ax2, df)
-
-        #Plot OBV indicator with data of last analysis
-        #if candle_period in obv :
-        self.plot_obv(ax3, candles_data, candle_period)
-            
-        # Calculate and plot MACD       
-        self.plot_macd(ax4, df, candle_period)
-        
-
-        for ax in ax1, ax2, ax3, ax4:
-            if ax != ax4:
-                for label in ax.get_xticklabels():
-                    label.set_visible(False)
-            else:
-                for label in ax.get_xticklabels():
-                    label.set_rotation(30)
-                    label.set_horizontalalignment('right')
+                for profile in chart_profiles:
+                    job = self.chart_pool.create_job(exchange, market_pair, candle_period, candles_data,
+                                                     fibonacci_levels, creation_date, profile, series)
+                    self.chart_pool.submit(job)
 
-            ax.xaxis.set_major_locator(mticker.MaxNLocator(10))
-            ax.xaxis.set_major_formatter(DateFormatter('%d/%b'))
-            ax.xaxis.set_tick_params(which='major', pad=15) 
 
-        fig.autofmt_xdate()
+    def get_signal_values(self, new_analysis):
+        """Collects the latest value of every signal line, named as <signal>_<candle_period>.
 
-        title = '{} {} {} - {}'.format(exchange, market_pair, candle_period, creation_date).upper()
-        fig.suptitle(title, fontsize=14)
+        The OHLCV values of the shortest candle period are also available without suffix, so
+        rules like `close > vwap_1h` can be written.
 
-        market_pair = market_pair.replace('/', '_').lower()
-        chart_file = '{}/{}_{}_{}.png'.format(charts_dir, exchange, market_pair, candle_period)
-
-        plt.savefig(chart_file)
-        plt.close(fig)
-
-    def candlestick_ohlc(self, ax, quotes, width=0.2, colorup='k', colordown='r',
-                    alpha=1.0, ochl=False):
-        """
-        Plot the time, open, high, low, close as a vertical line ranging
-        from low to high.  Use a rectangular bar to represent the
-        open-close span.  If close >= open, use colorup to color the bar,
-        otherwise use colordown
-
-        Parameters
-        ----------
-        ax : `Axes`
-            an Axes instance to plot to
-        quotes : sequence of quote sequences
-            data to plot.  time must be in float date format - see date2num
-            (time, open, high, low, close, ...) vs
-            (time, open, close, high, low, ...)
-            set by `ochl`
-        width : float
-            fraction of a day for the rectangle width
-        colorup : color
-            the color of the rectangle where close >= open
-        colordown : color
-            the color of the rectangle where close <  open
-        alpha : float
-            the rectangle alpha level
-        ochl: bool
-            argument to select between ochl and ohlc ordering of quotes
-
-        Returns
-        -------
-        ret : tuple
-            returns (lines, patches) where lines is a list of lines
-            added and patches is a list of the rectangle patches added
+        Args:
+            new_analysis (dict): A dictionary of data related to the analysis.
 
+        Returns:
+            dict: A dictionary exchange -> market pair -> signal name -> value.
         """
 
-        OFFSET = width / 2.0
+        signal_values = dict()
 
-        lines = []
-        patches = []
-        for q in quotes:
-            if ochl:
-                t, open, close, high, low = q[:5]
-            else:
-                t, open, high, low, close = q[:5]
-
-            if close >= open:
-                color = colorup
-                lower = open
-                height = close - open
-            else:
-                color = colordown
-                lower = close
-                height = open - close
-
-            vline = Line2D(
-                xdata=(t, t), ydata=(low, high),
-                color=color,
-                linewidth=0.5,
-                antialiased=False,
-            )
-
-            rect = Rectangle(
-                xy=(t - OFFSET, lower),
-                width=width,
-                height=height,
-                facecolor=color,
-                edgecolor=None,
-                antialiased=False,
-                alpha=1.0
-            )
-
-            lines.append(vline)
-            patches.append(rect)
-            ax.add_line(vline)
-            ax.add_patch(rect)
-
-        ax.autoscale_view()
-
-        return lines, patches
-
-    def plot_candlestick(self, ax, df, candle_period):
-        textsize = 11
-
-        _time = mdates.date2num(df.index.to_pydatetime())
-        min_x = np.nanmin(_time)
-        max_x = np.nanmax(_time)
-
-        stick_width = ((max_x - min_x) / _time.size ) 
-
-        prices = df["close"]
+        for exchange in new_analysis:
+            signal_values[exchange] = dict()
 
-        ax.set_ymargin(0.2)
-        ax.ticklabel_format(axis='y', style='plain')
+            for market_pair in new_analysis[exchange]:
+                values = dict()
+                ohlcv_periods = list()
 
-        self.candlestick_ohlc(ax, zip(_time, df['open'], df['high'], df['low'], df['close']),
-                    width=stick_width, colorup='olivedrab', colordown='crimson')
-                    
-        ma25 = self.moving_average(prices, 25, type='simple')
-        ma7 = self.moving_average(prices, 7, type='simple')
-
-        ax.plot(df.index, ma25, color='indigo', lw=0.6, label='MA (25)')
-        ax.plot(df.index, ma7, color='orange', lw=0.6, label='MA (7)')
-    
-        ax.text(0.04, 0.94, 'MA (7, close, 0)', color='orange', transform=ax.transAxes, fontsize=textsize, va='top')
-        ax.text(0.24, 0.94, 'MA (25, close, 0)', color='indigo', transform=ax.transAxes,  fontsize=textsize, va='top')
-
-    def plot_rsi(self, ax, df):
-        textsize = 11
-        fillcolor = 'darkmagenta'
-
-        rsi = self.relative_strength(df["close"])
-
-        ax.plot(df.index, rsi, color=fillcolor, linewidth=0.5)
-        ax.axhline(70, color='darkmagenta', linestyle='dashed', alpha=0.6)
-        ax.axhline(30, color='darkmagenta', linestyle='dashed', alpha=0.6)
-        ax.fill_between(df.index, rsi, 70, where=(rsi >= 70),
-                        facecolor=fillcolor, edgecolor=fillcolor)
-        ax.fill_between(df.index, rsi, 30, where=(rsi <= 30),
-                        facecolor=fillcolor, edgecolor=fillcolor)
-        ax.set_ylim(0, 100)
-        ax.set_yticks([30, 70])
-        ax.text(0.024, 0.94, 'RSI (14)', va='top',transform=ax.transAxes, fontsize=textsize)
-
-    def plot_macd(self, ax, df, candle_period):
-        textsize = 11
-
-        df = StockDataFrame.retype(df)
-        df['macd'] = df.get('macd')
-
-        min_y = df.macd.min()
-        max_y = df.macd.max()
-
-        #Reduce Macd Histogram values to have a better visualization
-        macd_h = df.macdh * 0.5
-
-        if (macd_h.min() < min_y):
-            min_y = macd_h.min()
-
-        if (macd_h.max() > max_y):
-            max_y = macd_h.max() 
-
-        #Adding some extra space at bottom/top
-        min_y = min_y * 1.2
-        max_y = max_y * 1.2
-
-        #Define candle bar width
-        _time = mdates.date2num(df.index.to_pydatetime())
-        min_x = np.nanmin(_time)
-        max_x = np.nanmax(_time)
-
-        bar_width = ((max_x - min_x) / _time.size ) * 0.8            
-
-        ax.bar(x=_time, bottom=[0 for _ in macd_h.index], height=macd_h, width=bar_width, color="red", alpha = 0.4)
-        ax.plot(_time, df.macd, color='blue', lw=0.6)
-        ax.plot(_time, df.macds, color='red', lw=0.6)
-        ax.set_ylim((min_y, max_y))
-    
-        ax.yaxis.set_major_locator(mticker.MaxNLocator(nbins=5, prune='upper'))
-        ax.text(0.024, 0.94, 'MACD (12, 26, close, 9)', va='top', transform=ax.transAxes, fontsize=textsize)  
-
-    def plot_obv(self, ax, candles_data, candle_period):
-        
-        obv_df = OBV().analyze(candles_data)
-        
-        textsize = 11
-
-        min_y = obv_df.obv.min()
-        max_y = obv_df.obv.max()
-
-        #Adding some extra space at bottom/top
-        min_y = min_y * 1.2
-        max_y = max_y * 1.2
-      
-        _time = mdates.date2num(obv_df.index.to_pydatetime())
-      
-        ax.plot(_time, obv_df.obv, color='blue', lw=0.6)
-        
-        ax.set_ylim((min_y, max_y))
-    
-        ax.yaxis.set_major_locator(mticker.MaxNLocator(nbins=5, prune='upper'))
-        ax.text(0.024, 0.94, 'OBV', va='top', transform=ax.transAxes, fontsize=textsize)
-        
-    def relative_strength(self, prices, n=14):
-        """
-        compute the n period relative strength indicator
-        http://stockcharts.com/school/doku.php?id=chart_school:glossary_r#relativestrengthindex
-        http://www.investopedia.com/terms/r/rsi.asp
-        """
+                for indicator_type in ('indicators', 'informants'):
+                    analyses = new_analysis[exchange][market_pair].get(indicator_type, dict())
 
-        deltas = np.diff(prices)
-        seed = deltas[:n + 1]
-        up = seed[seed >= 0].sum() / n
-        down = -seed[seed < 0].sum() / n
-        rs = up / down
-        rsi = np.zeros_like(prices)
-        rsi[:n] = 100. - 100. / (1. + rs)
+                    for indicator in analyses:
+                        for analysis in analyses[indicator]:
+                            if isinstance(analysis['result'], str) or analysis['result'].shape[0] == 0:
+                                continue
 
-        for i in range(n, len(prices)):
-            delta = deltas[i - 1]  # cause the diff is 1 shorter
+                            candle_period = analysis['config']['candle_period']
+                            latest_result = analysis['result'].iloc[-1]
 
-            if delta > 0:
-                upval = delta
-                downval = 0.
-            else:
-                upval = 0.
-                downval = -delta
+                            if indicator == 'ohlcv':
+                                ohlcv_periods.append((self.candle_period_seconds(candle_period), latest_result))
+                                signals = ['open', 'high', 'low', 'close', 'volume']
+                            else:
+                                signals = analysis['config']['signal']
 
-            up = (up * (n - 1) + upval) / n
-            down = (down * (n - 1) + downval) / n
+                            for signal in signals:
+                                name = '{}_{}'.format(signal, candle_period)
+                                if name not in values and signal in latest_result:
+                                    values[name] = latest_result[signal]
 
-            rs = up / down
-            rsi[i] = 100. - 100. / (1. + rs)
+                if ohlcv_periods:
+                    _, latest_result = min(ohlcv_periods, key=lambda period: period[0])
+                    for signal in ['open', 'high', 'low', 'close', 'volume']:
+                        values[signal] = latest_result[signal]
 
-        return rsi
+                signal_values[exchange][market_pair] = values
 
+        return signal_values
 
-    def moving_average(self, x, n, type='simple'):
-        """
-        compute an n period moving average.
+    def candle_period_seconds(self, candle_period):
+        """Converts a ccxt time unit like 5m or 1d into seconds.
 
-        type is 'simple' | 'exponential'
+        Args:
+            candle_period (str): The candle period.
 
+        Returns:
+            int: The length of the candle period in seconds.
         """
-        x = np.asarray(x)
-        if type == 'simple':
-            weights = np.ones(n)
-        else:
-            weights = np.exp(np.linspace(-1., 0., n))
 
-        weights /= weights.sum()
+        seconds = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000, 'y': 31536000}
 
-        a = np.convolve(x, weights, mode='full')[:len(x)]
-        a[:n] = a[n]
-        return a
+        try:
+            return int(candle_period[:-1]) * seconds[candle_period[-1]]
+        except (KeyError, ValueError):
+            return 0
 
     def get_indicator_messages(self, new_analysis, market_data, template):
         """Creates a message list from a user defined template
@@ -749,6 +578,9 @@ class Behaviour(IndicatorUtils):
             new_analysis (dict): A dictionary of data related to the analysis to send a message about.
             template (str): A Jinja formatted message template.
 
+        The alerts behind the messages, with the indicator producing them and the values to
+        render them, are kept in self.alerts.
+
         Returns:
             list: A list with the templated messages for the notifier.
         """
@@ -756,11 +588,14 @@ class Behaviour(IndicatorUtils):
         if not self.last_analysis:
             self.last_analysis = new_analysis
 
-        message_template = Template(template)
+        message_template = template_registry.get_template(template)
 
         new_messages = dict()
+        self.alerts = list()
         ohlcv_values = dict()
         lrsi_values = dict()
+        prices_texts = dict()
+        statuses = list()
 
         for exchange in new_analysis:
             
@@ -795,14 +630,17 @@ class Behaviour(IndicatorUtils):
                         continue
 
                     for indicator in new_analysis[exchange][market_pair][indicator_type]:
-                        for index, analysis in enumerate(new_analysis[exchange][market_pair][indicator_type][indicator]):
+                        for analysis in new_analysis[exchange][market_pair][indicator_type][indicator]:
                             if analysis['result'].shape[0] == 0:
                                 continue
 
+                            #Position of the config, kept when other candle periods are planned or not
+                            index = analysis['index']
+
                             values = dict()
                             if 'candle_period' in analysis['config']:
                                 candle_period = analysis['config']['candle_period']
-                                new_messages[exchange][market_pair][candle_period] = list()
+                                new_messages[exchange][market_pair].setdefault(candle_period, list())
 
                             if indicator_type == 'indicators':                                
                                 #Check for any user config
@@ -844,13 +682,20 @@ class Behaviour(IndicatorUtils):
                                 status = 'cold'
 
                             # Save status of indicator's new analysis
-                            new_analysis[exchange][market_pair][indicator_type][indicator][index]['status'] = status
+                            analysis['status'] = status
+                            status_key = (exchange, market_pair, indicator_type, indicator, index)
 
                             if latest_result['is_hot'] or latest_result['is_cold']:
-                                try:
-                                    last_status = self.last_analysis[exchange][market_pair][indicator_type][indicator][index]['status']
-                                except:
-                                    last_status = str()
+                                if self.store is not None:
+                                    last_status = self.store.get_status(*status_key)
+                                else:
+                                    try:
+                                        last_analysis = self._get_analysis(
+                                            self.last_analysis[exchange][market_pair][indicator_type][indicator], index
+                                        )
+                                        last_status = last_analysis['status']
+                                    except:
+                                        last_status = str()
 
                                 should_alert = True
 
@@ -862,32 +707,53 @@ class Behaviour(IndicatorUtils):
                                     should_alert = False
 
                                 if should_alert:
-                                    base_currency, quote_currency = market_pair.split('/')
-                                    precision = market_data[exchange][market_pair]['precision']
-                                    decimal_format = '.{}f'.format(precision['price'])
+                                    market_context = template_registry.get_market_context(
+                                        exchange, market_pair, market_data[exchange][market_pair]
+                                    )
 
                                     candle_period = analysis['config']['candle_period']
 
-                                    prices = ''
-                                    candle_values = ohlcv_values[exchange][market_pair]
-
-                                    if candle_period in candle_values :
-                                        for key, value in candle_values[candle_period].items():
-                                            value = format(value, decimal_format)
-                                            prices = '{} {}: {}' . format(prices, key.title(), value)   
+                                    #Same prices for every alert of the candle period
+                                    prices_key = (exchange, market_pair, candle_period)
+                                    if prices_key not in prices_texts:
+                                        prices_texts[prices_key] = self._format_prices(
+                                            ohlcv_values[exchange][market_pair].get(candle_period, dict()),
+                                            market_context['format_price']
+                                        )
+                                    prices = prices_texts[prices_key]
 
                                     lrsi = ''
                                     if candle_period in lrsi_values[exchange][market_pair]:
                                         lrsi = lrsi_values[exchange][market_pair][candle_period]['lrsi']
 
-                                    new_message = message_template.render(
-                                        values=values, exchange=exchange, market=market_pair, base_currency=base_currency,
-                                        quote_currency=quote_currency, indicator=indicator, indicator_number=index,
+                                    #Rendered again by every notifier with its own template
+                                    context = dict(
+                                        values=values, exchange=exchange, market=market_pair,
+                                        base_currency=market_context['base_currency'],
+                                        quote_currency=market_context['quote_currency'], indicator=indicator, indicator_number=index,
                                         analysis=analysis, status=status, last_status=last_status, 
                                         prices=prices, lrsi=lrsi)
 
+                                    new_message = message_template.render(**context)
+
                                     new_messages[exchange][market_pair][candle_period].append(new_message)
+                                    self.alerts.append(Alert(exchange, market_pair, indicator_type, indicator, index,
+                                                             candle_period, status, new_message, context))
+
+                            statuses.append((status_key, status))
+
+        # Written once per update, after every status was compared with the stored one
+        if self.store is not None:
+            self.store.set_statuses(statuses)
 
         # Merge changes from new analysis into last analysis
         self.last_analysis = {**self.last_analysis, **new_analysis}
-        return new_messages
\ No newline at end of file
+        return new_messages
+
+
+    def _format_prices(self, candle_values, format_price):
+        """Formats the OHLCV values of a candle period as ' Open: 1.00 High: 1.10 ...'."""
+
+        return ''.join(
+            ' {}: {}'.format(key.title(), format_price(value)) for key, value in candle_values.items()
+        )
\ No newline at end of file
@@ -0,0 +1,1148 @@
+"""Renders candle charts with indicators, in worker processes
+"""
+
+import io
+import os
+import hashlib
+import tempfile
+import threading
+import concurrent.futures
+
+from collections import OrderedDict
+from datetime import datetime
+from pytz import timezone
+
+import numpy as np
+import structlog
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+import matplotlib.ticker as mticker
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.dates import DateFormatter
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.transforms import blended_transform_factory
+
+from PIL import Image
+from analysis import StrategyAnalyzer
+from analyzers.utils import IndicatorUtils
+
+
+PANELS = ('candles', 'rsi', 'obv', 'macd')
+
+#Relative height of each panel in the figure
+PANEL_HEIGHTS = {'candles': 5, 'rsi': 4, 'obv': 4, 'macd': 4}
+
+FORMATS = ('png', 'jpeg', 'webp')
+
+#Series drawn by each panel
+PANEL_SERIES = {
+    'candles': ('ma7', 'ma25'),
+    'rsi': ('rsi',),
+    'obv': ('obv',),
+    'macd': ('macd', 'macdsignal', 'macdhist')
+}
+
+#Analyzer results behind each series: name -> (analyzer type, analyzer, arguments, column)
+CHART_SERIES = {
+    'ma7': ('informants', 'sma', {'period_count': 7}, 'sma'),
+    'ma25': ('informants', 'sma', {'period_count': 25}, 'sma'),
+    'rsi': ('indicators', 'rsi', {'period_count': 14, 'signal': ['rsi'], 'hot_thresh': 30, 'cold_thresh': 70}, 'rsi'),
+    'obv': ('indicators', 'obv', {'signal': ['obv'], 'hot_thresh': 0, 'cold_thresh': 0}, 'obv'),
+    'macd': ('indicators', 'macd', {'signal': ['macd'], 'hot_thresh': 0, 'cold_thresh': 0}, 'macd'),
+    'macdsignal': ('indicators', 'macd', {'signal': ['macd'], 'hot_thresh': 0, 'cold_thresh': 0}, 'macdsignal'),
+    'macdhist': ('indicators', 'macd', {'signal': ['macd'], 'hot_thresh': 0, 'cold_thresh': 0}, 'macdhist')
+}
+
+#period_count used by the analyzers when it is not configured
+DEFAULT_PERIOD_COUNTS = {'sma': 15, 'rsi': 14}
+
+#The original full size chart, used when no profile is given
+DEFAULT_PROFILE = {
+    'name': 'full',
+    'width': 10,
+    'height': 16,
+    'dpi': 100,
+    'panels': PANELS,
+    'lookback': None,
+    'format': 'png',
+    'colors': None,
+    'quality': 85
+}
+
+
+def get_chart_series(market_analysis, candle_period, size):
+    """Takes the series drawn by the charts from the analysis of a market pair.
+
+    Only results of the same candle period and period_count are used. Analyzer results have
+    their leading empty rows dropped, so they are aligned to the end of the candles.
+
+    Args:
+        market_analysis (dict): The analysis of a market pair, indicator type -> indicator ->
+            list of results.
+        candle_period (str): The candle period of the chart.
+        size (int): The amount of candles of the chart.
+
+    Returns:
+        dict: A dictionary series name -> numpy.ndarray with one value per candle, NaN where
+            there is no value. Series not found in the analysis are missing.
+    """
+
+    series = dict()
+
+    for name, (analyzer_type, analyzer, arguments, column) in CHART_SERIES.items():
+        period_count = arguments.get('period_count', DEFAULT_PERIOD_COUNTS.get(analyzer))
+
+        for analysis in market_analysis.get(analyzer_type, dict()).get(analyzer, list()):
+            config = analysis['config']
+            if config['candle_period'] != candle_period:
+                continue
+            if config.get('period_count', DEFAULT_PERIOD_COUNTS.get(analyzer)) != period_count:
+                continue
+            if isinstance(analysis['result'], str) or column not in analysis['result']:
+                continue
+
+            values = analysis['result'][column].values.astype(np.float64)[-size:]
+            series[name] = np.full(size, np.nan)
+            series[name][size - len(values):] = values
+            break
+
+    return series
+
+
+def get_chart_profiles(profiles_config):
+    """Validates the chart profiles of the settings, filling the missing options.
+
+    Args:
+        profiles_config (dict): A dictionary profile name -> options.
+
+    Raises:
+        ValueError: If a profile has an unknown panel or format.
+
+    Returns:
+        dict: A dictionary profile name -> complete profile.
+    """
+
+    profiles = {DEFAULT_PROFILE['name']: DEFAULT_PROFILE}
+
+    for name, options in (profiles_config or dict()).items():
+        profile = {**DEFAULT_PROFILE, **(options or dict()), 'name': name}
+        profile['panels'] = tuple(profile['panels'])
+        profile['format'] = profile['format'].lower()
+
+        if not profile['panels'] or not set(profile['panels']) <= set(PANELS):
+            raise ValueError('Chart profile {} panels must be some of {}'.format(name, ', '.join(PANELS)))
+        if profile['format'] not in FORMATS:
+            raise ValueError('Chart profile {} format must be one of {}'.format(name, ', '.join(FORMATS)))
+
+        profiles[name] = profile
+
+    return profiles
+
+
+#Renderers of the current worker process, one per figure layout, created on first use
+_renderers = dict()
+
+
+def get_candles_date(candles, timezone_name='UTC'):
+    """Returns the date of the last candle, shown in the chart title.
+
+    Args:
+        candles (list): A matrix of historical OHCLV data, timestamps in milliseconds.
+        timezone_name (str, optional): Defaults to UTC. Timezone of the date.
+
+    Returns:
+        str: The formatted date, empty when there are no candles.
+    """
+
+    if len(candles) == 0:
+        return ''
+
+    return datetime.fromtimestamp(candles[-1][0] / 1000, timezone(timezone_name)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _get_renderer(profile=DEFAULT_PROFILE):
+    layout = (profile['width'], profile['height'], tuple(profile['panels']))
+
+    if layout not in _renderers:
+        _renderers[layout] = ChartRenderer(*layout)
+
+    return _renderers[layout]
+
+
+def _load_renderer(profile=DEFAULT_PROFILE):
+    # The renderer can't be pickled, only loading it in the worker matters
+    _get_renderer(profile)
+
+
+def _render_job(job):
+    return _get_renderer(job['profile']).render(job)
+
+
+class ChartCache():
+    """Keeps rendered charts addressed by a hash of what they show.
+
+    Every version gets its own file, so a chart being sent is never overwritten by a newer
+    render. Recent images are also kept in memory together with the Telegram file_id of their
+    first upload, so the same version is never uploaded twice. The least recently used versions
+    are removed once there are more than max_files, together with the latest chart entries
+    pointing to them.
+    """
+
+    def __init__(self, charts_dir='./charts', max_files=500, max_images=100):
+        """Initializes ChartCache class
+
+        Args:
+            charts_dir (str, optional): Defaults to ./charts. Directory of the chart files.
+            max_files (int, optional): Defaults to 500. Maximum amount of chart files kept.
+            max_images (int, optional): Defaults to 100. Maximum amount of images kept in memory.
+        """
+
+        self.logger = structlog.get_logger()
+        self.charts_dir = charts_dir
+        self.max_files = max_files
+        self.max_images = max_images
+        self.latest = dict()
+        self.files = OrderedDict()
+        self.images = OrderedDict()
+        self.file_ids = dict()
+        self.uploads = dict()
+        self.renders = dict()
+        self.lock = threading.Lock()
+
+        if not os.path.exists(charts_dir):
+            os.mkdir(charts_dir)
+
+        # Files of a previous run are the first ones to evict
+        file_names = sorted(os.listdir(charts_dir), key=lambda name: os.path.getmtime(os.path.join(charts_dir, name)))
+        for file_name in file_names:
+            version = os.path.splitext(file_name)[0].split('_')[-1]
+            self.files[version] = os.path.join(charts_dir, file_name)
+
+
+    def get_version(self, job):
+        """Hashes the candles, fibonacci levels and profile of a chart job.
+
+        The title date is the one of the last candle, so it is already part of the candles.
+
+        Args:
+            job (dict): The chart job.
+
+        Returns:
+            str: The version of the chart.
+        """
+
+        digest = hashlib.sha1(job['candles'].tobytes())
+        digest.update(repr(sorted(job['fibonacci_levels'].items())).encode())
+        digest.update(repr((job['exchange'], job['market_pair'], job['candle_period'])).encode())
+        digest.update(repr(sorted(job['profile'].items())).encode())
+        return digest.hexdigest()[:16]
+
+
+    def get_path(self, exchange, market_pair, candle_period, version, image_format='png'):
+        """Returns the file of a chart version.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            version (str): The version of the chart.
+            image_format (str, optional): Defaults to png. The extension of the file.
+
+        Returns:
+            str: The path of the chart file.
+        """
+
+        market = market_pair.replace('/', '_').lower()
+        return '{}/{}_{}_{}_{}.{}'.format(self.charts_dir, exchange, market, candle_period, version, image_format)
+
+
+    def contains(self, version):
+        """Tells if a chart version was already rendered, marking it as recently used.
+
+        Args:
+            version (str): The version of the chart.
+
+        Returns:
+            bool: True if the version is cached.
+        """
+
+        with self.lock:
+            if version in self.images or (version in self.files and os.path.exists(self.files[version])):
+                self.files.move_to_end(version)
+                return True
+            return False
+
+
+    def store(self, job, image):
+        """Saves a rendered image and makes it the latest chart of its market pair and period.
+
+        The file is written to a temporary name first and renamed, so readers never see a
+        partial image.
+
+        Args:
+            job (dict): The chart job.
+            image (bytes): The rendered image.
+        """
+
+        chart_file = job['chart_file']
+        file_descriptor, temporary_file = tempfile.mkstemp(dir=self.charts_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as chart:
+                chart.write(image)
+            os.replace(temporary_file, chart_file)
+        except OSError:
+            os.remove(temporary_file)
+            raise
+
+        with self.lock:
+            self._remember_image(job['version'], image)
+            self.files[job['version']] = chart_file
+            self.files.move_to_end(job['version'])
+            self._evict()
+
+        self.set_latest(job['exchange'], job['market_pair'], job['candle_period'], job['version'],
+                        job['profile']['name'])
+
+
+    def set_latest(self, exchange, market_pair, candle_period, version, profile_name='full'):
+        """Registers a version as the latest chart of its market pair, candle period and profile.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            version (str): The version of the chart.
+            profile_name (str, optional): Defaults to full. The chart profile of the version.
+        """
+
+        with self.lock:
+            if version in self.files:
+                self.latest[(exchange, market_pair, candle_period, profile_name)] = version
+
+
+    def set_render(self, exchange, market_pair, candle_period, profile_name, future):
+        """Registers the render of the next latest chart of a market pair, candle period and profile.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            profile_name (str): The chart profile of the render.
+            future (concurrent.futures.Future): Resolves once the chart is cached.
+        """
+
+        key = (exchange, market_pair, candle_period, profile_name)
+        with self.lock:
+            self.renders[key] = future
+
+        future.add_done_callback(lambda done: self._remove_render(key, done))
+
+
+    def wait_latest(self, exchange, market_pair, candle_period, profile_name='full', timeout=60):
+        """Returns the latest chart version, waiting for the render of a newer one if there is one.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            profile_name (str, optional): Defaults to full. The chart profile.
+            timeout (int, optional): Defaults to 60. Seconds to wait for the render.
+
+        Returns:
+            str: The version of the chart, None if there is no chart.
+        """
+
+        with self.lock:
+            render = self.renders.get((exchange, market_pair, candle_period, profile_name))
+
+        if render is not None:
+            done, _ = concurrent.futures.wait([render], timeout=timeout)
+            if not done:
+                self.logger.info('Chart of %s %s %s not rendered after %d seconds, sending the previous one',
+                                 exchange, market_pair, candle_period, timeout)
+
+        return self.get_latest(exchange, market_pair, candle_period, profile_name)
+
+
+    def has_chart(self, exchange, market_pair, candle_period, profile_name='full'):
+        """Tells if there is a chart, cached or being rendered, for a market pair, candle period and profile."""
+
+        key = (exchange, market_pair, candle_period, profile_name)
+        with self.lock:
+            return key in self.renders or self.latest.get(key) in self.files
+
+
+    def _remove_render(self, key, future):
+        with self.lock:
+            if self.renders.get(key) is future:
+                del self.renders[key]
+
+
+    def get_latest(self, exchange, market_pair, candle_period, profile_name='full'):
+        """Returns the latest chart version of a market pair, candle period and profile.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            profile_name (str, optional): Defaults to full. The chart profile.
+
+        Returns:
+            str: The version of the chart, None if there is no chart.
+        """
+
+        with self.lock:
+            version = self.latest.get((exchange, market_pair, candle_period, profile_name))
+            if version is None or version not in self.files:
+                return None
+
+            self.files.move_to_end(version)
+            return version
+
+
+    def get_image(self, version):
+        """Returns the image of a chart version, from memory when possible.
+
+        Args:
+            version (str): The version of the chart.
+
+        Returns:
+            bytes: The image, None if the version is not cached.
+        """
+
+        with self.lock:
+            if version in self.images:
+                self.images.move_to_end(version)
+                return self.images[version]
+
+            chart_file = self.files.get(version)
+
+        if chart_file is None:
+            return None
+
+        try:
+            with open(chart_file, 'rb') as chart:
+                image = chart.read()
+        except IOError:
+            return None
+
+        with self.lock:
+            self._remember_image(version, image)
+
+        return image
+
+
+    def get_file_id(self, version):
+        """Returns the Telegram file_id of an already uploaded chart version.
+
+        Args:
+            version (str): The version of the chart.
+
+        Returns:
+            str: The file_id, None if the version was never uploaded.
+        """
+
+        return self.file_ids.get(version)
+
+
+    def set_file_id(self, version, file_id):
+        """Remembers the Telegram file_id of an uploaded chart version.
+
+        Senders waiting for the upload of the version are released.
+
+        Args:
+            version (str): The version of the chart.
+            file_id (str): The file_id returned by Telegram.
+        """
+
+        with self.lock:
+            if version in self.files:
+                self.file_ids[version] = file_id
+
+            upload = self.uploads.pop(version, None)
+
+        if upload is not None:
+            upload.set()
+
+
+    def get_photo(self, version, uploading=False, wait=40):
+        """Returns what to send for a chart version, called right before sending it.
+
+        The file_id is returned once the version was uploaded. Otherwise the first caller gets
+        the image to upload, and the next ones wait for the file_id of that upload instead of
+        uploading the image again. Waiting stops after `wait` seconds, when the caller uploads
+        the image itself in case the first upload failed.
+
+        Args:
+            version (str): The version of the chart.
+            uploading (bool, optional): Defaults to False. True when retrying the upload this
+                caller was given before, so it doesn't wait for itself.
+            wait (float, optional): Defaults to 40. Seconds to wait for another upload.
+
+        Returns:
+            tuple: The file_id or a file like object with the image, None if the version is
+                not cached anymore, and whether the caller is uploading it.
+        """
+
+        with self.lock:
+            file_id = self.file_ids.get(version)
+            upload = None if uploading else self.uploads.get(version)
+            if file_id is None and upload is None:
+                self.uploads.setdefault(version, threading.Event())
+
+        if file_id is None and upload is not None:
+            upload.wait(wait)
+            with self.lock:
+                file_id = self.file_ids.get(version)
+                if file_id is None:
+                    self.logger.info('Upload of chart %s not done after %d seconds, uploading it again', version, wait)
+                    self.uploads[version] = threading.Event()
+
+        if file_id is not None:
+            return file_id, False
+
+        image = self.get_image(version)
+        return (io.BytesIO(image) if image is not None else None), True
+
+
+    def _remember_image(self, version, image):
+        self.images[version] = image
+        self.images.move_to_end(version)
+
+        while len(self.images) > self.max_images:
+            self.images.popitem(last=False)
+
+
+    def _evict(self):
+        evicted = set()
+
+        while len(self.files) > self.max_files:
+            version, chart_file = self.files.popitem(last=False)
+            evicted.add(version)
+            self.images.pop(version, None)
+            self.file_ids.pop(version, None)
+            upload = self.uploads.pop(version, None)
+            if upload is not None:
+                upload.set()
+            try:
+                os.remove(chart_file)
+            except OSError:
+                self.logger.debug('Chart file %s was already removed', chart_file)
+
+        # Market pairs nobody charted for a while are forgotten with their last version
+        if evicted:
+            self.latest = {key: version for key, version in self.latest.items() if version not in evicted}
+
+
+class ChartPool():
+    """Renders charts in a pool of worker processes, so analysis never waits for matplotlib.
+    """
+
+    def __init__(self, workers=None, chart_cache=None):
+        """Initializes ChartPool class
+
+        The worker processes are started right away, so they are forked before the bot threads
+        exist and each one has its renderer and Agg backend loaded before the first chart.
+
+        Args:
+            workers (int, optional): Defaults to the number of CPUs. Amount of worker processes,
+                0 renders in the calling thread.
+            chart_cache (ChartCache, optional): Where the chart files are kept. Defaults to a new
+                ChartCache in ./charts.
+        """
+
+        self.logger = structlog.get_logger()
+        self.chart_cache = chart_cache or ChartCache()
+        self.in_flight = dict()
+        self.lock = threading.Lock()
+
+        if workers == 0:
+            self.workers = 0
+            self.executor = None
+            return
+
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+        warm_up = [self.executor.submit(_load_renderer) for _ in range(self.workers)]
+        for future in concurrent.futures.as_completed(warm_up):
+            if future.exception() is not None:
+                self.logger.info('Error loading the chart renderer: %s', future.exception())
+
+
+    def create_job(self, exchange, market_pair, candle_period, candles, fibonacci_levels,
+                   creation_date, profile=DEFAULT_PROFILE, series=None):
+        """Packs everything a worker needs to render a chart.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            candles (list): A matrix of historical OHCLV data.
+            fibonacci_levels (dict): The fibonacci levels of the market pair.
+            creation_date (str): Date shown in the chart title, the one of the last candle as
+                returned by get_candles_date, so cached charts never show a wrong date.
+            profile (dict, optional): Defaults to the full size chart. The chart profile, as
+                returned by get_chart_profiles.
+            series (dict, optional): Indicator series already computed by the analysis, as
+                returned by get_chart_series. Missing series are computed by the worker.
+
+        Returns:
+            dict: The chart job.
+        """
+
+        job = {
+            'exchange': exchange,
+            'market_pair': market_pair,
+            'candle_period': candle_period,
+            'candles': np.asarray(candles, dtype=np.float64),
+            'fibonacci_levels': dict(fibonacci_levels),
+            'creation_date': creation_date,
+            'profile': profile,
+            'series': series or dict()
+        }
+
+        job['version'] = self.chart_cache.get_version(job)
+        job['chart_file'] = self.chart_cache.get_path(exchange, market_pair, candle_period, job['version'],
+                                                      profile['format'])
+
+        return job
+
+
+    def submit(self, job):
+        """Queues a chart job without waiting for it.
+
+        Nothing is rendered when the same version is already cached, and a job for a version
+        being rendered right now shares the pending render. Until the render is done,
+        ChartCache.wait_latest waits for it.
+
+        Args:
+            job (dict): The chart job.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the chart version once it is cached.
+        """
+
+        with self.lock:
+            if job['version'] in self.in_flight:
+                return self.in_flight[job['version']]
+
+            done = concurrent.futures.Future()
+
+            if self.chart_cache.contains(job['version']):
+                self.logger.debug('Chart %s is unchanged, skipping render', job['chart_file'])
+                self.chart_cache.set_latest(job['exchange'], job['market_pair'], job['candle_period'], job['version'],
+                                            job['profile']['name'])
+                done.set_result(job['version'])
+                return done
+
+            self.in_flight[job['version']] = done
+
+        # Senders of this chart wait for the render instead of sending the previous version
+        self.chart_cache.set_render(job['exchange'], job['market_pair'], job['candle_period'], job['profile']['name'],
+                                    done)
+
+        if self.executor is None:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(_render_job(job))
+            except Exception as exc:
+                future.set_exception(exc)
+        else:
+            future = self.executor.submit(_render_job, job)
+
+        future.add_done_callback(lambda rendered: self._on_rendered(rendered, job, done))
+        return done
+
+
+    def shutdown(self):
+        """Waits for queued charts and stops the worker processes."""
+
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+
+    def _on_rendered(self, future, job, done):
+        try:
+            image = future.result()
+            self.logger.info(
+                'Rendered chart %s with profile %s, %d bytes',
+                job['chart_file'], job['profile']['name'], len(image)
+            )
+            self.chart_cache.store(job, image)
+            done.set_result(job['version'])
+        except Exception as exc:
+            self.logger.info(
+                'Error creating chart for %s %s %s: %s',
+                job['exchange'], job['market_pair'], job['candle_period'], exc
+            )
+            done.set_exception(exc)
+        finally:
+            with self.lock:
+                self.in_flight.pop(job['version'], None)
+
+
+class ChartService():
+    """Renders charts on demand from the cached candles, i.e. for the /chart command.
+    """
+
+    def __init__(self, chart_pool, timezone_name='UTC', timeout=60):
+        """Initializes ChartService class
+
+        Args:
+            chart_pool (ChartPool): The pool rendering the charts.
+            timezone_name (str, optional): Defaults to UTC. Timezone of the chart title date.
+            timeout (int, optional): Defaults to 60. Seconds to wait for a render.
+        """
+
+        self.logger = structlog.get_logger()
+        self.chart_pool = chart_pool
+        self.timezone_name = timezone_name
+        self.timeout = timeout
+
+
+    def get_chart(self, exchange, market_pair, candle_period, candles, fibonacci_levels,
+                  profile=DEFAULT_PROFILE):
+        """Makes sure the chart of the given candles is cached, rendering it if needed.
+
+        Concurrent requests for the same chart wait on a single render.
+
+        Args:
+            exchange (str): The exchange of the chart.
+            market_pair (str): The market pair of the chart.
+            candle_period (str): The candle period of the chart.
+            candles (list): A matrix of historical OHCLV data.
+            fibonacci_levels (dict): The fibonacci levels of the market pair.
+            profile (dict, optional): Defaults to the full size chart. The chart profile.
+
+        Returns:
+            str: The chart version, None if it couldn't be rendered.
+        """
+
+        job = self.chart_pool.create_job(exchange, market_pair, candle_period, candles, fibonacci_levels,
+                                         get_candles_date(candles, self.timezone_name), profile)
+
+        try:
+            return self.chart_pool.submit(job).result(timeout=self.timeout)
+        except Exception as exc:
+            self.logger.info('Error creating chart for %s %s %s: %s', exchange, market_pair, candle_period, exc)
+            return None
+
+
+class ChartRenderer(IndicatorUtils):
+    """Draws the chart panels of a profile: candles with MAs, RSI, OBV and MACD.
+
+    The figure, axes, labels, locators and formatters are built once when the renderer is
+    created. Each render only updates the data of the existing artists, the axis limits and
+    the title. The pyplot state machine is never used, so every renderer is independent.
+    """
+
+    def __init__(self, width=10, height=16, panels=PANELS):
+        """Initializes ChartRenderer class and builds its figure template
+
+        Args:
+            width (float, optional): Defaults to 10. Width of the figure in inches.
+            height (float, optional): Defaults to 16. Height of the figure in inches.
+            panels (tuple, optional): Defaults to every panel. The panels drawn, top to bottom.
+        """
+
+        super().__init__()
+        self.lock = threading.Lock()
+        self.panels = [panel for panel in PANELS if panel in panels]
+        self.strategy_analyzer = StrategyAnalyzer()
+        self.dispatchers = {
+            'indicators': self.strategy_analyzer.indicator_dispatcher(),
+            'informants': self.strategy_analyzer.informant_dispatcher()
+        }
+        self._build_template(width, height)
+
+
+    def _build_template(self, width, height):
+        textsize = 11
+        axescolor = '#f6f6f6'  # the axes background color
+        grid = dict(color='#b0b0b0', linestyle='-', linewidth=0.2, alpha=0.6)
+
+        self.fig = Figure(facecolor='white', figsize=(width, height))
+        FigureCanvasAgg(self.fig)
+
+        # Margins are fixed in inches, panels share the rest by their relative heights
+        left = 1.0 / width
+        bottom = 1.6 / height
+        top = 1 - 0.8 / height
+        unit_height = (top - bottom) / sum(PANEL_HEIGHTS[panel] for panel in self.panels)
+
+        self.axes = dict()
+        shared_axis = None
+        for panel in self.panels:
+            panel_height = unit_height * PANEL_HEIGHTS[panel]
+            top -= panel_height
+
+            ax = self.fig.add_axes([left, top, 1 - 2 * left, panel_height], facecolor=axescolor,
+                                   sharex=shared_axis)  # left, bottom, width, height
+            ax.grid(True, **grid)
+            ax.set_autoscale_on(False)
+            ax.xaxis.set_major_locator(mticker.MaxNLocator(10))
+            ax.xaxis.set_major_formatter(DateFormatter('%d/%b'))
+            ax.xaxis.set_tick_params(which='major', pad=15)
+            ax.tick_params(axis='x', labelbottom=panel == self.panels[-1])
+
+            self.axes[panel] = ax
+            shared_axis = shared_axis or ax
+
+            getattr(self, '_build_{}'.format(panel))(ax, textsize, width - 2)
+
+        self.title = self.fig.suptitle('', fontsize=14)
+
+
+    def _build_candles(self, ax, textsize, axes_width):
+        #Candles with MA (7) and MA (25) and the fibonacci levels behind them
+        price_transform = blended_transform_factory(ax.transAxes, ax.transData)
+        self.fib_spans = PolyCollection(
+            [], transform=price_transform
+        )
+        self.fib_line = Line2D([0, 1], [0, 0], color='steelblue', linestyle='-', alpha=0.3,
+                               transform=price_transform)
+        ax.add_collection(self.fib_spans)
+        ax.add_line(self.fib_line)
+
+        self.wicks = LineCollection([], linewidths=0.5, antialiaseds=False)
+        self.bodies = PolyCollection([], edgecolors='none', antialiaseds=False)
+        ax.add_collection(self.wicks)
+        ax.add_collection(self.bodies)
+
+        self.ma25_line, = ax.plot([], [], color='indigo', lw=0.6, label='MA (25)')
+        self.ma7_line, = ax.plot([], [], color='orange', lw=0.6, label='MA (7)')
+        ax.ticklabel_format(axis='y', style='plain')
+        ax.text(0.04, 0.94, 'MA (7, close, 0)', color='orange', transform=ax.transAxes, fontsize=textsize, va='top')
+        ax.text(0.04 + 1.6 / axes_width, 0.94, 'MA (25, close, 0)', color='indigo', transform=ax.transAxes,  fontsize=textsize, va='top')
+
+
+    def _build_rsi(self, ax, textsize, axes_width):
+        fillcolor = 'darkmagenta'
+
+        self.rsi_line, = ax.plot([], [], color=fillcolor, linewidth=0.5)
+        self.rsi_fill = PolyCollection([], facecolors=fillcolor, edgecolors=fillcolor)
+        ax.add_collection(self.rsi_fill)
+        ax.axhline(70, color='darkmagenta', linestyle='dashed', alpha=0.6)
+        ax.axhline(30, color='darkmagenta', linestyle='dashed', alpha=0.6)
+        ax.set_ylim(0, 100)
+        ax.set_yticks([30, 70])
+        ax.text(0.024, 0.94, 'RSI (14)', va='top',transform=ax.transAxes, fontsize=textsize)
+
+
+    def _build_obv(self, ax, textsize, axes_width):
+        self.obv_line, = ax.plot([], [], color='blue', lw=0.6)
+        ax.yaxis.set_major_locator(mticker.MaxNLocator(nbins=5, prune='upper'))
+        ax.text(0.024, 0.94, 'OBV', va='top', transform=ax.transAxes, fontsize=textsize)
+
+
+    def _build_macd(self, ax, textsize, axes_width):
+        self.macd_bars = PolyCollection([], facecolors='red', edgecolors='none', alpha=0.4)
+        ax.add_collection(self.macd_bars)
+        self.macd_line, = ax.plot([], [], color='blue', lw=0.6)
+        self.macds_line, = ax.plot([], [], color='red', lw=0.6)
+        ax.yaxis.set_major_locator(mticker.MaxNLocator(nbins=5, prune='upper'))
+        ax.text(0.024, 0.94, 'MACD (12, 26, close, 9)', va='top', transform=ax.transAxes, fontsize=textsize)
+
+
+    def render(self, job):
+        """Renders a chart job into an image in memory, encoded as its profile says.
+
+        The indicator series of the job are drawn as they are, missing ones are computed over
+        all the candles of the job. Only the last `lookback` candles of the profile are shown.
+
+        Args:
+            job (dict): A chart job as created by ChartPool.create_job.
+
+        Returns:
+            bytes: The encoded image.
+        """
+
+        profile = job['profile']
+        shown = slice(-profile['lookback'], None) if profile['lookback'] else slice(None)
+
+        with self.lock:
+            df = self.convert_to_dataframe(job['candles'])
+            _time = mdates.date2num(df.index.to_pydatetime())
+            series = self.get_series(job)
+
+            if 'candles' in self.axes:
+                self.update_candlestick(df, _time, job['fibonacci_levels'], series, shown)
+            if 'rsi' in self.axes:
+                self.update_rsi(_time, series, shown)
+            if 'obv' in self.axes:
+                self.update_obv(_time, series, shown)
+            if 'macd' in self.axes:
+                self.update_macd(_time, series, shown)
+
+            # Same margin autoscaling gave with the default xmargin
+            _time = _time[shown]
+            min_x = np.nanmin(_time)
+            max_x = np.nanmax(_time)
+            stick_width = (max_x - min_x) / _time.size
+            margin_x = (max_x - min_x + stick_width) * 0.05
+            self.axes[self.panels[0]].set_xlim(min_x - stick_width / 2 - margin_x, max_x + stick_width / 2 + margin_x)
+
+            for label in self.axes[self.panels[-1]].get_xticklabels():
+                label.set_rotation(30)
+                label.set_horizontalalignment('right')
+
+            title = '{} {} {} - {}'.format(
+                job['exchange'], job['market_pair'], job['candle_period'], job['creation_date']
+            ).upper()
+            self.title.set_text(title)
+
+            return self.encode(profile)
+
+
+    def get_series(self, job):
+        """Returns the series of every panel, computing the ones missing in the job.
+
+        Series sharing an analysis, like the MACD lines, are computed together.
+        """
+
+        series = dict(job['series'])
+        results = dict()
+
+        for panel in self.panels:
+            for name in PANEL_SERIES[panel]:
+                if name in series:
+                    continue
+
+                analyzer_type, analyzer, arguments, column = CHART_SERIES[name]
+                key = (analyzer_type, analyzer, repr(sorted(arguments.items())))
+                if key not in results:
+                    results[key] = self.dispatchers[analyzer_type][analyzer](
+                        historical_data=job['candles'], **arguments
+                    )
+
+                series.update(get_chart_series(
+                    {analyzer_type: {analyzer: [{
+                        'result': results[key],
+                        'config': {'candle_period': job['candle_period'], **arguments}
+                    }]}},
+                    job['candle_period'],
+                    len(job['candles'])
+                ))
+
+        return series
+
+
+    def encode(self, profile):
+        """Encodes the current figure with the format, dpi, palette and quality of a profile."""
+
+        image = io.BytesIO()
+
+        if profile['format'] == 'png' and not profile['colors']:
+            self.fig.savefig(image, format='png', dpi=profile['dpi'])
+            return image.getvalue()
+
+        self.fig.set_dpi(profile['dpi'])
+        self.fig.canvas.draw()
+        picture = Image.frombuffer('RGBA', self.fig.canvas.get_width_height(),
+                                   self.fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).convert('RGB')
+
+        if profile['format'] == 'png':
+            picture.quantize(colors=profile['colors']).save(image, format='PNG', optimize=True)
+        elif profile['format'] == 'jpeg':
+            picture.save(image, format='JPEG', quality=profile['quality'], optimize=True)
+        else:
+            picture.save(image, format='WEBP', quality=profile['quality'])
+
+        return image.getvalue()
+
+    def candlestick_ohlc(self, time, open, high, low, close, width=0.2, colorup='k',
+                         colordown='r'):
+        """
+        Set the time, open, high, low, close as a vertical line ranging
+        from low to high.  Use a rectangular bar to represent the
+        open-close span.  If close >= open, use colorup to color the bar,
+        otherwise use colordown
+
+        All wicks are drawn by a single LineCollection and all bodies by a
+        single PolyCollection, their data is replaced from numpy arrays.
+
+        Parameters
+        ----------
+        time, open, high, low, close : array like
+            data to plot.  time must be in float date format - see date2num
+        width : float
+            fraction of a day for the rectangle width
+        colorup : color
+            the color of the rectangle where close >= open
+        colordown : color
+            the color of the rectangle where close <  open
+
+        """
+
+        time = np.asarray(time, dtype=float)
+        open = np.asarray(open, dtype=float)
+        high = np.asarray(high, dtype=float)
+        low = np.asarray(low, dtype=float)
+        close = np.asarray(close, dtype=float)
+
+        offset = width / 2.0
+        colors = np.where(close >= open, colorup, colordown)
+        lower = np.minimum(open, close)
+        upper = np.maximum(open, close)
+
+        # segments with shape (candles, 2 points, xy)
+        wick_segments = np.stack([
+            np.column_stack([time, low]),
+            np.column_stack([time, high])
+        ], axis=1)
+
+        # rectangles with shape (candles, 4 corners, xy)
+        body_vertices = np.stack([
+            np.column_stack([time - offset, lower]),
+            np.column_stack([time - offset, upper]),
+            np.column_stack([time + offset, upper]),
+            np.column_stack([time + offset, lower])
+        ], axis=1)
+
+        self.wicks.set_segments(wick_segments)
+        self.wicks.set_color(colors)
+        self.bodies.set_verts(body_vertices)
+        self.bodies.set_facecolor(colors)
+
+    def update_candlestick(self, df, _time, fibonacci_levels, series, shown=slice(None)):
+        ma25 = series['ma25'][shown]
+        ma7 = series['ma7'][shown]
+
+        df = df[shown]
+        _time = _time[shown]
+
+        min_x = np.nanmin(_time)
+        max_x = np.nanmax(_time)
+
+        stick_width = ((max_x - min_x) / _time.size ) 
+
+        self.candlestick_ohlc(_time, df['open'].values, df['high'].values, df['low'].values,
+                              df['close'].values, width=stick_width, colorup='olivedrab',
+                              colordown='crimson')
+
+        self.ma25_line.set_data(_time, ma25)
+        self.ma7_line.set_data(_time, ma7)
+
+        min_y = np.nanmin(df['low'].values)
+        max_y = np.nanmax(df['high'].values)
+
+        if fibonacci_levels['0.00'] > 0 and fibonacci_levels['0.00'] > fibonacci_levels['100.00']:
+            levels = ['0.00', '23.60', '38.20', '50.00', '61.80', '78.60', '100.00']
+            spans = list()
+            for top, bottom in zip(levels[:-1], levels[1:]):
+                top, bottom = fibonacci_levels[top], fibonacci_levels[bottom]
+                spans.append([(0, bottom), (0, top), (1, top), (1, bottom)])
+
+            self.fib_spans.set_verts(spans)
+            colors = [to_rgba('steelblue', alpha) for alpha in (0.2, 0.3, 0.2, 0.3, 0.2, 0.3)]
+            self.fib_spans.set_facecolor(colors)
+            self.fib_spans.set_edgecolor(colors)
+            self.fib_line.set_ydata([fibonacci_levels['0.00'], fibonacci_levels['0.00']])
+            self.fib_line.set_visible(True)
+
+            min_y = min(min_y, fibonacci_levels['100.00'])
+            max_y = max(max_y, fibonacci_levels['0.00'])
+        else:
+            self.fib_spans.set_verts([])
+            self.fib_line.set_visible(False)
+
+        # Same margin autoscaling gave with set_ymargin(0.2)
+        margin_y = (max_y - min_y) * 0.2
+        self.axes['candles'].set_ylim(min_y - margin_y, max_y + margin_y)
+
+    def update_rsi(self, _time, series, shown=slice(None)):
+        rsi = series['rsi'][shown]
+        _time = _time[shown]
+
+        self.rsi_line.set_data(_time, rsi)
+        with np.errstate(invalid='ignore'):
+            self.rsi_fill.set_verts(
+                self._fill_regions(_time, rsi, 70, rsi >= 70) + self._fill_regions(_time, rsi, 30, rsi <= 30)
+            )
+
+    def update_macd(self, _time, series, shown=slice(None)):
+        macd = series['macd'][shown]
+        macds = series['macdsignal'][shown]
+        _time = _time[shown]
+
+        min_y = np.nanmin(macd) if np.isfinite(macd).any() else 0
+        max_y = np.nanmax(macd) if np.isfinite(macd).any() else 0
+
+        #Histogram is macd - signal, half of what stockstats used to give
+        macd_h = np.nan_to_num(series['macdhist'][shown])
+
+        if (macd_h.min() < min_y):
+            min_y = macd_h.min()
+
+        if (macd_h.max() > max_y):
+            max_y = macd_h.max() 
+
+        #Adding some extra space at bottom/top
+        min_y, max_y = self._extend_limits(min_y, max_y)
+
+        #Define candle bar width
+        min_x = np.nanmin(_time)
+        max_x = np.nanmax(_time)
+
+        bar_width = ((max_x - min_x) / _time.size ) * 0.8            
+
+        # bars with shape (candles, 4 corners, xy) going from 0 to the histogram value
+        zeros = np.zeros_like(macd_h)
+        self.macd_bars.set_verts(np.stack([
+            np.column_stack([_time - bar_width / 2, zeros]),
+            np.column_stack([_time - bar_width / 2, macd_h]),
+            np.column_stack([_time + bar_width / 2, macd_h]),
+            np.column_stack([_time + bar_width / 2, zeros])
+        ], axis=1))
+
+        self.macd_line.set_data(_time, macd)
+        self.macds_line.set_data(_time, macds)
+        self.axes['macd'].set_ylim((min_y, max_y))
+
+    def update_obv(self, _time, series, shown=slice(None)):
+        
+        obv = series['obv'][shown]
+
+        min_y = np.nanmin(obv) if np.isfinite(obv).any() else np.nan
+        max_y = np.nanmax(obv) if np.isfinite(obv).any() else np.nan
+
+        #Adding some extra space at bottom/top
+        min_y, max_y = self._extend_limits(min_y, max_y)
+      
+        self.obv_line.set_data(_time[shown], obv)
+        
+        self.axes['obv'].set_ylim((min_y, max_y))
+
+    def _extend_limits(self, min_y, max_y):
+        """Axis limits 20% away from zero, or around the values when they are all the same."""
+
+        if not np.isfinite([min_y, max_y]).all():
+            return -1, 1
+
+        if min_y == max_y:
+            return min_y - 1, max_y + 1
+
+        return min_y * 1.2, max_y * 1.2
+
+    def _fill_regions(self, x, y, level, where):
+        """Polygons between y and a horizontal level for each run of consecutive True values."""
+
+        polygons = list()
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], where.astype(int), [0]])))
+
+        for start, end in zip(edges[::2], edges[1::2]):
+            run_x = x[start:end]
+            run_y = y[start:end]
+            polygons.append(np.concatenate([
+                np.column_stack([run_x, run_y]),
+                np.column_stack([run_x[::-1], np.full(len(run_x), level)])
+            ]))
+
+        return polygons
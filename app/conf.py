@@ -60,3 +60,108 @@ class Configuration():
                         'enabled': False
                     }
                 }
+
+
+class ConfigOverlay():
+    """The settings a user changed, on top of the configuration shared by all users.
+
+    Only the changed values are kept, every other setting is read from the shared
+    configuration, which is never modified. Changed values are replaced, never modified in
+    place, so a value returned by get can be shared safely.
+    """
+
+    def __init__(self, base, overrides=None):
+        """Initializes ConfigOverlay class
+
+        Args:
+            base (Configuration): The shared configuration.
+            overrides (dict, optional): The settings changed by the user, setting -> value.
+        """
+
+        self.base = base
+        self.overrides = dict(overrides or dict())
+        self.listeners = list()
+
+
+    def add_listener(self, listener):
+        """Registers a function called as listener(key, value) after a setting changes.
+
+        The value is None when the setting is back to its shared value.
+        """
+
+        self.listeners.append(listener)
+
+
+    def get(self, key, default=None):
+        """Returns the value of a setting for the user, its own or the shared one."""
+
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.base.settings.get(key, default)
+
+
+    def set(self, key, value, default=None):
+        """Changes a setting for the user, dropping it when it equals the shared value.
+
+        Args:
+            key (str): The setting.
+            value (object): The new value, not modified afterwards.
+            default (object, optional): The value of a setting missing in the shared
+                configuration.
+        """
+
+        if value == self.base.settings.get(key, default):
+            if key not in self.overrides:
+                return
+            del self.overrides[key]
+            value = None
+        elif key in self.overrides and self.overrides[key] == value:
+            return
+        else:
+            self.overrides[key] = value
+
+        for listener in self.listeners:
+            listener(key, value)
+
+
+    def get_indicators(self):
+        """Returns the candle periods enabled for each indicator.
+
+        Returns:
+            dict: A dictionary indicator -> list of candle periods.
+        """
+
+        periods = self.get('indicators', dict())
+
+        indicators = dict()
+        for indicator, confs in self.base.indicators.items():
+            enabled = periods.get(indicator, dict())
+            indicators[indicator] = [
+                conf['candle_period'] for conf in confs if enabled.get(conf['candle_period'], conf['enabled'])
+            ]
+
+        return indicators
+
+
+    def set_indicator(self, indicator, candle_period, enabled):
+        """Enables or disables a candle period of an indicator for the user.
+
+        Raises:
+            KeyError: The indicator is not configured.
+        """
+
+        indicators = {name: dict(periods) for name, periods in self.get('indicators', dict()).items()}
+        periods = indicators.setdefault(indicator, dict())
+
+        for conf in self.base.indicators[indicator]:
+            if conf['candle_period'] != candle_period:
+                continue
+            if conf['enabled'] == enabled:
+                periods.pop(candle_period, None)
+            else:
+                periods[candle_period] = enabled
+
+        if not periods:
+            del indicators[indicator]
+
+        self.set('indicators', indicators, dict())
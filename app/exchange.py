@@ -1,6 +1,7 @@
 """Interface for performing queries against exchange API's
 """
 
+import heapq
 import re
 import sys
 import time
@@ -150,5 +151,87 @@ class ExchangeInterface():
 
         return exchange_markets
     
+    @retry(retry=retry_if_exception_type(ccxt.NetworkError), stop=stop_after_attempt(3))
+    def get_top_markets(self, exchanges=[], rank_by='quoteVolume', top_n=50, min_quote_volume=0,
+                        quote_currencies=None):
+        """Screen all symbol pairs of the exchanges using a single bulk ticker request.
+
+        Args:
+            exchanges (list, optional): A list of exchanges to screen. Default is all enabled
+                exchanges.
+            rank_by (str, optional): Defaults to quoteVolume. Rank pairs by `quoteVolume` or by the
+                absolute 24h `percentage` change.
+            top_n (int, optional): Defaults to 50. How many pairs to keep per exchange.
+            min_quote_volume (float, optional): Defaults to 0. Pairs with a lower 24h quote volume
+                are discarded before ranking.
+            quote_currencies (list, optional): Only keep pairs quoted in these currencies.
+
+        Decorators:
+            retry
+
+        Returns:
+            dict: A dictionary containing market data for the selected symbol pairs.
+        """
+
+        if not exchanges:
+            exchanges = self.exchanges
+
+        exchange_markets = dict()
+        for exchange in exchanges:
+            curr_markets = self.exchanges[exchange].load_markets()
+
+            if not self.exchanges[exchange].has.get('fetchTickers'):
+                self.logger.info('%s does not support bulk tickers, screening all markets.', exchange)
+                exchange_markets[exchange] = curr_markets
+                continue
+
+            tickers = self.exchanges[exchange].fetch_tickers()
+
+            candidates = list()
+            for symbol, ticker in tickers.items():
+                if symbol not in curr_markets or curr_markets[symbol].get('active') is False:
+                    continue
+
+                if quote_currencies and curr_markets[symbol]['quote'] not in quote_currencies:
+                    continue
+
+                quote_volume = self._get_quote_volume(ticker)
+                if quote_volume < min_quote_volume:
+                    continue
+
+                if rank_by == 'percentage':
+                    score = abs(ticker.get('percentage') or 0)
+                else:
+                    score = quote_volume
+
+                candidates.append((score, symbol))
+
+            top_markets = heapq.nlargest(top_n, candidates)
+            exchange_markets[exchange] = { symbol: curr_markets[symbol] for _, symbol in top_markets }
+
+            self.logger.info('Screened %d of %d markets on %s', len(top_markets), len(tickers), exchange)
+
+            time.sleep(self.exchanges[exchange].rateLimit / 1000)
+
+        return exchange_markets
+
+    def _get_quote_volume(self, ticker):
+        """Get the 24h quote volume of a ticker, estimated from the base volume if missing.
+
+        Args:
+            ticker (dict): A ccxt ticker structure.
+
+        Returns:
+            float: The 24h quote volume.
+        """
+
+        if ticker.get('quoteVolume'):
+            return ticker['quoteVolume']
+
+        if ticker.get('baseVolume') and ticker.get('last'):
+            return ticker['baseVolume'] * ticker['last']
+
+        return 0
+
     def get_default_exchanges(self):
         return self.exchanges
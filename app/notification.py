@@ -1,11 +1,11 @@
 """Handles sending notifications via the configured notifiers
 """
 
-import os
 import structlog
 
+from collections import OrderedDict
+
 from telegram.error import TimedOut as TelegramTimedOut
-from jinja2 import Template
 
 from notifiers.twilio_client import TwilioNotifier
 from notifiers.slack_client import SlackNotifier
@@ -14,24 +14,31 @@ from notifiers.gmail_client import GmailNotifier
 from notifiers.telegram_client import TelegramNotifier
 from notifiers.webhook_client import WebhookNotifier
 from notifiers.stdout_client import StdoutNotifier
+from notifiers.transport import BatchSender
+from templates import template_registry
 
 class Notifier():
     """Handles sending notifications via the configured notifiers
     """
 
-    def __init__(self, notifier_config, market_data, enable_charts): #, user_id):
+    def __init__(self, notifier_config, market_data, enable_charts, chart_cache=None,
+                 chart_profile='full'): #, user_id):
         """Initializes Notifier class
 
         Args:
             notifier_config (dict): A dictionary containing configuration for the notifications.
+            chart_cache (ChartCache, optional): Where to find the latest chart files.
+            chart_profile (str, optional): Defaults to full. Name of the chart profile sent.
         """
 
         self.logger = structlog.get_logger()
         self.notifier_config = notifier_config
         self.market_data = market_data
         self.enable_charts = enable_charts
+        self.chart_cache = chart_cache
+        self.chart_profile = chart_profile
+        self.digest = None
         #self.user_id = user_id
-        self.last_analysis = dict()
 
         enabled_notifiers = list()
         self.logger = structlog.get_logger()
@@ -41,8 +48,10 @@ class Notifier():
                 twilio_key=notifier_config['twilio']['required']['key'],
                 twilio_secret=notifier_config['twilio']['required']['secret'],
                 twilio_sender_number=notifier_config['twilio']['required']['sender_number'],
-                twilio_receiver_number=notifier_config['twilio']['required']['receiver_number']
+                twilio_receiver_number=notifier_config['twilio']['required']['receiver_number'],
+                max_concurrency=notifier_config['twilio']['optional'].get('max_concurrency', 4)
             )
+            self.twilio_sender = self._create_sender('twilio', self.twilio_client.notify)
             enabled_notifiers.append('twilio')
 
         self.discord_configured = self._validate_required_config('discord', notifier_config)
@@ -52,6 +61,7 @@ class Notifier():
                 username=notifier_config['discord']['required']['username'],
                 avatar=notifier_config['discord']['optional']['avatar']
             )
+            self.discord_sender = self._create_sender('discord', self.discord_client.notify)
             enabled_notifiers.append('discord')
 
         self.slack_configured = self._validate_required_config('slack', notifier_config)
@@ -59,6 +69,7 @@ class Notifier():
             self.slack_client = SlackNotifier(
                 slack_webhook=notifier_config['slack']['required']['webhook']
             )
+            self.slack_sender = self._create_sender('slack', self.slack_client.notify)
             enabled_notifiers.append('slack')
 
         self.gmail_configured = self._validate_required_config('gmail', notifier_config)
@@ -66,8 +77,11 @@ class Notifier():
             self.gmail_client = GmailNotifier(
                 username=notifier_config['gmail']['required']['username'],
                 password=notifier_config['gmail']['required']['password'],
-                destination_addresses=notifier_config['gmail']['required']['destination_emails']
+                destination_addresses=notifier_config['gmail']['required']['destination_emails'],
+                smtp_server=notifier_config['gmail']['optional'].get('smtp_server', 'smtp.gmail.com:587'),
+                starttls=notifier_config['gmail']['optional'].get('starttls', True)
             )
+            self.gmail_sender = self._create_sender('gmail', self.gmail_client.notify)
             enabled_notifiers.append('gmail')
 
         self.telegram_configured = self._validate_required_config('telegram', notifier_config)
@@ -85,7 +99,19 @@ class Notifier():
             self.webhook_client = WebhookNotifier(
                 url=notifier_config['webhook']['required']['url'],
                 username=notifier_config['webhook']['optional']['username'],
-                password=notifier_config['webhook']['optional']['password']
+                password=notifier_config['webhook']['optional']['password'],
+                compress=notifier_config['webhook']['optional'].get('gzip', False),
+                batch_size=notifier_config['webhook']['optional'].get('batch_size', 1000)
+            )
+            # Alerts of each update, or only the signals changed since the last post
+            self.webhook_mode = notifier_config['webhook']['optional'].get('mode', 'alerts')
+            if self.webhook_mode == 'signals':
+                webhook_send = self.webhook_client.notify_signals
+            else:
+                webhook_send = self.webhook_client.notify
+            # Batches of records are merged into a single list
+            self.webhook_sender = self._create_sender(
+                'webhook', webhook_send, join=lambda batches: [record for batch in batches for record in batch]
             )
             enabled_notifiers.append('webhook')
 
@@ -95,85 +121,116 @@ class Notifier():
             enabled_notifiers.append('stdout')
 
         self.logger.info('enabled notifers: %s', enabled_notifiers)
+        self.enabled_notifiers = enabled_notifiers
+
+
+    def start_digest(self):
+        """Collect the telegram messages to the user chat until flush_digest is called."""
+
+        self.digest = {'sections': OrderedDict(), 'charts': list()}
+
+
+    def flush_digest(self):
+        """Send the collected telegram messages as a digest.
+
+        Charts go first, as media groups of up to 10 charts. Messages are grouped by exchange,
+        market pair and candle period and packed into as few 4096 character messages as
+        possible.
+        """
+
+        digest, self.digest = self.digest, None
+        if digest is None or not self.telegram_configured:
+            return
+
+        if digest['charts']:
+            try:
+                self._send_chart_group(digest['charts'])
+            except (IOError, SyntaxError) :
+                self.logger.info('Error sending charts digest')
+
+        sections = list()
+        for key, lines in digest['sections'].items():
+            if key is None:
+                sections.append('\n'.join(lines))
+            else:
+                exchange, market_pair, candle_period = key
+                sections.append('\n'.join(['{} {} {}'.format(exchange.title(), market_pair, candle_period)] + lines))
+
+        for message in self.telegram_client.pack_sections(sections, max_message_size=4096):
+            self.notify_telegram_message(message, None)
 
     
-    def notify_all(self, new_analysis, user_indicators):
-        """Trigger a notification for all notification options.
+    def notify_all(self, alerts):
+        """Trigger a notification for all notification options but telegram.
+
+        The alerts are computed once per update, every enabled notifier renders them with its
+        own template and hands the message to its sender, so all of them are sent at the same
+        time without waiting. Telegram users receive their alerts from the results snapshot.
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts of the update.
         """
 
-        self.notify_slack(new_analysis)
-        self.notify_discord(new_analysis)
-        self.notify_twilio(new_analysis)
-        self.notify_gmail(new_analysis)
-        self.notify_telegram(new_analysis, user_indicators)
-        self.notify_webhook(new_analysis)
-        self.notify_stdout(new_analysis)
+        if not alerts:
+            return
+
+        self.notify_slack(alerts)
+        self.notify_discord(alerts)
+        self.notify_twilio(alerts)
+        self.notify_gmail(alerts)
+        self.notify_webhook(alerts)
+        self.notify_stdout(alerts)
 
-    def notify_discord(self, new_analysis):
+    def notify_discord(self, alerts):
         """Send a notification via the discord notifier
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts to send.
         """
 
         if self.discord_configured:
-            message = self._indicator_message_templater(
-                new_analysis,
-                self.notifier_config['discord']['optional']['template']
-            )
+            message = self._render_alerts(alerts, self.notifier_config['discord']['optional']['template'])
             if message.strip():
-                self.discord_client.notify(message)
+                self.discord_sender.submit(message)
 
 
-    def notify_slack(self, new_analysis):
+    def notify_slack(self, alerts):
         """Send a notification via the slack notifier
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts to send.
         """
 
         if self.slack_configured:
-            message = self._indicator_message_templater(
-                new_analysis,
-                self.notifier_config['slack']['optional']['template']
-            )
+            message = self._render_alerts(alerts, self.notifier_config['slack']['optional']['template'])
             if message.strip():
-                self.slack_client.notify(message)
+                self.slack_sender.submit(message)
 
 
-    def notify_twilio(self, new_analysis):
+    def notify_twilio(self, alerts):
         """Send a notification via the twilio notifier
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts to send.
         """
 
         if self.twilio_configured:
-            message = self._indicator_message_templater(
-                new_analysis,
-                self.notifier_config['twilio']['optional']['template']
-            )
+            message = self._render_alerts(alerts, self.notifier_config['twilio']['optional']['template'])
             if message.strip():
-                self.twilio_client.notify(message)
+                self.twilio_sender.submit(message)
 
 
-    def notify_gmail(self, new_analysis):
+    def notify_gmail(self, alerts):
         """Send a notification via the gmail notifier
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts to send.
         """
 
         if self.gmail_configured:
-            message = self._indicator_message_templater(
-                new_analysis,
-                self.notifier_config['gmail']['optional']['template']
-            )
+            message = self._render_alerts(alerts, self.notifier_config['gmail']['optional']['template'])
             if message.strip():
-                self.gmail_client.notify(message)
+                self.gmail_sender.submit(message)
 
 
     def notify_telegram(self, messages, user_indicators):
@@ -193,81 +250,210 @@ class Notifier():
                         #continue
 
                     for candle_period in _messages:
-                        if not isinstance(_messages[candle_period], list) or len (_messages[candle_period]) == 0:
+                        if not isinstance(_messages[candle_period], (list, tuple)) or len (_messages[candle_period]) == 0:
                             continue
 
-                        market_pair = market_pair.replace('/', '_').lower()
-                        chart_file = './charts/{}_{}_{}.png'.format(exchange, market_pair, candle_period)
+                        if self.digest is not None:
+                            section = self.digest['sections'].setdefault((exchange, market_pair, candle_period), list())
+                            section.extend(message.strip() for message in _messages[candle_period])
+                            if self.enable_charts:
+                                self.digest['charts'].append((exchange, market_pair, candle_period))
+                            continue
 
-                        if os.path.exists(chart_file):
+                        if self.enable_charts:
+                            message = '{} {}'.format(market_pair.replace('/', '_').lower(), candle_period)
                             try:
-                                message = '{} {}'.format(market_pair, candle_period)
-                                self.telegram_client.send_chart(open(chart_file, 'rb'), message)
+                                self._send_chart(exchange, market_pair, candle_period, message, None)
                             except (IOError, SyntaxError) :
-                                self.logger.info('Error sending chart file %s', chart_file)
+                                self.logger.info('Error sending chart for %s %s', market_pair, candle_period)
 
                         for message in _messages[candle_period]:
                             self.notify_telegram_message(message.strip(), None)
                         
 
     def notify_telegram_message(self, message, chat_id):
+        if self.digest is not None and chat_id is None:
+            self.digest['sections'].setdefault(None, list()).append(message.strip())
+            return
+
         try:
             self.telegram_client.notify(message, chat_id)
         except (TelegramTimedOut) as e:
             self.logger.info('Error TimeOut!')
             self.logger.info(e)
 
-    def notify_telegram_chart(self, chat_id, exchange, market_pair, candle_period ):
+    def notify_telegram_chart(self, chat_id, exchange, market_pair, candle_period, chart_profile=None, version=None):
         try:
-            market = market_pair.replace('/', '_').lower()
-            chart_file = './charts/{}_{}_{}.png'.format(exchange, market, candle_period)
-
-            if os.path.exists(chart_file):
-                try:
-                    message = '{} {} on {}'.format(market_pair, candle_period, exchange.title())
-                    self.telegram_client.send_chart(open(chart_file, 'rb'), message, chat_id)
-                except (IOError, SyntaxError) :
-                    self.notify_telegram_message('Error sending chart image.', chat_id)
-            else:
-                self.logger.info('Chart file %s doesnt exist.', chart_file)            
+            message = '{} {} on {}'.format(market_pair, candle_period, exchange.title())
+            try:
+                sent = self._send_chart(exchange, market_pair, candle_period, message, chat_id, chart_profile, version)
+            except (IOError, SyntaxError) :
+                self.notify_telegram_message('Error sending chart image.', chat_id)
+                sent = True
+
+            if not sent:
+                self.logger.info('Chart for %s %s %s doesnt exist.', exchange, market_pair, candle_period)
 
         except (TelegramTimedOut) as e:
             self.logger.info('Error TimeOut!')
             self.logger.info(e)            
 
-    def notify_webhook(self, new_analysis):
+    def _send_chart(self, exchange, market_pair, candle_period, caption, chat_id, chart_profile=None,
+                    version=None):
+        """Send the latest chart of a market pair and candle period via telegram.
+
+        Unless a version is given, the chart is picked when the outbox sends it, once a render
+        of a newer version is done, so the analysis never waits for the charts of its alerts.
+        The image is uploaded from memory only once per chart version, later sends reuse the
+        Telegram file_id of that upload. The chart profile of the notifier is sent unless
+        another one is given.
+
+        Returns:
+            bool: False if there is no chart to send.
+        """
+
+        if self.chart_cache is None:
+            return False
+
+        chart = self._get_chart(exchange, market_pair, candle_period, chart_profile or self.chart_profile, version)
+        if chart is None:
+            return False
+
+        self.telegram_client.send_chart(self._photo_getter(chart), caption, chat_id, self._file_id_keeper([chart]))
+
+        return True
+
+    def _send_chart_group(self, charts):
+        """Send the latest charts of several market pairs and candle periods as media groups.
+
+        Args:
+            charts (list): A list of (exchange, market_pair, candle_period) tuples.
+        """
+
+        if self.chart_cache is None:
+            return
+
+        photos = list()
+        for exchange, market_pair, candle_period in charts:
+            chart = self._get_chart(exchange, market_pair, candle_period, self.chart_profile)
+            if chart is None:
+                continue
+
+            caption = '{} {} {}'.format(market_pair.replace('/', '_').lower(), candle_period, exchange)
+            photos.append((chart, self._photo_getter(chart), caption))
+
+        # Telegram media groups have from 2 to 10 items
+        for start in range(0, len(photos), 10):
+            group = photos[start:start + 10]
+
+            if len(group) == 1:
+                chart, photo, caption = group[0]
+                self.telegram_client.send_chart(photo, caption, None, self._file_id_keeper([chart]))
+                continue
+
+            self.telegram_client.send_chart_group(
+                [(photo, caption) for _, photo, caption in group],
+                None,
+                self._file_id_keeper([chart for chart, _, _ in group])
+            )
+
+    def _get_chart(self, exchange, market_pair, candle_period, chart_profile, version=None):
+        """Returns the chart sent by a delivery, its version is set when it is sent unless given.
+
+        Returns:
+            dict: The chart, None if there is no chart cached or being rendered.
+        """
+
+        if version is None and not self.chart_cache.has_chart(exchange, market_pair, candle_period, chart_profile):
+            return None
+
+        return {
+            'key': (exchange, market_pair, candle_period, chart_profile),
+            'version': version,
+            'latest': version is None,
+            'uploading': False
+        }
+
+    def _photo_getter(self, chart):
+        """Returns a function giving the file_id or the image of a chart when it is sent."""
+
+        def get_photo():
+            version = chart['version']
+            if chart['latest']:
+                version = self.chart_cache.wait_latest(*chart['key'])
+                if version is None:
+                    raise IOError('Chart of {} {} {} is not cached anymore'.format(*chart['key']))
+
+                # A retry may find a newer version, which was never given to this delivery
+                if version != chart['version']:
+                    chart['version'], chart['uploading'] = version, False
+
+            photo, chart['uploading'] = self.chart_cache.get_photo(version, chart['uploading'])
+            if photo is None:
+                raise IOError('Chart {} is not cached anymore'.format(version))
+            return photo
+
+        return get_photo
+
+    def _file_id_keeper(self, charts):
+        """Returns a callback caching the file_ids of the sent messages of some charts."""
+
+        def keep_file_ids(sent_messages):
+            if not isinstance(sent_messages, list):
+                sent_messages = [sent_messages]
+
+            for chart, sent_message in zip(charts, sent_messages):
+                if chart['version'] and sent_message and sent_message.photo:
+                    self.chart_cache.set_file_id(chart['version'], sent_message.photo[-1].file_id)
+
+        return keep_file_ids
+
+    def notify_webhook(self, alerts):
         """Send a notification via the webhook notifier
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts to send.
         """
 
-        if self.webhook_configured:
-            for exchange in new_analysis:
-                for market in new_analysis[exchange]:
-                    for indicator_type in new_analysis[exchange][market]:
-                        for indicator in new_analysis[exchange][market][indicator_type]:
-                            for index, analysis in enumerate(new_analysis[exchange][market][indicator_type][indicator]):
-                                analysis_dict = analysis['result'].to_dict(orient='records')
-                                if analysis_dict:
-                                    new_analysis[exchange][market][indicator_type][indicator][index] = analysis_dict[-1]
-                                else:
-                                    new_analysis[exchange][market][indicator_type][indicator][index] = ''
-
-            self.webhook_client.notify(new_analysis)
-
-    def notify_stdout(self, new_analysis):
+        if self.webhook_configured and self.webhook_mode == 'alerts':
+            records = list()
+            for alert in alerts:
+                records.append({
+                    'exchange': alert.exchange,
+                    'market': alert.market_pair,
+                    'indicator_type': alert.indicator_type,
+                    'indicator': alert.indicator,
+                    'indicator_number': alert.index,
+                    'candle_period': alert.candle_period,
+                    'status': alert.status,
+                    'last_status': alert.context['last_status'],
+                    'values': alert.context['values']
+                })
+
+            self.webhook_sender.submit(records)
+
+    def notify_signals(self, exchange, signal_values):
+        """Send the signals changed since the last post via the webhook notifier
+
+        Args:
+            exchange (str): The exchange of the signals.
+            signal_values (dict): A dictionary market pair -> signal name -> value.
+        """
+
+        if self.webhook_configured and self.webhook_mode == 'signals':
+            records = self.webhook_client.get_signal_records(exchange, signal_values)
+            if records:
+                self.webhook_sender.submit(records)
+
+    def notify_stdout(self, alerts):
         """Send a notification via the stdout notifier
 
         Args:
-            new_analysis (dict): The new_analysis to send.
+            alerts (list): The alerts to send.
         """
 
         if self.stdout_configured:
-            message = self._indicator_message_templater(
-                new_analysis,
-                self.notifier_config['stdout']['optional']['template']
-            )
+            message = self._render_alerts(alerts, self.notifier_config['stdout']['optional']['template'])
             if message.strip():
                 self.stdout_client.notify(message)
 
@@ -282,6 +468,10 @@ class Notifier():
             bool: Is the notifier configured?
         """
 
+        #Notifiers left out of the config are not built at all
+        if notifier not in notifier_config:
+            return False
+
         notifier_configured = True
         for _, val in notifier_config[notifier]['required'].items():
             if not val:
@@ -289,100 +479,29 @@ class Notifier():
         return notifier_configured
 
 
-    def _indicator_message_templater(self, new_analysis, template):
+    def _create_sender(self, notifier, send, join=''.join):
+        """Creates the sender of a notifier from its batch_window and max_concurrency options."""
+
+        optional = self.notifier_config[notifier].get('optional') or dict()
+        return BatchSender(
+            send,
+            window=optional.get('batch_window', 0),
+            workers=optional.get('max_concurrency', 1),
+            name=notifier,
+            join=join
+        )
+
+
+    def _render_alerts(self, alerts, template):
         """Creates a message from a user defined template
 
         Args:
-            new_analysis (dict): A dictionary of data related to the analysis to send a message about.
+            alerts (list): The alerts to send a message about.
             template (str): A Jinja formatted message template.
 
         Returns:
             str: The templated messages for the notifier.
         """
 
-        if not self.last_analysis:
-            self.last_analysis = new_analysis
-
-        message_template = Template(template)
-        new_message = str()
-        for exchange in new_analysis:
-            for market in new_analysis[exchange]:
-                for indicator_type in new_analysis[exchange][market]:
-                    if indicator_type == 'informants':
-                        continue
-                    for indicator in new_analysis[exchange][market][indicator_type]:
-                        for index, analysis in enumerate(new_analysis[exchange][market][indicator_type][indicator]):
-                            if analysis['result'].shape[0] == 0:
-                                continue
-
-                            values = dict()
-
-                            if indicator_type == 'indicators':
-                                for signal in analysis['config']['signal']:
-                                    latest_result = analysis['result'].iloc[-1]
-
-                                    values[signal] = analysis['result'].iloc[-1][signal]
-                                    if isinstance(values[signal], float):
-                                        values[signal] = format(values[signal], '.8f')
-                            elif indicator_type == 'crossovers':
-                                latest_result = analysis['result'].iloc[-1]
-
-                                key_signal = '{}_{}'.format(
-                                    analysis['config']['key_signal'],
-                                    analysis['config']['key_indicator_index']
-                                )
-
-                                crossed_signal = '{}_{}'.format(
-                                    analysis['config']['crossed_signal'],
-                                    analysis['config']['crossed_indicator_index']
-                                )
-
-                                values[key_signal] = analysis['result'].iloc[-1][key_signal]
-                                if isinstance(values[key_signal], float):
-                                        values[key_signal] = format(values[key_signal], '.8f')
-
-                                values[crossed_signal] = analysis['result'].iloc[-1][crossed_signal]
-                                if isinstance(values[crossed_signal], float):
-                                        values[crossed_signal] = format(values[crossed_signal], '.8f')
-
-                            status = 'neutral'
-                            if latest_result['is_hot']:
-                                status = 'hot'
-                            elif latest_result['is_cold']:
-                                status = 'cold'
-
-                            # Save status of indicator's new analysis
-                            new_analysis[exchange][market][indicator_type][indicator][index]['status'] = status
-
-                            if latest_result['is_hot'] or latest_result['is_cold']:
-                                try:
-                                    last_status = self.last_analysis[exchange][market][indicator_type][indicator][index]['status']
-                                except:
-                                    last_status = str()
-
-                                should_alert = True
-                                if analysis['config']['alert_frequency'] == 'once':
-                                    if last_status == status:
-                                        should_alert = False
-
-                                if not analysis['config']['alert_enabled']:
-                                    should_alert = False
-
-                                if should_alert:
-                                    base_currency, quote_currency = market.split('/')
-                                    new_message += message_template.render(
-                                        values=values,
-                                        exchange=exchange,
-                                        market=market,
-                                        base_currency=base_currency,
-                                        quote_currency=quote_currency,
-                                        indicator=indicator,
-                                        indicator_number=index,
-                                        analysis=analysis,
-                                        status=status,
-                                        last_status=last_status
-                                    )
-
-        # Merge changes from new analysis into last analysis
-        self.last_analysis = {**self.last_analysis, **new_analysis}
-        return new_message
+        message_template = template_registry.get_template(template)
+        return ''.join(message_template.render(**alert.context) for alert in alerts)
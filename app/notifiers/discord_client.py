@@ -3,24 +3,29 @@
 """
 
 import structlog
-from webcord import Webhook
+
+from notifiers.transport import get_http_session
 
 class DiscordNotifier():
     """Class for handling Discord notifications
     """
 
-    def __init__(self, webhook, username, avatar=None):
+    def __init__(self, webhook, username, avatar=None, timeout=30):
         """Initialize DiscordNotifier class
 
         Args:
             webhook (str): Discord web hook to allow message sending.
             username (str): Display name for the discord bot.
             avatar (str, optional): Defaults to None. Url of an image to use as an avatar.
+            timeout (int, optional): Defaults to 30. Seconds to wait for discord.
         """
 
         self.logger = structlog.get_logger()
         self.discord_username = username
-        self.discord_client = Webhook(webhook, avatar_url=avatar)
+        self.discord_webhook = webhook
+        self.discord_avatar = avatar
+        self.timeout = timeout
+        self.session = get_http_session()
 
 
     def notify(self, message):
@@ -30,4 +35,10 @@ class DiscordNotifier():
             message (str): The message to send.
         """
 
-        self.discord_client.send_message(message, self.discord_username)
+        payload = {'content': message, 'username': self.discord_username}
+        if self.discord_avatar:
+            payload['avatar_url'] = self.discord_avatar
+
+        request = self.session.post(self.discord_webhook, json=payload, timeout=self.timeout)
+        if not request.ok:
+            self.logger.error("Discord request failed: %s - %s", request.status_code, request.content)
@@ -1,31 +1,35 @@
 """Notify a user via Gmail
 """
 
-import smtplib
-
 import structlog
 from tenacity import retry, retry_if_exception_type, stop_after_attempt
 
 from notifiers.utils import NotifierUtils
+from notifiers.transport import SMTPSession
 
 class GmailNotifier(NotifierUtils):
     """Class for handling gmail notifications
     """
 
-    def __init__(self, username, password, destination_addresses):
+    def __init__(self, username, password, destination_addresses, smtp_server='smtp.gmail.com:587',
+                 starttls=True):
         """Initialize GmailNotifier class
 
         Args:
             username (str): Username of the gmail account to use for sending message.
             password (str): Password of the gmail account to use for sending message.
             destination_addresses (list): A list of email addresses to notify.
+            smtp_server (str, optional): Defaults to smtp.gmail.com:587. The SMTP server as
+                host:port.
+            starttls (bool, optional): Defaults to True. Whether to upgrade the connection to TLS.
         """
 
         self.logger = structlog.get_logger()
-        self.smtp_server = 'smtp.gmail.com:587'
+        self.smtp_server = smtp_server
         self.username = username
         self.password = password
         self.destination_addresses = ','.join(destination_addresses)
+        self.smtp_session = SMTPSession(smtp_server, username, password, starttls)
 
 
     @retry(stop=stop_after_attempt(3))
@@ -45,9 +49,4 @@ class GmailNotifier(NotifierUtils):
         header += 'Subject: Crypto-signal alert!\n\n'
         message = header + message
 
-        smtp_handler = smtplib.SMTP(self.smtp_server)
-        smtp_handler.starttls()
-        smtp_handler.login(self.username, self.password)
-        result = smtp_handler.sendmail(self.username, self.destination_addresses, message)
-        smtp_handler.quit()
-        return result
+        return self.smtp_session.sendmail(self.username, self.destination_addresses, message)
@@ -2,24 +2,27 @@
 """
 
 import structlog
-import slackweb
 
 from notifiers.utils import NotifierUtils
+from notifiers.transport import get_http_session
 
 class SlackNotifier(NotifierUtils):
     """Class for handling slack notifications
     """
 
-    def __init__(self, slack_webhook):
+    def __init__(self, slack_webhook, timeout=30):
         """Initialize SlackNotifier class
 
         Args:
             slack_webhook (str): Slack web hook to allow message sending.
+            timeout (int, optional): Defaults to 30. Seconds to wait for slack.
         """
 
         self.logger = structlog.get_logger()
         self.slack_name = "crypto-signal"
-        self.slack_client = slackweb.Slack(url=slack_webhook)
+        self.slack_webhook = slack_webhook
+        self.timeout = timeout
+        self.session = get_http_session()
 
 
     def notify(self, message):
@@ -33,4 +36,6 @@ class SlackNotifier(NotifierUtils):
         message_chunks = self.chunk_message(message=message, max_message_size=max_message_size)
 
         for message_chunk in message_chunks:
-            self.slack_client.notify(text=message_chunk)
+            request = self.session.post(self.slack_webhook, json={'text': message_chunk}, timeout=self.timeout)
+            if not request.ok:
+                self.logger.error("Slack request failed: %s - %s", request.status_code, request.content)
@@ -3,13 +3,16 @@
 
 import structlog
 import telegram
-from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
 
 from notifiers.utils import NotifierUtils
+from outbox import Delivery
 
 
 class TelegramNotifier(NotifierUtils):
     """Used to notify user of events via telegram.
+
+    When an outbox is set, messages and charts are queued there and sent by its workers within
+    the Telegram rate limits, otherwise they are sent right away.
     """
 
     def __init__(self, token, chat_id, parse_mode):
@@ -25,12 +28,8 @@ class TelegramNotifier(NotifierUtils):
         self.chat_id = chat_id
         self.parse_mode = parse_mode
         self.updater = None
+        self.outbox = None
 
-    @retry(
-        retry=retry_if_exception_type(telegram.error.TimedOut),
-        stop=stop_after_attempt(6),
-        wait=wait_fixed(5)
-    )
     def notify(self, message, chat_id = None):
         """Send the notification.
 
@@ -45,24 +44,70 @@ class TelegramNotifier(NotifierUtils):
         message_chunks = self.chunk_message(message=message, max_message_size=max_message_size)
 
         for message_chunk in message_chunks:
-            self.updater.bot.send_message(chat_id=chat_id, text=message_chunk, parse_mode=self.parse_mode)
+            payload = {'chat_id': chat_id, 'text': message_chunk, 'parse_mode': self.parse_mode}
+            self._deliver(chat_id, self._message_sender(chat_id, message_chunk), description='message',
+                          payload=payload)
 
 
-    @retry(
-        retry=retry_if_exception_type(telegram.error.TimedOut),
-        stop=stop_after_attempt(6),
-        wait=wait_fixed(5)
-    )
-    def send_chart(self, photo_url, caption, chat_id = None):
+    def send_chart(self, photo, caption, chat_id = None, on_sent=None):
         """Send image chart
 
         Args:
-            photo_url (str): The photo url to send.
+            photo (str|file|callable): The file_id of an uploaded photo, a file like object to
+                upload, or a function returning one of them called right before sending.
+            on_sent (callable, optional): Called with the sent telegram.Message, its photo holds
+                the file_id for later sends.
+        """
+        if chat_id == None:
+            chat_id = self.chat_id
+
+        def send():
+            return self.updater.bot.send_photo(chat_id=chat_id, photo=self._get_photo(photo), caption=caption,
+                                               timeout=40)
+
+        self._deliver(chat_id, send, on_sent, 'chart')
+
+    def send_chart_group(self, charts, chat_id = None, on_sent=None):
+        """Send several image charts as one media group
+
+        Args:
+            charts (list): A list of (photo, caption) tuples, from 2 to 10 of them. Each photo is
+                given as in send_chart.
+            on_sent (callable, optional): Called with the list of sent telegram.Message.
         """
         if chat_id == None:
             chat_id = self.chat_id
 
-        self.updater.bot.send_photo(chat_id=chat_id, photo=photo_url, caption=caption, timeout=40)
+        def send():
+            media = list()
+            for photo, caption in charts:
+                media.append(telegram.InputMediaPhoto(self._get_photo(photo), caption=caption))
+
+            return self.updater.bot.send_media_group(chat_id=chat_id, media=media, timeout=40)
+
+        self._deliver(chat_id, send, on_sent, 'charts')
 
     def set_updater(self, updater):
         self.updater = updater       
+
+    def set_outbox(self, outbox):
+        self.outbox = outbox
+
+    def _get_photo(self, photo):
+        if callable(photo):
+            photo = photo()
+        if hasattr(photo, 'seek'):
+            photo.seek(0)
+        return photo
+
+    def _message_sender(self, chat_id, text):
+        return lambda: self.updater.bot.send_message(chat_id=chat_id, text=text, parse_mode=self.parse_mode)
+
+    def _deliver(self, chat_id, send, on_sent=None, description='', payload=None):
+        if self.outbox is not None:
+            self.outbox.submit(Delivery(chat_id, send, on_sent, description, payload))
+            return
+
+        result = send()
+        if on_sent:
+            on_sent(result)
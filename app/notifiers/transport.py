@@ -0,0 +1,186 @@
+"""Persistent connections and batched, concurrent sending shared by the notifiers
+"""
+
+import concurrent.futures
+import smtplib
+import threading
+
+import requests
+import structlog
+from requests.adapters import HTTPAdapter
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session(pool_size=10):
+    """Returns the HTTP session shared by the notifiers, keeping connections alive per host.
+
+    Args:
+        pool_size (int, optional): Defaults to 10. Connections kept for each host, only used
+            when the session is created.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+
+    global _http_session
+
+    with _http_session_lock:
+        if _http_session is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _http_session = requests.Session()
+            _http_session.mount('http://', adapter)
+            _http_session.mount('https://', adapter)
+
+    return _http_session
+
+
+class SMTPSession():
+    """An SMTP connection kept open between messages, reconnected when it fails.
+    """
+
+    def __init__(self, server, username=None, password=None, starttls=True, timeout=30):
+        """Initializes SMTPSession class
+
+        Args:
+            server (str): The SMTP server as host:port.
+            username (str, optional): Defaults to None. Login user, no login without it.
+            password (str, optional): Defaults to None. Login password.
+            starttls (bool, optional): Defaults to True. Whether to upgrade the connection to TLS.
+            timeout (int, optional): Defaults to 30. Seconds to wait for the server.
+        """
+
+        self.logger = structlog.get_logger()
+        self.server = server
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()
+
+
+    def sendmail(self, from_address, to_addresses, message):
+        """Sends a message, reconnecting once if the kept connection was lost.
+
+        Args:
+            from_address (str): The sender address.
+            to_addresses (str): The recipient addresses.
+            message (str): The whole message with its headers.
+
+        Returns:
+            dict: The recipients refused by the server.
+        """
+
+        with self.lock:
+            try:
+                return self._get_connection().sendmail(from_address, to_addresses, message)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError) as exc:
+                self.logger.info('SMTP connection to %s lost, reconnecting: %s', self.server, exc)
+                self._close()
+                return self._get_connection().sendmail(from_address, to_addresses, message)
+
+
+    def close(self):
+        """Closes the connection, the next message opens a new one."""
+
+        with self.lock:
+            self._close()
+
+
+    def _get_connection(self):
+        if self.connection is None:
+            connection = smtplib.SMTP(self.server, timeout=self.timeout)
+            if self.starttls:
+                connection.starttls()
+            # starttls forgets the features offered before TLS, ask for them again
+            connection.ehlo_or_helo_if_needed()
+            # Local test servers usually don't offer authentication
+            if self.username and self.password and connection.has_extn('auth'):
+                connection.login(self.username, self.password)
+            self.connection = connection
+
+        return self.connection
+
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+
+class BatchSender():
+    """Collects the messages of a channel for a short window and sends them together.
+
+    Batches are sent by a small pool of threads, so a slow request never blocks the caller
+    and at most `workers` requests of the channel run at the same time.
+    """
+
+    def __init__(self, send, window=0, workers=1, name='notifier', join=''.join):
+        """Initializes BatchSender class
+
+        Args:
+            send (callable): Sends a message, called with the joined messages of a batch.
+            window (float, optional): Defaults to 0. Seconds to collect messages before
+                sending them, 0 sends every message on its own right away.
+            workers (int, optional): Defaults to 1. Maximum amount of concurrent sends.
+            name (str, optional): Shown in the logs.
+            join (callable, optional): Defaults to concatenating the messages. Merges the list
+                of messages of a batch into the message sent.
+        """
+
+        self.logger = structlog.get_logger()
+        self.send = send
+        self.window = window
+        self.name = name
+        self.join = join
+        self.pending = list()
+        self.timer = None
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+
+    def submit(self, message):
+        """Queues a message without waiting for it to be sent.
+
+        Args:
+            message (object): The message to send, a str unless a join function is given.
+        """
+
+        if self.window <= 0:
+            self.executor.submit(self._send, message)
+            return
+
+        with self.lock:
+            self.pending.append(message)
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+
+    def flush(self):
+        """Sends the collected messages now."""
+
+        with self.lock:
+            messages, self.pending = self.pending, list()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        if messages:
+            self.executor.submit(self._send, self.join(messages))
+
+
+    def _send(self, message):
+        try:
+            self.send(message)
+        except Exception as exc:
+            self.logger.info('Error sending %s notification: %s', self.name, exc)
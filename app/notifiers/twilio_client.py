@@ -1,6 +1,8 @@
 """Notify a user via twilio
 """
 
+import concurrent.futures
+
 import structlog
 from twilio.rest import Client
 
@@ -10,7 +12,8 @@ class TwilioNotifier(NotifierUtils):
     """Class for handling twilio notifications
     """
 
-    def __init__(self, twilio_key, twilio_secret, twilio_sender_number, twilio_receiver_number):
+    def __init__(self, twilio_key, twilio_secret, twilio_sender_number, twilio_receiver_number,
+                 max_concurrency=4):
         """Initialize TwilioNotifer class
 
         Args:
@@ -18,12 +21,15 @@ class TwilioNotifier(NotifierUtils):
             twilio_secret (str): They API secret for authenticating to twilio.
             twilio_sender_number (str): The twilio sender number to use.
             twilio_receiver_number (str): The user recipient number.
+            max_concurrency (int, optional): Defaults to 4. Chunks of a message sent at the
+                same time.
         """
 
         self.logger = structlog.get_logger()
         self.twilio_sender_number = twilio_sender_number
         self.twilio_receiver_number = twilio_receiver_number
         self.twilio_client = Client(twilio_key, twilio_secret)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency)
 
 
     def notify(self, message):
@@ -36,9 +42,13 @@ class TwilioNotifier(NotifierUtils):
         max_message_size = 1600
         message_chunks = self.chunk_message(message=message, max_message_size=max_message_size)
 
-        for message_chunk in message_chunks:
-            self.twilio_client.api.account.messages.create(
-                to=self.twilio_receiver_number,
-                from_=self.twilio_sender_number,
-                body=message_chunk
-            )
+        # Waits for every chunk, raising the first error
+        list(self.executor.map(self._send_chunk, message_chunks))
+
+
+    def _send_chunk(self, message_chunk):
+        return self.twilio_client.api.account.messages.create(
+            to=self.twilio_receiver_number,
+            from_=self.twilio_sender_number,
+            body=message_chunk
+        )
@@ -14,6 +14,8 @@ class NotifierUtils():
     def chunk_message(self, message, max_message_size):
         """ Chunks message so that it meets max size of integration.
 
+        Lines are kept whole when possible, a line longer than max_message_size is split.
+
         Args:
             message (str): The message to chunk.
             max_message_size (int): The max message length for the chunks.
@@ -30,12 +32,61 @@ class NotifierUtils():
             for message_part in split_message:
                 temporary_chunk = chunk + message_part
 
-                if max_message_size > len(temporary_chunk):
+                if max_message_size >= len(temporary_chunk):
                     chunk += message_part
-                else:
+                    continue
+
+                if chunk:
                     chunked_message.append(chunk)
-                    chunk = ''
+
+                while len(message_part) > max_message_size:
+                    chunked_message.append(message_part[:max_message_size])
+                    message_part = message_part[max_message_size:]
+
+                chunk = message_part
+
+            if chunk:
+                chunked_message.append(chunk)
         else:
             chunked_message.append(message)
 
         return chunked_message
+
+
+    def pack_sections(self, sections, max_message_size, separator='\n\n'):
+        """ Packs whole sections into as few messages as possible.
+
+        Sections longer than max_message_size are chunked on their own.
+
+        Args:
+            sections (list): The sections of text to pack, in order.
+            max_message_size (int): The max message length for the messages.
+            separator (str, optional): Defaults to an empty line. Text between two sections.
+
+        Returns:
+            list: The packed messages.
+        """
+
+        messages = list()
+        message = ''
+
+        for section in sections:
+            if len(section) > max_message_size:
+                if message:
+                    messages.append(message)
+                    message = ''
+                messages.extend(self.chunk_message(section, max_message_size))
+                continue
+
+            if not message:
+                message = section
+            elif len(message) + len(separator) + len(section) <= max_message_size:
+                message += separator + section
+            else:
+                messages.append(message)
+                message = section
+
+        if message:
+            messages.append(message)
+
+        return messages
@@ -1,33 +1,146 @@
 """Notify another app via webhook
 """
 
+import gzip
+import itertools
+import json
+import math
+import threading
+
 import structlog
 import requests
 
 from notifiers.utils import NotifierUtils
+from notifiers.transport import get_http_session
 
 class WebhookNotifier(NotifierUtils):
     """Class for handling webhook notifications
     """
 
-    def __init__(self, url, username, password):
+    def __init__(self, url, username, password, timeout=30, compress=False, batch_size=1000):
+        """Initialize WebhookNotifier class
+
+        Args:
+            url (str): The URL receiving the payloads.
+            username (str): The username for basic authentication, if required.
+            password (str): The password for basic authentication, if required.
+            timeout (int, optional): Defaults to 30. Seconds to wait for the server.
+            compress (bool, optional): Defaults to False. Whether to gzip the payloads.
+            batch_size (int, optional): Defaults to 1000. Maximum amount of signal records
+                in a payload.
+        """
+
         self.logger = structlog.get_logger()
         self.url = url
         self.username = username
         self.password = password
+        self.timeout = timeout
+        self.compress = compress
+        self.batch_size = batch_size
+        self.session = get_http_session()
+
+        self.sequence = itertools.count(1)
+        self.sent_values = dict()
+        self.lock = threading.Lock()
 
 
     def notify(self, message):
         """Sends the message.
 
         Args:
-            message (str): The message to send.
+            message (list): The message to send, serialized as json.
+
+        Returns:
+            bool: Whether the server accepted the message.
         """
 
+        data = json.dumps(message, default=str).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.compress:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+
+        auth = None
         if self.username and self.password:
-            request = requests.post(self.url, json=message, auth=(self.username, self.password))
-        else:
-            request = requests.post(self.url, json=message)
+            auth = (self.username, self.password)
+
+        request = self.session.post(self.url, data=data, headers=headers, auth=auth, timeout=self.timeout)
 
         if not request.status_code == requests.codes.ok:
             self.logger.error("Request failed: %s - %s", request.status_code, request.content)
+            return False
+        return True
+
+
+    def get_signal_records(self, exchange, signal_values):
+        """Returns a record for each signal changed since it was last sent.
+
+        Args:
+            exchange (str): The exchange of the signals.
+            signal_values (dict): A dictionary market pair -> signal name -> value.
+
+        Returns:
+            list: The changed signals as flat records with a sequence number.
+        """
+
+        records = list()
+
+        with self.lock:
+            for market_pair, signals in signal_values.items():
+                for signal, value in signals.items():
+                    value = self._to_json_value(value)
+                    key = (exchange, market_pair, signal)
+                    if key in self.sent_values and self.sent_values[key] == value:
+                        continue
+
+                    self.sent_values[key] = value
+                    records.append({
+                        'seq': next(self.sequence),
+                        'exchange': exchange,
+                        'market': market_pair,
+                        'signal': signal,
+                        'value': value
+                    })
+
+        return records
+
+
+    def notify_signals(self, records):
+        """Sends signal records in payloads of up to batch_size records.
+
+        Records of a payload the server didn't accept are sent again with the next changes.
+
+        Args:
+            records (list): The records to send, as returned by get_signal_records.
+        """
+
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+
+            try:
+                sent = self.notify(batch)
+            except requests.exceptions.RequestException as exc:
+                self.logger.error("Request failed: %s", exc)
+                sent = False
+
+            if not sent:
+                self._forget(batch)
+
+
+    def _forget(self, records):
+        with self.lock:
+            for record in records:
+                key = (record['exchange'], record['market'], record['signal'])
+                if self.sent_values.get(key) == record['value']:
+                    del self.sent_values[key]
+
+
+    def _to_json_value(self, value):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return str(value)
+
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return value
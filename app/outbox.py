@@ -0,0 +1,314 @@
+"""Delivers Telegram notifications from a queue, within the Telegram rate limits
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import structlog
+import telegram
+
+
+class TokenBucket():
+    """Allows `rate` sends per second on average, with bursts of up to `capacity` sends.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """Initializes TokenBucket class
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float, optional): Defaults to 1. Maximum amount of tokens kept.
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+
+    def delay(self, now):
+        """Returns how many seconds until a token is available, 0 if there is one now."""
+
+        self._refill(now)
+
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+    def take(self, now):
+        """Consumes a token, callers check delay first."""
+
+        self._refill(now)
+        self.tokens -= 1
+
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Delivery():
+    """A single Telegram request waiting in the outbox.
+    """
+
+    def __init__(self, chat_id, send, on_sent=None, description='', payload=None):
+        """Initializes Delivery class
+
+        Args:
+            chat_id (str): The chat receiving the delivery.
+            send (callable): Does the request, called without arguments.
+            on_sent (callable, optional): Called with the result of send once it succeeds.
+            description (str, optional): Shown in the logs.
+            payload (dict, optional): Keyword arguments of bot.send_message for the deliveries
+                stored until they are sent, None for the ones lost on a restart.
+        """
+
+        self.chat_id = chat_id
+        self.send = send
+        self.on_sent = on_sent
+        self.description = description
+        self.payload = payload
+        self.store_id = None
+        self.attempts = 0
+
+
+class NotificationOutbox():
+    """Bounded queue of Telegram deliveries sent by a pool of worker threads.
+
+    Deliveries of a chat keep their order and a chat is only handled by one worker at a time.
+    Chats wait in a heap ordered by the time they can send again, so a chat over its rate
+    limit, asked to retry after some time or retrying a timeout never blocks a worker.
+    """
+
+    def __init__(self, workers=4, max_size=10000, global_rate=30, chat_rate=1, group_rate=20 / 60,
+                 max_attempts=6, retry_delay=5, store=None):
+        """Initializes NotificationOutbox class
+
+        Args:
+            workers (int, optional): Defaults to 4. Amount of worker threads sending.
+            max_size (int, optional): Defaults to 10000. Maximum amount of pending deliveries,
+                new ones are dropped when the outbox is full.
+            global_rate (float, optional): Defaults to 30. Messages per second for all chats.
+            chat_rate (float, optional): Defaults to 1. Messages per second for a private chat.
+            group_rate (float, optional): Defaults to 20 per minute. Messages per second for a
+                group or channel.
+            max_attempts (int, optional): Defaults to 6. Attempts of a delivery timing out.
+            retry_delay (int, optional): Defaults to 5. Seconds before retrying a timeout.
+            store (NotificationStore, optional): Keeps the deliveries with a payload until
+                they are sent, so they can be replayed after a restart.
+        """
+
+        self.logger = structlog.get_logger()
+        self.store = store
+        self.max_size = max_size
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets = dict()
+        self.lanes = dict()
+        self.ready = list()
+        self.sequence = itertools.count()
+        self.size = 0
+        self.running = True
+        self.condition = threading.Condition()
+
+        self.threads = list()
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name='outbox-{}'.format(number), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+
+    def submit(self, delivery):
+        """Queues a delivery without waiting for it.
+
+        Args:
+            delivery (Delivery): The delivery to send.
+
+        Returns:
+            bool: False if the outbox is full and the delivery was dropped.
+        """
+
+        # Written out of the lock, so producers and workers never wait for the disk
+        if self.store is not None and delivery.payload is not None and delivery.store_id is None:
+            delivery.store_id = self.store.add_delivery(delivery.chat_id, delivery.payload)
+
+        with self.condition:
+            full = self.size >= self.max_size
+            if not full:
+                self._enqueue(delivery)
+
+        if full:
+            self.logger.warn('Notification outbox full, dropping %s to %s', delivery.description, delivery.chat_id)
+            if delivery.store_id is not None:
+                self.store.remove_delivery(delivery.store_id)
+            return False
+
+        return True
+
+
+    def _enqueue(self, delivery):
+        """Appends a delivery to its chat, callers hold the condition."""
+
+        self.size += 1
+        lane = self.lanes.get(delivery.chat_id)
+        if lane is None:
+            lane = self.lanes[delivery.chat_id] = deque()
+            lane.append(delivery)
+            self._schedule(delivery.chat_id, time.time())
+        else:
+            # The chat is already scheduled or being sent by a worker
+            lane.append(delivery)
+
+
+    def replay(self, create_send):
+        """Queues again the deliveries stored before a restart.
+
+        Args:
+            create_send (callable): Called with the payload of a delivery, returns its send
+                function.
+
+        Returns:
+            int: The amount of replayed deliveries.
+        """
+
+        if self.store is None:
+            return 0
+
+        deliveries = self.store.get_deliveries()
+        for store_id, chat_id, payload in deliveries:
+            # The payload keeps the original type of the chat id
+            chat_id = payload.get('chat_id', chat_id)
+            delivery = Delivery(chat_id, create_send(payload), description='stored message', payload=payload)
+            delivery.store_id = store_id
+            self.submit(delivery)
+
+        self.logger.info('Replayed %d stored deliveries', len(deliveries))
+        return len(deliveries)
+
+
+    def pending(self):
+        """Returns the amount of deliveries waiting in the outbox."""
+
+        return self.size
+
+
+    def stop(self):
+        """Stops the workers, pending deliveries are discarded."""
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+
+    def _schedule(self, chat_id, ready_at):
+        heapq.heappush(self.ready, (ready_at, next(self.sequence), chat_id))
+        self.condition.notify()
+
+
+    def _get_chat_bucket(self, chat_id):
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.group_rate if self._is_group(chat_id) else self.chat_rate)
+        return self.chat_buckets[chat_id]
+
+
+    def _is_group(self, chat_id):
+        """Group ids are negative, channels can also be given by their @username."""
+
+        try:
+            return int(chat_id) < 0
+        except (TypeError, ValueError):
+            return True
+
+
+    def _next_delivery(self):
+        """Waits until a chat can send and returns its first delivery, None when stopped."""
+
+        with self.condition:
+            while self.running:
+                now = time.time()
+                if not self.ready:
+                    self.condition.wait()
+                    continue
+
+                ready_at, _, chat_id = self.ready[0]
+                if ready_at > now:
+                    self.condition.wait(ready_at - now)
+                    continue
+
+                heapq.heappop(self.ready)
+                chat_bucket = self._get_chat_bucket(chat_id)
+                delay = max(self.global_bucket.delay(now), chat_bucket.delay(now))
+                if delay > 0:
+                    self._schedule(chat_id, now + delay)
+                    continue
+
+                self.global_bucket.take(now)
+                chat_bucket.take(now)
+                return self.lanes[chat_id][0]
+
+        return None
+
+
+    def _finish(self, delivery, retry_at=None):
+        """Removes a delivery from its chat unless it is retried, and schedules the chat again."""
+
+        done = retry_at is None
+        with self.condition:
+            lane = self.lanes[delivery.chat_id]
+            if done:
+                lane.popleft()
+                self.size -= 1
+                retry_at = time.time()
+
+            if lane:
+                self._schedule(delivery.chat_id, retry_at)
+            else:
+                del self.lanes[delivery.chat_id]
+
+        if done and delivery.store_id is not None:
+            self.store.remove_delivery(delivery.store_id)
+
+
+    def _work(self):
+        while True:
+            delivery = self._next_delivery()
+            if delivery is None:
+                return
+
+            delivery.attempts += 1
+            try:
+                result = delivery.send()
+            except telegram.error.RetryAfter as exc:
+                self.logger.info('Telegram asks to wait %s seconds for chat %s', exc.retry_after, delivery.chat_id)
+                self._finish(delivery, time.time() + exc.retry_after)
+                continue
+            except telegram.error.TimedOut:
+                if delivery.attempts < self.max_attempts:
+                    self.logger.info('Timeout sending %s to %s, retrying', delivery.description, delivery.chat_id)
+                    self._finish(delivery, time.time() + self.retry_delay)
+                else:
+                    self.logger.info('Giving up sending %s to %s after %d timeouts',
+                                     delivery.description, delivery.chat_id, delivery.attempts)
+                    self._finish(delivery)
+                continue
+            except Exception as exc:
+                self.logger.info('Error sending %s to %s: %s', delivery.description, delivery.chat_id, exc)
+                self._finish(delivery)
+                continue
+
+            self._finish(delivery)
+
+            if delivery.on_sent:
+                try:
+                    delivery.on_sent(result)
+                except Exception as exc:
+                    self.logger.info('Error after sending %s to %s: %s', delivery.description, delivery.chat_id, exc)
@@ -41,7 +41,8 @@ class Output():
         for indicator_type in results:
             output += '\n{}:\t'.format(indicator_type)
             for indicator in results[indicator_type]:
-                for i, analysis in enumerate(results[indicator_type][indicator]):
+                for analysis in results[indicator_type][indicator]:
+                    i = analysis['index']
                     if analysis['result'].shape[0] == 0:
                         self.logger.info('No results for %s #%s', indicator, i)
                         continue
@@ -121,7 +122,8 @@ class Output():
         output = str()
         for indicator_type in results:
             for indicator in results[indicator_type]:
-                for i, analysis in enumerate(results[indicator_type][indicator]):
+                for analysis in results[indicator_type][indicator]:
+                    i = analysis['index']
                     value = str()
 
                     if indicator_type == 'crossovers':
@@ -0,0 +1,77 @@
+"""Plans each analysis from the signals someone is subscribed to
+"""
+
+import threading
+
+import structlog
+
+
+class AnalysisPlanner():
+    """Counts the subscriptions to each (exchange, market_pair, indicator, candle_period) key.
+
+    It listens to the subscription index, so the counts follow every user change. The plan of
+    an exchange only holds the keys with at least one subscription, so market pairs and candle
+    periods nobody watches anymore are neither fetched nor analyzed.
+    """
+
+    def __init__(self):
+        """Initializes AnalysisPlanner class
+        """
+
+        self.logger = structlog.get_logger()
+        self.counts = dict()
+        self.lock = threading.Lock()
+
+
+    def update(self, added, removed):
+        """Applies the keys a subscriber added and removed.
+
+        Args:
+            added (set): (exchange, market_pair, indicator, candle_period) keys subscribed.
+            removed (set): (exchange, market_pair, indicator, candle_period) keys unsubscribed.
+        """
+
+        with self.lock:
+            for exchange, market_pair, indicator, candle_period in added:
+                work_items = self.counts.setdefault(exchange, dict()).setdefault(market_pair, dict())
+                work_item = (indicator, candle_period)
+                work_items[work_item] = work_items.get(work_item, 0) + 1
+
+            for exchange, market_pair, indicator, candle_period in removed:
+                work_items = self.counts.get(exchange, dict()).get(market_pair)
+                work_item = (indicator, candle_period)
+                if work_items is None or work_item not in work_items:
+                    continue
+
+                work_items[work_item] -= 1
+                if work_items[work_item] > 0:
+                    continue
+
+                del work_items[work_item]
+                if not work_items:
+                    del self.counts[exchange][market_pair]
+                    self.logger.debug('Nobody watches %s on %s anymore', market_pair, exchange)
+
+
+    def get_plan(self, exchange):
+        """Returns the work items of an exchange.
+
+        Args:
+            exchange (str): The exchange to analyze.
+
+        Returns:
+            dict: A dictionary market pair -> frozenset of (indicator, candle_period) tuples.
+        """
+
+        with self.lock:
+            return {
+                market_pair: frozenset(work_items)
+                for market_pair, work_items in self.counts.get(exchange, dict()).items()
+            }
+
+
+    def get_exchanges(self):
+        """Returns the exchanges with at least one watched market pair."""
+
+        with self.lock:
+            return [exchange for exchange, market_pairs in self.counts.items() if market_pairs]
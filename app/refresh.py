@@ -0,0 +1,199 @@
+"""Decides which market pairs and candle periods get fresh candles on each update
+"""
+
+import time
+
+import numpy as np
+import structlog
+
+
+class RefreshScheduler():
+    """Spends the OHLCV request budget of one exchange on the most interesting items first.
+
+    Items are (market_pair, candle_period) tuples. Their priority comes from the last analysis:
+    recent volatility, volume spikes and how close RSI/MFI are to the configured thresholds.
+    Items not refreshed in this cycle keep their cached candles until they are selected again or
+    reach the staleness ceiling.
+    """
+
+    def __init__(self, budget=None, max_staleness=3600):
+        """Initializes RefreshScheduler class
+
+        Args:
+            budget (int, optional): Defaults to None. Maximum number of OHLCV requests per update,
+                None means every item is refreshed on each update.
+            max_staleness (int, optional): Defaults to 3600. Items older than this amount of
+                seconds are always refreshed, even over budget.
+        """
+
+        self.logger = structlog.get_logger()
+        self.budget = budget
+        self.max_staleness = max_staleness
+        self.candles = dict()
+        self.last_refresh = dict()
+        self.priorities = dict()
+
+
+    def select(self, items, now=None):
+        """Selects the items that should be fetched in this update.
+
+        Args:
+            items (list): A list of (market_pair, candle_period) tuples needed by the analysis.
+            now (float, optional): Current timestamp in seconds, defaults to time.time().
+
+        Returns:
+            set: The items to fetch.
+        """
+
+        if now is None:
+            now = time.time()
+
+        if self.budget is None:
+            return set(items)
+
+        due = set()
+        candidates = list()
+
+        for item in items:
+            if item not in self.candles:
+                due.add(item)
+                continue
+
+            age = now - self.last_refresh[item]
+            if age >= self.max_staleness:
+                due.add(item)
+                continue
+
+            # Items waiting for a long time slowly climb in the queue
+            score = (1 + self.priorities.get(item, 0)) * age
+            candidates.append((score, item))
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        forced = len(due)
+        remaining = max(self.budget - forced, 0)
+        due.update(item for _, item in candidates[:remaining])
+
+        self.logger.info(
+            'Refreshing %d of %d items, %d of them new or over the staleness ceiling',
+            len(due), len(items), forced
+        )
+
+        return due
+
+
+    def get_candles(self, item):
+        """Returns the cached candles of an item.
+
+        Args:
+            item (tuple): A (market_pair, candle_period) tuple.
+
+        Returns:
+            list: The cached OHLCV data, empty if there is nothing cached.
+        """
+
+        return self.candles.get(item, list())
+
+
+    def set_candles(self, item, candles, now=None):
+        """Stores freshly fetched candles of an item.
+
+        Args:
+            item (tuple): A (market_pair, candle_period) tuple.
+            candles (list): The OHLCV data.
+            now (float, optional): Current timestamp in seconds, defaults to time.time().
+        """
+
+        if now is None:
+            now = time.time()
+
+        self.candles[item] = candles
+        self.last_refresh[item] = now
+
+
+    def retain(self, items):
+        """Drops the cached candles of the items no longer analyzed.
+
+        Args:
+            items (list): A list of (market_pair, candle_period) tuples still needed.
+        """
+
+        items = set(items)
+        for item in [item for item in self.candles if item not in items]:
+            del self.candles[item]
+            del self.last_refresh[item]
+            self.priorities.pop(item, None)
+
+
+    def update_priorities(self, market_analysis, historical_data):
+        """Recomputes the priority of every item from the latest analysis.
+
+        Args:
+            market_analysis (dict): The analysis of one exchange, market pair -> indicator type
+                -> indicator -> list of results.
+            historical_data (dict): The candles of one exchange, market pair -> candle period
+                -> OHLCV data.
+        """
+
+        for market_pair in historical_data:
+            indicators = market_analysis.get(market_pair, dict()).get('indicators', dict())
+
+            for candle_period, candles in historical_data[market_pair].items():
+                item = (market_pair, candle_period)
+                self.priorities[item] = (
+                    self._volatility(candles) +
+                    self._volume_spike(candles) +
+                    self._threshold_proximity(indicators, candle_period)
+                )
+
+
+    def _volatility(self, candles, period_count=14):
+        """Average true range of the last candles relative to the close price, in percent."""
+
+        if len(candles) < 2:
+            return 0
+
+        candles = np.asarray(candles, dtype=float)[-(period_count + 1):]
+        high, low, close = candles[1:, 2], candles[1:, 3], candles[1:, 4]
+        previous_close = candles[:-1, 4]
+
+        true_range = np.maximum(high, previous_close) - np.minimum(low, previous_close)
+        if not close[-1]:
+            return 0
+
+        return float(np.mean(true_range) / close[-1] * 100)
+
+
+    def _volume_spike(self, candles):
+        """How many times the last volume exceeds the average volume, 0 when it doesn't."""
+
+        if len(candles) < 2:
+            return 0
+
+        volume = np.asarray(candles, dtype=float)[:, 5]
+        mean_volume = np.mean(volume[:-1])
+        if not mean_volume:
+            return 0
+
+        return float(max(volume[-1] / mean_volume - 1, 0))
+
+
+    def _threshold_proximity(self, indicators, candle_period):
+        """Up to 10 points as RSI or MFI gets within 10 points of its hot/cold thresholds."""
+
+        proximity = 0
+        for indicator in ('rsi', 'mfi'):
+            for analysis in indicators.get(indicator, list()):
+                if analysis['config']['candle_period'] != candle_period:
+                    continue
+                if isinstance(analysis['result'], str) or analysis['result'].shape[0] == 0:
+                    continue
+
+                value = analysis['result'].iloc[-1][analysis['config']['signal'][0]]
+                distance = min(
+                    abs(value - analysis['config']['hot']),
+                    abs(value - analysis['config']['cold'])
+                )
+                proximity = max(proximity, 10 - min(distance, 10))
+
+        return proximity
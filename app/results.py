@@ -0,0 +1,211 @@
+"""Analysis results shared by every user, published as immutable snapshots
+"""
+
+import threading
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+import structlog
+
+
+#A transition of an indicator to hot or cold. The message is rendered with the Telegram template,
+#other notifiers render the context with their own templates.
+Alert = namedtuple('Alert', [
+    'exchange', 'market_pair', 'indicator_type', 'indicator', 'index', 'candle_period', 'status', 'message',
+    'context'
+])
+
+
+class ResultsSnapshot():
+    """Alerts of the last analysis of every exchange, never modified once published.
+
+    Besides the alerts of each exchange, the snapshot keeps them grouped by the users subscribed
+    to them. Publishing the alerts of an exchange creates a new snapshot with the next version
+    that shares the other exchanges with the previous one, so readers holding a snapshot never
+    see a partial update.
+    """
+
+    def __init__(self, version=0, alerts=None, user_alerts=None):
+        """Initializes ResultsSnapshot class
+
+        Args:
+            version (int, optional): Defaults to 0. Sequence number of the snapshot.
+            alerts (dict, optional): A read only dictionary exchange -> tuple of alerts.
+            user_alerts (dict, optional): A read only dictionary exchange -> user id -> tuple
+                of alerts.
+        """
+
+        self.version = version
+        self.alerts = alerts if alerts is not None else MappingProxyType(dict())
+        self.user_alerts = user_alerts if user_alerts is not None else MappingProxyType(dict())
+
+
+    def publish(self, exchange, alerts, subscriptions):
+        """Returns a new snapshot with the latest alerts of an exchange.
+
+        Args:
+            exchange (str): The analyzed exchange.
+            alerts (list): The alerts of the exchange, as created by Behaviour.run.
+            subscriptions (SubscriptionIndex): Finds the users receiving each alert.
+
+        Returns:
+            ResultsSnapshot: The next snapshot.
+        """
+
+        user_alerts = dict()
+        for alert in alerts:
+            subscribers = subscriptions.get_subscribers(
+                alert.exchange, alert.market_pair, alert.indicator, alert.candle_period
+            )
+            for user_id in subscribers:
+                user_alerts.setdefault(user_id, list()).append(alert)
+
+        exchange_alerts = dict(self.alerts)
+        exchange_alerts[exchange] = tuple(alerts)
+
+        exchange_user_alerts = dict(self.user_alerts)
+        exchange_user_alerts[exchange] = MappingProxyType(
+            {user_id: tuple(_alerts) for user_id, _alerts in user_alerts.items()}
+        )
+
+        return ResultsSnapshot(self.version + 1, MappingProxyType(exchange_alerts),
+                               MappingProxyType(exchange_user_alerts))
+
+
+class ResultsView():
+    """The alerts a user didn't read yet, as taken from the publisher.
+
+    Nothing is searched: the alerts of the user were grouped when each snapshot was published,
+    so the cost of a view follows the alerts of the user.
+    """
+
+    def __init__(self, user_id, alerts):
+        """Initializes ResultsView class
+
+        Args:
+            user_id (str): The user reading them.
+            alerts (list): The unread alerts of the user, oldest first.
+        """
+
+        self.user_id = user_id
+        self.alerts = alerts
+
+
+    def get_alerts(self):
+        """Returns the alerts of the user.
+
+        Returns:
+            list: The alerts of every exchange, oldest first.
+        """
+
+        return self.alerts
+
+
+    def get_messages(self):
+        """Returns the messages of the user.
+
+        Returns:
+            dict: A dictionary exchange -> market pair -> candle period -> list of messages,
+                only with the exchanges having messages.
+        """
+
+        messages = dict()
+        for alert in self.get_alerts():
+            market_messages = messages.setdefault(alert.exchange, dict()).setdefault(alert.market_pair, dict())
+            market_messages.setdefault(alert.candle_period, list()).append(alert.message)
+
+        return messages
+
+
+class ResultsPublisher():
+    """Holds the latest snapshot, replaced atomically by the exchange analysis threads.
+
+    The alerts of every publication are also added to the unread alerts of their users, kept
+    until the user reads them, so a user notified less often than the exchanges are analyzed
+    gets every transition of the window and not only those of the last analysis.
+    """
+
+    def __init__(self, subscriptions, max_unread=1000):
+        """Initializes ResultsPublisher class
+
+        Args:
+            subscriptions (SubscriptionIndex): Finds the users receiving each alert.
+            max_unread (int, optional): Defaults to 1000. Unread alerts kept per user, the
+                oldest ones are dropped first.
+        """
+
+        self.logger = structlog.get_logger()
+        self.subscriptions = subscriptions
+        self.max_unread = max_unread
+        self.snapshot = ResultsSnapshot()
+        self.unread = dict()
+        self.listeners = list()
+        self.lock = threading.Lock()
+
+
+    def add_listener(self, listener):
+        """Registers a function called after each publication.
+
+        Args:
+            listener (callable): Called with the new snapshot, the published exchange and the
+                users with alerts in it.
+        """
+
+        self.listeners.append(listener)
+
+
+    def publish(self, exchange, alerts):
+        """Publishes the latest alerts of an exchange.
+
+        Args:
+            exchange (str): The analyzed exchange.
+            alerts (list): The alerts of the exchange.
+
+        Returns:
+            ResultsSnapshot: The published snapshot.
+        """
+
+        with self.lock:
+            snapshot = self.snapshot = self.snapshot.publish(exchange, alerts, self.subscriptions)
+            self.logger.debug('Published results version %d for %s, %d alerts',
+                              snapshot.version, exchange, len(alerts))
+
+            for user_id, user_alerts in snapshot.user_alerts[exchange].items():
+                unread = self.unread.setdefault(user_id, deque(maxlen=self.max_unread))
+                if len(unread) + len(user_alerts) > self.max_unread:
+                    self.logger.info('Too many unread alerts for %s, dropping the oldest ones', user_id)
+                unread.extend(user_alerts)
+
+        for listener in self.listeners:
+            listener(snapshot, exchange, snapshot.user_alerts[exchange].keys())
+
+        return snapshot
+
+
+    def get_view(self, user_id):
+        """Takes the unread alerts of a user, they are not returned again.
+
+        Args:
+            user_id (str): The user reading them.
+
+        Returns:
+            ResultsView: The alerts published since the last view of the user.
+        """
+
+        with self.lock:
+            unread = self.unread.pop(user_id, ())
+
+        return ResultsView(user_id, list(unread))
+
+
+    def discard(self, user_id):
+        """Drops the unread alerts of a user who stopped reading them."""
+
+        with self.lock:
+            self.unread.pop(user_id, None)
+
+
+    def get_snapshot(self):
+        """Returns the latest snapshot, which never changes afterwards."""
+
+        return self.snapshot
@@ -0,0 +1,481 @@
+"""Compound alert rules evaluated over the latest signals of every market pair
+"""
+
+import re
+import threading
+
+import numpy as np
+import structlog
+
+
+TOKEN_REGEX = re.compile(r'\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z_][A-Za-z0-9_]*)|(<=|>=|==|!=|<|>|[-+*/()]))')
+
+COMPARISONS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+ARITHMETIC = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': np.divide
+}
+
+KEYWORDS = ('and', 'or', 'not')
+
+OHLCV_SIGNALS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def get_signal_names(*indicator_configs):
+    """Returns the signal names rules can use, named as <signal>_<candle_period>.
+
+    Args:
+        indicator_configs (dict): Dictionaries indicator -> list of configs, like the
+            indicators and informants of the config.
+
+    Returns:
+        set: The signal names, with the OHLCV values also available without suffix.
+    """
+
+    names = set(OHLCV_SIGNALS)
+    for indicators in indicator_configs:
+        for indicator, confs in indicators.items():
+            for conf in confs:
+                signals = OHLCV_SIGNALS if indicator == 'ohlcv' else conf.get('signal', list())
+                for signal in signals:
+                    names.add('{}_{}'.format(signal, conf['candle_period']))
+
+    return names
+
+
+class SignalTable():
+    """Latest signal values of all market pairs laid out as one array per signal.
+    """
+
+    def __init__(self, signal_values):
+        """Initializes SignalTable class
+
+        Args:
+            signal_values (dict): A dictionary exchange -> market pair -> signal name -> value.
+        """
+
+        self.rows = list()
+        for exchange in signal_values:
+            for market_pair in signal_values[exchange]:
+                self.rows.append((exchange, market_pair))
+
+        self.columns = dict()
+        for row, (exchange, market_pair) in enumerate(self.rows):
+            for name, value in signal_values[exchange][market_pair].items():
+                if name not in self.columns:
+                    self.columns[name] = np.full(len(self.rows), np.nan)
+                try:
+                    self.columns[name][row] = float(value)
+                except (TypeError, ValueError):
+                    continue
+
+
+    def column(self, name):
+        """Returns the values of a signal for every row, NaN where it is missing.
+
+        Args:
+            name (str): The signal name, i.e. rsi_1h.
+
+        Returns:
+            numpy.ndarray: The signal values.
+        """
+
+        if name in self.columns:
+            return self.columns[name]
+        return np.full(len(self.rows), np.nan)
+
+
+class RuleParser():
+    """Parses a rule expression like `rsi_1h < 30 and close > vwap_1h` into a tree of tuples.
+
+    Nodes are plain tuples so that structurally identical sub-expressions compare and hash equal.
+    """
+
+    def parse(self, expression):
+        """Parses a rule expression.
+
+        Args:
+            expression (str): The rule expression.
+
+        Raises:
+            ValueError: If the expression is not valid.
+
+        Returns:
+            tuple: The root node of the expression tree.
+        """
+
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+
+        node = self._parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError('Unexpected token {} in rule'.format(self.tokens[self.position][1]))
+
+        if node[0] not in ('cmp', 'and', 'or', 'not'):
+            raise ValueError('Rule must be a comparison, i.e. rsi_1h < 30')
+
+        return node
+
+
+    def _tokenize(self, expression):
+        tokens = list()
+        position = 0
+        expression = expression.strip()
+
+        while position < len(expression):
+            match = TOKEN_REGEX.match(expression, position)
+            if not match or match.end() == position:
+                raise ValueError('Invalid character in rule: {}'.format(expression[position:]))
+
+            number, name, operator = match.groups()
+            if number is not None:
+                tokens.append(('num', float(number)))
+            elif name is not None:
+                name = name.lower()
+                tokens.append(('kw', name) if name in KEYWORDS else ('var', name))
+            else:
+                tokens.append(('op', operator))
+
+            position = match.end()
+
+        if not tokens:
+            raise ValueError('Empty rule')
+
+        return tokens
+
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError('Unexpected end of rule')
+        self.position += 1
+        return token
+
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() == ('kw', 'or'):
+            self._next()
+            node = ('or', node, self._parse_and())
+        return node
+
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() == ('kw', 'and'):
+            self._next()
+            node = ('and', node, self._parse_not())
+        return node
+
+
+    def _parse_not(self):
+        if self._peek() == ('kw', 'not'):
+            self._next()
+            return ('not', self._parse_not())
+        return self._parse_comparison()
+
+
+    def _parse_comparison(self):
+        node = self._parse_sum()
+        token = self._peek()
+        if token[0] == 'op' and token[1] in COMPARISONS:
+            self._next()
+            node = ('cmp', token[1], node, self._parse_sum())
+        return node
+
+
+    def _parse_sum(self):
+        node = self._parse_product()
+        while self._peek()[0] == 'op' and self._peek()[1] in ('+', '-'):
+            operator = self._next()[1]
+            node = ('bin', operator, node, self._parse_product())
+        return node
+
+
+    def _parse_product(self):
+        node = self._parse_atom()
+        while self._peek()[0] == 'op' and self._peek()[1] in ('*', '/'):
+            operator = self._next()[1]
+            node = ('bin', operator, node, self._parse_atom())
+        return node
+
+
+    def _parse_atom(self):
+        token = self._next()
+
+        if token[0] in ('num', 'var'):
+            return token
+
+        if token == ('op', '-'):
+            return ('bin', '-', ('num', 0.0), self._parse_atom())
+
+        if token == ('op', '('):
+            node = self._parse_or()
+            if self._next() != ('op', ')'):
+                raise ValueError('Missing closing parenthesis in rule')
+            return node
+
+        raise ValueError('Unexpected token {} in rule'.format(token[1]))
+
+
+class RuleEngine():
+    """Keeps the rules of every user and evaluates them over a SignalTable.
+
+    Identical rules and sub-expressions are stored once, so each distinct node costs a single
+    array operation per table no matter how many users share it.
+
+    Conditions are evaluated with three values, true, false and unknown (NaN). A comparison
+    with a missing signal is unknown, stays unknown through `not`, and never matches.
+    """
+
+    def __init__(self, signals=None):
+        """Initializes RuleEngine class
+
+        Args:
+            signals (set, optional): The signal names rules can use, any name is accepted
+                when not given.
+        """
+
+        self.logger = structlog.get_logger()
+        self.signals = signals
+        self.nodes = dict()
+        self.user_rules = dict()
+        self.last_table = None
+        self.last_results = dict()
+        self.lock = threading.RLock()
+
+
+    def add_rule(self, user_id, expression):
+        """Parses and registers a rule for a user.
+
+        Args:
+            user_id (str): The user owning the rule.
+            expression (str): The rule expression.
+
+        Raises:
+            ValueError: If the expression is not valid or uses an unknown signal.
+
+        Returns:
+            tuple: The compiled rule node.
+        """
+
+        node = RuleParser().parse(expression)
+        if self.signals is not None:
+            unknown = sorted(self._get_names(node) - self.signals)
+            if unknown:
+                raise ValueError('Unknown signal {} in rule'.format(', '.join(unknown)))
+
+        with self.lock:
+            node = self._intern(node)
+
+            rules = self.user_rules.setdefault(user_id, list())
+            if (expression, node) not in rules:
+                rules.append((expression, node))
+                self.last_table = None
+
+        return node
+
+
+    def remove_rule(self, user_id, position):
+        """Removes a rule of a user by its position in the user list.
+
+        Args:
+            user_id (str): The user owning the rule.
+            position (int): Index of the rule as shown by get_rules.
+
+        Raises:
+            IndexError: If there is no such rule.
+        """
+
+        with self.lock:
+            rules = self.user_rules.get(user_id, list())
+            del rules[position]
+            self._collect_nodes()
+
+
+    def get_rules(self, user_id):
+        """Returns the rule expressions of a user.
+
+        Args:
+            user_id (str): The user owning the rules.
+
+        Returns:
+            list: The rule expressions.
+        """
+
+        return [expression for expression, _ in self.user_rules.get(user_id, list())]
+
+
+    def get_signals(self, user_id):
+        """Returns the signal names used by the rules of a user.
+
+        Args:
+            user_id (str): The user owning the rules.
+
+        Returns:
+            set: The signal names, i.e. rsi_1h.
+        """
+
+        with self.lock:
+            names = set()
+            for _, node in self.user_rules.get(user_id, list()):
+                names |= self._get_names(node)
+            return names
+
+
+    def get_users(self):
+        """Returns the users with at least one rule.
+
+        Returns:
+            list: The user ids.
+        """
+
+        with self.lock:
+            return [user_id for user_id, rules in self.user_rules.items() if rules]
+
+
+    def evaluate(self, table):
+        """Evaluates every distinct rule over the table.
+
+        Results are cached until a different table is given, so users sharing a rule reuse
+        the same evaluation.
+
+        Args:
+            table (SignalTable): The latest signals of all market pairs.
+
+        Returns:
+            dict: A dictionary rule node -> boolean numpy.ndarray with one entry per table row.
+        """
+
+        with self.lock:
+            if table is self.last_table:
+                return self.last_results
+
+            cache = dict()
+            results = dict()
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                for rules in self.user_rules.values():
+                    for _, node in rules:
+                        if node not in results:
+                            #Unknown results don't match
+                            results[node] = self._as_truth(self._evaluate_node(node, table, cache)) == 1
+
+            self.last_table = table
+            self.last_results = results
+            return results
+
+
+    def get_matches(self, user_id, table):
+        """Returns the market pairs matching each rule of a user.
+
+        Args:
+            user_id (str): The user owning the rules.
+            table (SignalTable): The latest signals of all market pairs.
+
+        Returns:
+            list: A list of (expression, [(exchange, market_pair), ...]) tuples.
+        """
+
+        with self.lock:
+            results = self.evaluate(table)
+            matches = list()
+
+            for expression, node in self.user_rules.get(user_id, list()):
+                rows = np.flatnonzero(results[node])
+                matches.append((expression, [table.rows[row] for row in rows]))
+
+        return matches
+
+
+    def _get_names(self, node):
+        if node[0] == 'var':
+            return {node[1]}
+        if node[0] == 'num':
+            return set()
+
+        names = set()
+        for child in node[1:]:
+            if isinstance(child, tuple):
+                names |= self._get_names(child)
+        return names
+
+
+    def _intern(self, node):
+        if node[0] in ('num', 'var'):
+            return self.nodes.setdefault(node, node)
+
+        children = tuple(
+            self._intern(child) if isinstance(child, tuple) else child for child in node[1:]
+        )
+        node = (node[0],) + children
+        return self.nodes.setdefault(node, node)
+
+
+    def _collect_nodes(self):
+        self.nodes = dict()
+        for rules in self.user_rules.values():
+            for _, node in rules:
+                self._intern(node)
+        self.last_table = None
+
+
+    def _evaluate_node(self, node, table, cache):
+        if node in cache:
+            return cache[node]
+
+        kind = node[0]
+        if kind == 'num':
+            value = np.full(len(table.rows), node[1])
+        elif kind == 'var':
+            value = table.column(node[1])
+        elif kind == 'cmp':
+            left = self._evaluate_node(node[2], table, cache)
+            right = self._evaluate_node(node[3], table, cache)
+            value = np.where(
+                np.isnan(left) | np.isnan(right), np.nan, COMPARISONS[node[1]](left, right)
+            )
+        elif kind == 'bin':
+            value = ARITHMETIC[node[1]](
+                self._evaluate_node(node[2], table, cache),
+                self._evaluate_node(node[3], table, cache)
+            )
+        elif kind == 'and':
+            #False wins over unknown, unknown over true
+            left = self._as_truth(self._evaluate_node(node[1], table, cache))
+            right = self._as_truth(self._evaluate_node(node[2], table, cache))
+            value = np.minimum(left, right)
+            value[(left == 0) | (right == 0)] = 0
+        elif kind == 'or':
+            #True wins over unknown, unknown over false
+            left = self._as_truth(self._evaluate_node(node[1], table, cache))
+            right = self._as_truth(self._evaluate_node(node[2], table, cache))
+            value = np.maximum(left, right)
+            value[(left == 1) | (right == 1)] = 1
+        else:
+            value = 1 - self._as_truth(self._evaluate_node(node[1], table, cache))
+
+        cache[node] = value
+        return value
+
+
+    def _as_truth(self, values):
+        """Maps values to 1 for true, 0 for false and NaN for unknown."""
+
+        return np.where(np.isnan(values), np.nan, values != 0)
@@ -0,0 +1,264 @@
+"""Decides when each user is notified after new analysis results are published
+"""
+
+import math
+import threading
+import time
+
+import structlog
+
+
+class TimerWheel():
+    """Hierarchical timing wheel grouping the users due in the same slot.
+
+    The first level has `slots` slots of `resolution` seconds, each next level has slots as
+    wide as a whole turn of the previous one. Users due far ahead wait in a wide slot and move
+    down a level when that slot begins, so adding a user and firing a slot don't depend on
+    how many users are waiting.
+    """
+
+    def __init__(self, resolution=1, slots=64, levels=4, now=None):
+        """Initializes TimerWheel class
+
+        Args:
+            resolution (float, optional): Defaults to 1. Seconds of a slot of the first level.
+            slots (int, optional): Defaults to 64. Slots of each level.
+            levels (int, optional): Defaults to 4. Users due after slots ** levels slots wait
+                in the last slot of the top level.
+            now (float, optional): Current timestamp in seconds, defaults to time.time().
+        """
+
+        if now is None:
+            now = time.time()
+
+        self.resolution = resolution
+        self.slots = slots
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.entries = dict()
+        self.current = int(now // resolution)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __contains__(self, user_id):
+        return user_id in self.entries
+
+
+    def add(self, user_id, due):
+        """Adds a user, or moves it if it is already waiting.
+
+        Args:
+            user_id (str): The user to add.
+            due (float): Timestamp in seconds when the user is due, past ones fire in the next
+                slot.
+        """
+
+        self.discard(user_id)
+        self._place(user_id, max(int(math.ceil(due / self.resolution)), self.current + 1))
+
+
+    def discard(self, user_id):
+        """Removes a user if it is waiting."""
+
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            _, level, slot = entry
+            self.wheels[level][slot].discard(user_id)
+
+
+    def advance(self, now=None):
+        """Moves the wheel up to now and returns the users of every slot passed.
+
+        Args:
+            now (float, optional): Current timestamp in seconds, defaults to time.time().
+
+        Returns:
+            list: A list with the user ids of each slot passed, empty slots are left out.
+        """
+
+        if now is None:
+            now = time.time()
+
+        target = int(now // self.resolution)
+        batches = list()
+
+        while self.current < target:
+            self.current += 1
+
+            #Slots of upper levels beginning now move their users closer, top level first
+            for level in range(len(self.wheels) - 1, 0, -1):
+                width = self.slots ** level
+                if self.current % width == 0:
+                    slot = (self.current // width) % self.slots
+                    users, self.wheels[level][slot] = self.wheels[level][slot], set()
+                    for user_id in users:
+                        self._place(user_id, self.entries.pop(user_id)[0])
+
+            slot = self.current % self.slots
+            users, self.wheels[0][slot] = self.wheels[0][slot], set()
+            for user_id in users:
+                del self.entries[user_id]
+
+            if users:
+                batches.append(list(users))
+
+        return batches
+
+
+    def get_backlog(self):
+        """Returns the amount of users waiting in each slot.
+
+        Returns:
+            dict: A dictionary (level, slot) -> amount of users, empty slots are left out.
+        """
+
+        return {
+            (level, slot): len(users)
+            for level, wheel in enumerate(self.wheels)
+            for slot, users in enumerate(wheel) if users
+        }
+
+
+    def _place(self, user_id, due_tick):
+        # Users beyond the top level wait in its last slot and are placed again from there
+        delta = min(due_tick - self.current, self.slots ** len(self.wheels) - 1)
+
+        level = 0
+        while delta >= self.slots ** (level + 1):
+            level += 1
+
+        slot = ((self.current + delta) // self.slots ** level) % self.slots
+        self.wheels[level][slot].add(user_id)
+        self.entries[user_id] = (due_tick, level, slot)
+
+
+class NotificationScheduler():
+    """Wakes the notification of the users affected by new results.
+
+    The timeout of a user is the minimum spacing between two of its notifications. The alerts
+    of every analysis published within that window stay unread in the ResultsPublisher until
+    the next notification, which reads them all at once, so the window also works as a digest
+    window.
+
+    Waiting users are kept in a timer wheel, a single periodic tick fires the users of every
+    slot due as one batch.
+    """
+
+    def __init__(self, notify, resolution=1, slots=64, levels=4):
+        """Initializes NotificationScheduler class
+
+        Args:
+            notify (callable): Called with the list of user ids due in a slot, from tick.
+            resolution (float, optional): Defaults to 1. Seconds between two ticks, users are
+                notified up to this late.
+            slots (int, optional): Defaults to 64. Slots of each level of the timer wheel.
+            levels (int, optional): Defaults to 4. Levels of the timer wheel.
+        """
+
+        self.logger = structlog.get_logger()
+        self.notify = notify
+        self.resolution = resolution
+        self.spacings = dict()
+        self.last_notified = dict()
+        self.wheel = TimerWheel(resolution, slots, levels)
+        self.lock = threading.Lock()
+
+
+    def set_spacing(self, user_id, spacing):
+        """Enables the notifications of a user.
+
+        Setting the same spacing again changes nothing, a waiting user with a new spacing
+        is moved to its new slot.
+
+        Args:
+            user_id (str): The user to notify.
+            spacing (int): Minimum amount of seconds between two notifications.
+        """
+
+        with self.lock:
+            if self.spacings.get(user_id) == spacing:
+                return
+
+            self.spacings[user_id] = spacing
+            if user_id in self.wheel:
+                self.wheel.add(user_id, self.last_notified.get(user_id, 0) + spacing)
+
+
+    def remove_user(self, user_id):
+        """Disables the notifications of a user.
+
+        Args:
+            user_id (str): The user to stop notifying.
+
+        Returns:
+            bool: False if the notifications of the user were not enabled.
+        """
+
+        with self.lock:
+            self.wheel.discard(user_id)
+            self.last_notified.pop(user_id, None)
+            return self.spacings.pop(user_id, None) is not None
+
+
+    def is_enabled(self, user_id):
+        """Returns whether the notifications of a user are enabled."""
+
+        return user_id in self.spacings
+
+
+    def wake(self, user_ids, now=None):
+        """Schedules the notification of users with new results.
+
+        Users already waiting for their notification are left as they are, it will read
+        the latest results when it runs.
+
+        Args:
+            user_ids (iterable): The users with new results.
+            now (float, optional): Current timestamp in seconds, defaults to time.time().
+        """
+
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            for user_id in user_ids:
+                if user_id not in self.spacings or user_id in self.wheel:
+                    continue
+
+                due = self.last_notified.get(user_id, 0) + self.spacings[user_id]
+                self.wheel.add(user_id, max(due, now))
+
+
+    def tick(self, now=None):
+        """Notifies the users of the slots due, one call of notify per slot.
+
+        Args:
+            now (float, optional): Current timestamp in seconds, defaults to time.time().
+        """
+
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            batches = self.wheel.advance(now)
+            for user_ids in batches:
+                for user_id in user_ids:
+                    self.last_notified[user_id] = now
+            waiting = len(self.wheel)
+
+        for user_ids in batches:
+            self.logger.info('Notifying %d users, %d waiting for later slots', len(user_ids), waiting)
+            self.notify(user_ids)
+
+
+    def get_backlog(self):
+        """Returns the amount of users waiting in each slot of the timer wheel.
+
+        Returns:
+            dict: A dictionary (level, slot) -> amount of users, empty slots are left out.
+        """
+
+        with self.lock:
+            return self.wheel.get_backlog()
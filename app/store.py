@@ -0,0 +1,123 @@
+"""Alert statuses and pending notifications kept in SQLite, so they survive restarts
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import structlog
+
+
+class NotificationStore():
+    """SQLite database in WAL mode holding the last status of every indicator and the outbox.
+
+    Statuses are read from an in-memory mirror loaded on start and written in one transaction
+    per update. WAL mode lets several processes share the database while one of them writes.
+    """
+
+    def __init__(self, path, timeout=30):
+        """Initializes NotificationStore class
+
+        Args:
+            path (str): The database file, created if it doesn't exist.
+            timeout (int, optional): Defaults to 30. Seconds to wait for another process
+                writing the database.
+        """
+
+        self.logger = structlog.get_logger()
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS alert_status ('
+                'exchange TEXT, market_pair TEXT, indicator_type TEXT, indicator TEXT, idx INTEGER, '
+                'status TEXT, updated REAL, '
+                'PRIMARY KEY (exchange, market_pair, indicator_type, indicator, idx))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS outbox ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT, payload TEXT, created REAL)'
+            )
+
+        self.statuses = dict()
+        for row in self.connection.execute(
+                'SELECT exchange, market_pair, indicator_type, indicator, idx, status FROM alert_status'):
+            self.statuses[tuple(row[:5])] = row[5]
+
+        self.logger.info('Loaded %d alert statuses from %s', len(self.statuses), path)
+
+
+    def get_status(self, exchange, market_pair, indicator_type, indicator, index):
+        """Returns the last status of an indicator, an empty string if it is unknown."""
+
+        return self.statuses.get((exchange, market_pair, indicator_type, indicator, index), str())
+
+
+    def set_statuses(self, statuses):
+        """Stores the statuses of an update, only the changed ones are written.
+
+        Args:
+            statuses (list): A list of ((exchange, market_pair, indicator_type, indicator, index),
+                status) tuples.
+        """
+
+        changed = [(key, status) for key, status in statuses if self.statuses.get(key) != status]
+        if not changed:
+            return
+
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO alert_status VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [key + (status, now) for key, status in changed]
+            )
+
+            for key, status in changed:
+                self.statuses[key] = status
+
+        self.logger.debug('Stored %d changed alert statuses', len(changed))
+
+
+    def add_delivery(self, chat_id, payload):
+        """Stores a pending delivery.
+
+        Args:
+            chat_id (str): The chat receiving the delivery.
+            payload (dict): What is needed to send the delivery again, serialized as json.
+
+        Returns:
+            int: The id of the stored delivery.
+        """
+
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO outbox (chat_id, payload, created) VALUES (?, ?, ?)',
+                (str(chat_id), json.dumps(payload), time.time())
+            )
+            return cursor.lastrowid
+
+
+    def remove_delivery(self, delivery_id):
+        """Removes a delivery once it was sent or given up."""
+
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM outbox WHERE id = ?', (delivery_id,))
+
+
+    def get_deliveries(self):
+        """Returns the pending deliveries, oldest first.
+
+        Returns:
+            list: A list of (id, chat_id, payload) tuples.
+        """
+
+        with self.lock:
+            rows = self.connection.execute('SELECT id, chat_id, payload FROM outbox ORDER BY id').fetchall()
+
+        return [(delivery_id, chat_id, json.loads(payload)) for delivery_id, chat_id, payload in rows]
@@ -0,0 +1,110 @@
+"""Inverted index of the signals every chat is subscribed to
+"""
+
+import threading
+
+import structlog
+
+
+class SubscriptionIndex():
+    """Maps each (exchange, market_pair, indicator, candle_period) key to the subscribed users.
+
+    Users are updated incrementally: only the keys added or removed since their previous
+    subscriptions are touched, so finding who receives an alert is a single lookup no matter
+    how many users there are.
+    """
+
+    def __init__(self):
+        """Initializes SubscriptionIndex class
+        """
+
+        self.logger = structlog.get_logger()
+        self.subscribers = dict()
+        self.user_keys = dict()
+        self.listeners = list()
+        self.lock = threading.Lock()
+
+
+    def add_listener(self, listener):
+        """Registers a function called as listener(added, removed) with the keys of each change."""
+
+        self.listeners.append(listener)
+
+
+    def update_user(self, user_id, exchanges, market_data, user_indicators):
+        """Replaces the subscriptions of a user.
+
+        Args:
+            user_id (str): The user to update.
+            exchanges (list): The exchanges enabled by the user.
+            market_data (dict): The market pairs of the user per exchange.
+            user_indicators (dict): The enabled candle periods of the user per indicator.
+        """
+
+        keys = set()
+        for exchange in exchanges:
+            for market_pair in market_data.get(exchange, dict()):
+                for indicator, candle_periods in user_indicators.items():
+                    for candle_period in candle_periods:
+                        keys.add((exchange, market_pair, indicator, candle_period))
+
+        with self.lock:
+            old_keys = self.user_keys.get(user_id, set())
+
+            for key in old_keys - keys:
+                self._unsubscribe(key, user_id)
+
+            for key in keys - old_keys:
+                self.subscribers.setdefault(key, set()).add(user_id)
+
+            self.user_keys[user_id] = keys
+
+            #Called in the lock, so listeners see the changes of a user in order
+            for listener in self.listeners:
+                listener(keys - old_keys, old_keys - keys)
+
+        self.logger.debug('User %s subscribed to %d signals, %d added and %d removed',
+                          user_id, len(keys), len(keys - old_keys), len(old_keys - keys))
+
+
+    def remove_user(self, user_id):
+        """Removes every subscription of a user.
+
+        Args:
+            user_id (str): The user to remove.
+        """
+
+        with self.lock:
+            old_keys = self.user_keys.pop(user_id, set())
+            for key in old_keys:
+                self._unsubscribe(key, user_id)
+
+            for listener in self.listeners:
+                listener(set(), old_keys)
+
+
+    def get_subscribers(self, exchange, market_pair, indicator, candle_period):
+        """Returns the users subscribed to a signal.
+
+        Args:
+            exchange (str): The exchange of the signal.
+            market_pair (str): The market pair of the signal.
+            indicator (str): The indicator producing the signal.
+            candle_period (str): The candle period of the signal.
+
+        Returns:
+            frozenset: The subscribed user ids.
+        """
+
+        with self.lock:
+            return frozenset(self.subscribers.get((exchange, market_pair, indicator, candle_period), ()))
+
+
+    def _unsubscribe(self, key, user_id):
+        users = self.subscribers.get(key)
+        if users is None:
+            return
+
+        users.discard(user_id)
+        if not users:
+            del self.subscribers[key]
@@ -0,0 +1,111 @@
+"""Compiled message templates and market formatting shared by every notifier
+"""
+
+import hashlib
+import threading
+
+import structlog
+from jinja2 import Environment, FileSystemBytecodeCache, FunctionLoader
+
+
+class TemplateRegistry():
+    """Compiles each message template once and keeps the formatting context of each market.
+
+    Templates are registered by their source, so the same template configured for several
+    notifiers or users is compiled a single time. Compiled bytecode is also kept on disk and
+    reused after a restart.
+    """
+
+    def __init__(self, bytecode_directory=None, cache_size=400):
+        """Initializes TemplateRegistry class
+
+        Args:
+            bytecode_directory (str, optional): Defaults to the system temporary directory.
+                Where the compiled templates are stored.
+            cache_size (int, optional): Defaults to 400. Amount of compiled templates kept in
+                memory.
+        """
+
+        self.logger = structlog.get_logger()
+        self.sources = dict()
+        self.market_contexts = dict()
+        self.lock = threading.Lock()
+
+        self.environment = Environment(
+            loader=FunctionLoader(self._load_source),
+            bytecode_cache=FileSystemBytecodeCache(bytecode_directory),
+            cache_size=cache_size
+        )
+
+
+    def get_template(self, source):
+        """Returns the compiled template of a source.
+
+        Args:
+            source (str): A Jinja formatted message template.
+
+        Returns:
+            jinja2.Template: The compiled template.
+        """
+
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        with self.lock:
+            if name not in self.sources:
+                self.sources[name] = source
+                self.logger.debug('Registered template %s', name)
+
+        return self.environment.get_template(name)
+
+
+    def get_market_context(self, exchange, market_pair, market=None):
+        """Returns the values used to render the messages of a market.
+
+        Contexts are kept per price precision, so a market whose precision changes gets a
+        new one.
+
+        Args:
+            exchange (str): The exchange of the market.
+            market_pair (str): The market pair, i.e. BTC/USDT.
+            market (dict, optional): The market data of the pair, with its precision.
+
+        Returns:
+            dict: The base_currency, quote_currency and format_price function of the market.
+        """
+
+        precision = None
+        if market is not None:
+            precision = market['precision']['price']
+
+        key = (exchange, market_pair, precision)
+        context = self.market_contexts.get(key)
+        if context is None:
+            base_currency, quote_currency = market_pair.split('/')
+            price_format = '{{:.{}f}}'.format(precision) if precision is not None else '{}'
+
+            context = {
+                'base_currency': base_currency,
+                'quote_currency': quote_currency,
+                'format_price': price_format.format
+            }
+            self.market_contexts[key] = context
+
+        return context
+
+
+    def clear_market_contexts(self):
+        """Drops the market contexts, after the markets were reloaded."""
+
+        self.market_contexts = dict()
+
+
+    def _load_source(self, name):
+        source = self.sources.get(name)
+        if source is None:
+            return None
+
+        # Sources never change for a name, it is the hash of the source
+        return source, None, lambda: True
+
+
+#Shared by all the notifiers and behaviours of the process
+template_registry = TemplateRegistry()
@@ -0,0 +1,121 @@
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tulipy')
+
+from charts import DEFAULT_PROFILE, ChartCache, ChartPool, _load_renderer, get_candles_date
+
+
+CANDLES = [[1514764800000 + hour * 3600000, 1, 2, 0.5, 1.5, 10] for hour in range(30)]
+
+
+def get_job(pool, candles=CANDLES, market_pair='ETH/BTC'):
+    return pool.create_job('binance', market_pair, '1h', candles, {'0.618': 1.2},
+                           get_candles_date(candles), DEFAULT_PROFILE)
+
+
+def test_version_follows_the_data(tmpdir):
+    pool = ChartPool(workers=0, chart_cache=ChartCache(str(tmpdir)))
+
+    first = get_job(pool)
+    assert get_job(pool)['version'] == first['version']
+    assert get_job(pool, CANDLES[:-1])['version'] != first['version']
+    assert get_job(pool, market_pair='XRP/BTC')['version'] != first['version']
+
+
+def test_title_date_is_the_last_candle():
+    assert get_candles_date(CANDLES) == '2018-01-02 05:00:00'
+    assert get_candles_date(CANDLES, 'America/Mexico_City') == '2018-01-01 23:00:00'
+    assert get_candles_date([]) == ''
+
+
+def test_eviction_drops_the_latest_entries(tmpdir):
+    cache = ChartCache(str(tmpdir), max_files=2)
+    pool = ChartPool(workers=0, chart_cache=cache)
+
+    jobs = [get_job(pool, market_pair=market_pair) for market_pair in ('ETH/BTC', 'XRP/BTC', 'LTC/BTC')]
+    for job in jobs:
+        cache.store(job, b'image')
+
+    assert not os.path.exists(jobs[0]['chart_file'])
+    assert cache.get_latest('binance', 'ETH/BTC', '1h', DEFAULT_PROFILE['name']) is None
+    assert len(cache.latest) == 2
+    assert cache.get_latest('binance', 'LTC/BTC', '1h', DEFAULT_PROFILE['name']) == jobs[2]['version']
+    assert cache.get_image(jobs[2]['version']) == b'image'
+
+
+def test_cached_version_is_not_rendered_again(tmpdir):
+    cache = ChartCache(str(tmpdir))
+    pool = ChartPool(workers=0, chart_cache=cache)
+
+    job = get_job(pool)
+    cache.store(job, b'image')
+
+    # A renderer is only needed for versions missing from the cache
+    assert pool.submit(get_job(pool)).result() == job['version']
+    assert cache.get_image(job['version']) == b'image'
+
+
+def test_chats_wait_for_the_first_upload(tmpdir):
+    cache = ChartCache(str(tmpdir))
+    job = get_job(ChartPool(workers=0, chart_cache=cache))
+    cache.store(job, b'image')
+
+    photo, uploading = cache.get_photo(job['version'])
+    assert uploading and photo.read() == b'image'
+
+    photos = list()
+    waiting = threading.Thread(target=lambda: photos.append(cache.get_photo(job['version'])))
+    waiting.start()
+    cache.set_file_id(job['version'], 'file-id')
+    waiting.join(5)
+
+    assert photos == [('file-id', False)]
+    assert cache.get_photo(job['version']) == ('file-id', False)
+
+
+def test_failed_upload_is_taken_over(tmpdir):
+    cache = ChartCache(str(tmpdir))
+    job = get_job(ChartPool(workers=0, chart_cache=cache))
+    cache.store(job, b'image')
+
+    cache.get_photo(job['version'])
+    photo, uploading = cache.get_photo(job['version'], wait=0.1)
+
+    assert uploading and photo.read() == b'image'
+    # A retry of the same upload doesn't wait for itself
+    assert cache.get_photo(job['version'], uploading=True, wait=5)[1]
+
+
+def test_senders_wait_for_the_render(tmpdir):
+    cache = ChartCache(str(tmpdir))
+    pool = ChartPool(workers=0, chart_cache=cache)
+    old_job, new_job = get_job(pool, CANDLES[:-1]), get_job(pool)
+    cache.store(old_job, b'old')
+
+    render = concurrent.futures.Future()
+    cache.set_render('binance', 'ETH/BTC', '1h', DEFAULT_PROFILE['name'], render)
+    assert cache.has_chart('binance', 'XRP/BTC', '1h') is False
+    assert cache.has_chart('binance', 'ETH/BTC', '1h') is True
+
+    def finish_render():
+        cache.store(new_job, b'new')
+        render.set_result(new_job['version'])
+
+    threading.Timer(0.1, finish_render).start()
+
+    assert cache.wait_latest('binance', 'ETH/BTC', '1h', timeout=5) == new_job['version']
+    assert cache.renders == dict()
+
+
+def test_worker_processes_load_the_renderer(tmpdir):
+    pool = ChartPool(workers=1, chart_cache=ChartCache(str(tmpdir)))
+
+    try:
+        assert pool.executor.submit(_load_renderer).result(timeout=60) is None
+    finally:
+        pool.shutdown()
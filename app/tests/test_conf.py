@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('ccxt')
+pytest.importorskip('yaml')
+
+from conf import ConfigOverlay
+
+
+def get_base():
+    return SimpleNamespace(
+        settings={'timeout': 3600, 'market_pairs': ['ETH/BTC']},
+        indicators={'rsi': [{'candle_period': '1h', 'enabled': True}, {'candle_period': '4h', 'enabled': False}]}
+    )
+
+
+def test_reads_fall_back_to_the_shared_config():
+    base = get_base()
+    overlay = ConfigOverlay(base)
+    changes = list()
+    overlay.add_listener(lambda key, value: changes.append((key, value)))
+
+    overlay.set('timeout', 600)
+    assert overlay.get('timeout') == 600
+    assert overlay.get('market_pairs') == ['ETH/BTC']
+    assert base.settings['timeout'] == 3600
+
+    # Back to the shared value, the override is dropped
+    overlay.set('timeout', 3600)
+    overlay.set('timeout', 3600)
+    assert overlay.overrides == dict()
+    assert changes == [('timeout', 600), ('timeout', None)]
+
+
+def test_indicator_periods():
+    base = get_base()
+    overlay = ConfigOverlay(base)
+
+    overlay.set_indicator('rsi', '4h', True)
+    assert overlay.get_indicators() == {'rsi': ['1h', '4h']}
+    assert ConfigOverlay(base).get_indicators() == {'rsi': ['1h']}
+
+    overlay.set_indicator('rsi', '4h', False)
+    assert overlay.overrides == dict()
+
+    with pytest.raises(KeyError):
+        overlay.set_indicator('macd', '1h', True)
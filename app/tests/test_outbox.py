@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+telegram = pytest.importorskip('telegram')
+
+from outbox import Delivery, NotificationOutbox
+
+
+class Recorder():
+    """Creates send functions recording when they were called."""
+
+    def __init__(self, expected):
+        self.sent = list()
+        self.expected = expected
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def send(self, name, retry_after=None):
+        state = {'retried': retry_after is None}
+
+        def _send():
+            with self.lock:
+                self.sent.append((name, time.time()))
+            if not state['retried']:
+                state['retried'] = True
+                raise telegram.error.RetryAfter(retry_after)
+            if len(self.sent) >= self.expected:
+                self.done.set()
+        return _send
+
+
+def test_retry_after_keeps_chat_order():
+    recorder = Recorder(expected=5)
+    outbox = NotificationOutbox(workers=2, global_rate=100, chat_rate=100)
+
+    try:
+        outbox.submit(Delivery(1, recorder.send('first', retry_after=0.3)))
+        outbox.submit(Delivery(1, recorder.send('second')))
+        outbox.submit(Delivery(2, recorder.send('other')))
+        outbox.submit(Delivery(1, recorder.send('third')))
+
+        assert recorder.done.wait(5)
+    finally:
+        outbox.stop()
+
+    names = [name for name, _ in recorder.sent]
+    assert [name for name in names if name != 'other'] == ['first', 'first', 'second', 'third']
+
+    # The other chat doesn't wait for the retry
+    assert names.index('other') < 2
+
+    first_sends = [sent_at for name, sent_at in recorder.sent if name == 'first']
+    assert first_sends[1] - first_sends[0] >= 0.3
@@ -0,0 +1,37 @@
+from planner import AnalysisPlanner
+
+
+def test_counts_follow_subscriptions():
+    planner = AnalysisPlanner()
+    key = ('binance', 'ETH/BTC', 'rsi', '1h')
+
+    planner.update({key}, set())
+    planner.update({key, ('binance', 'ETH/BTC', 'macd', '4h')}, set())
+    assert planner.get_plan('binance') == {'ETH/BTC': frozenset({('rsi', '1h'), ('macd', '4h')})}
+
+    planner.update(set(), {key})
+    assert ('rsi', '1h') in planner.get_plan('binance')['ETH/BTC']
+
+    planner.update(set(), {key})
+    assert planner.get_plan('binance') == {'ETH/BTC': frozenset({('macd', '4h')})}
+
+
+def test_unwatched_market_pairs_leave_the_plan():
+    planner = AnalysisPlanner()
+    key = ('binance', 'ETH/BTC', 'rsi', '1h')
+
+    planner.update({key}, set())
+    planner.update(set(), {key})
+
+    assert planner.get_plan('binance') == dict()
+    assert planner.get_exchanges() == list()
+
+
+def test_removing_unknown_keys_is_ignored():
+    planner = AnalysisPlanner()
+    planner.update({('binance', 'ETH/BTC', 'rsi', '1h')}, set())
+
+    planner.update(set(), {('binance', 'ETH/BTC', 'rsi', '4h'), ('bittrex', 'ETH/BTC', 'rsi', '1h')})
+
+    assert planner.get_plan('binance') == {'ETH/BTC': frozenset({('rsi', '1h')})}
+    assert planner.get_exchanges() == ['binance']
@@ -0,0 +1,58 @@
+from results import Alert, ResultsPublisher
+from subscriptions import SubscriptionIndex
+
+
+def get_alert(market_pair, status):
+    return Alert('binance', market_pair, 'indicators', 'rsi', 0, '1h', status, '{} is {}'.format(market_pair, status), dict())
+
+
+def get_publisher():
+    subscriptions = SubscriptionIndex()
+    subscriptions.update_user('usr_1', ['binance'], {'binance': {'ETH/BTC': {}, 'XRP/BTC': {}}}, {'rsi': ['1h']})
+    subscriptions.update_user('usr_2', ['binance'], {'binance': {'XRP/BTC': {}}}, {'rsi': ['1h']})
+    return ResultsPublisher(subscriptions)
+
+
+def test_publishes_within_one_window_are_all_read():
+    publisher = get_publisher()
+
+    publisher.publish('binance', [get_alert('ETH/BTC', 'hot')])
+    publisher.publish('binance', [get_alert('XRP/BTC', 'cold')])
+
+    view = publisher.get_view('usr_1')
+    assert [alert.message for alert in view.get_alerts()] == ['ETH/BTC is hot', 'XRP/BTC is cold']
+    assert view.get_messages() == {'binance': {'ETH/BTC': {'1h': ['ETH/BTC is hot']}, 'XRP/BTC': {'1h': ['XRP/BTC is cold']}}}
+
+    # Read alerts are not returned again
+    assert publisher.get_view('usr_1').get_alerts() == list()
+    assert [alert.message for alert in publisher.get_view('usr_2').get_alerts()] == ['XRP/BTC is cold']
+
+
+def test_snapshot_keeps_only_the_last_publish():
+    publisher = get_publisher()
+
+    publisher.publish('binance', [get_alert('ETH/BTC', 'hot')])
+    snapshot = publisher.publish('binance', [get_alert('XRP/BTC', 'cold')])
+
+    assert snapshot.version == 2
+    assert sorted(snapshot.user_alerts['binance']) == ['usr_1', 'usr_2']
+    assert [alert.market_pair for alert in snapshot.alerts['binance']] == ['XRP/BTC']
+
+
+def test_unread_alerts_are_bounded():
+    publisher = get_publisher()
+    publisher.max_unread = 2
+
+    for status in ('hot', 'cold', 'hot'):
+        publisher.publish('binance', [get_alert('ETH/BTC', status)])
+
+    assert [alert.status for alert in publisher.get_view('usr_1').get_alerts()] == ['cold', 'hot']
+
+
+def test_discard():
+    publisher = get_publisher()
+    publisher.publish('binance', [get_alert('ETH/BTC', 'hot')])
+
+    publisher.discard('usr_1')
+
+    assert publisher.get_view('usr_1').get_alerts() == list()
@@ -0,0 +1,103 @@
+import pytest
+
+from rules import RuleEngine, RuleParser, SignalTable, get_signal_names
+
+
+SIGNALS = get_signal_names(
+    {'rsi': [{'signal': ['rsi'], 'candle_period': '1h'}]},
+    {'vwap': [{'signal': ['vwap'], 'candle_period': '1h'}], 'ohlcv': [{'signal': ['close'], 'candle_period': '1d'}]}
+)
+
+
+def get_table():
+    return SignalTable({
+        'binance': {
+            'ETH/BTC': {'rsi_1h': 20, 'close': 1, 'vwap_1h': 2},
+            'XRP/BTC': {'close': 3, 'vwap_1h': 2},
+            'LTC/BTC': {'rsi_1h': 50, 'close': 1, 'vwap_1h': 2}
+        }
+    })
+
+
+def test_parse_precedence():
+    node = RuleParser().parse('rsi_1h < 30 or close > vwap_1h and not close > 2 * vwap_1h')
+
+    assert node[0] == 'or'
+    assert node[1] == ('cmp', '<', ('var', 'rsi_1h'), ('num', 30.0))
+    assert node[2][0] == 'and'
+    assert node[2][2] == ('not', ('cmp', '>', ('var', 'close'), ('bin', '*', ('num', 2.0), ('var', 'vwap_1h'))))
+
+
+@pytest.mark.parametrize('expression', ['', 'rsi_1h', 'rsi_1h <', '(rsi_1h < 30', 'rsi_1h < 30 30', 'rsi_1h # 30'])
+def test_parse_invalid(expression):
+    with pytest.raises(ValueError):
+        RuleParser().parse(expression)
+
+
+def test_signal_names():
+    assert {'rsi_1h', 'vwap_1h', 'close', 'close_1d', 'volume_1d'} <= SIGNALS
+    assert 'rsi_4h' not in SIGNALS
+
+
+def test_add_rule_rejects_unknown_signal():
+    engine = RuleEngine(SIGNALS)
+
+    with pytest.raises(ValueError):
+        engine.add_rule('usr_1', 'rsi_4h < 30')
+    assert engine.get_rules('usr_1') == list()
+
+
+def test_shared_rules_are_interned():
+    engine = RuleEngine(SIGNALS)
+
+    first = engine.add_rule('usr_1', 'rsi_1h < 30')
+    second = engine.add_rule('usr_2', 'RSI_1H < 30')
+
+    assert first is second
+    assert engine.get_users() == ['usr_1', 'usr_2']
+
+
+def test_matches():
+    engine = RuleEngine(SIGNALS)
+    engine.add_rule('usr_1', 'rsi_1h < 30 or close > vwap_1h')
+    engine.add_rule('usr_1', 'rsi_1h < 30 and close < vwap_1h')
+
+    matches = engine.get_matches('usr_1', get_table())
+
+    assert matches[0][1] == [('binance', 'ETH/BTC'), ('binance', 'XRP/BTC')]
+    assert matches[1][1] == [('binance', 'ETH/BTC')]
+
+
+def test_missing_signal_never_matches():
+    engine = RuleEngine(SIGNALS)
+    engine.add_rule('usr_1', 'not rsi_1h < 30')
+    engine.add_rule('usr_1', 'not (rsi_1h < 30 and close > vwap_1h)')
+    engine.add_rule('usr_1', 'not (rsi_1h < 30 and close < vwap_1h)')
+
+    matches = engine.get_matches('usr_1', get_table())
+
+    assert matches[0][1] == [('binance', 'LTC/BTC')]
+    assert matches[1][1] == [('binance', 'ETH/BTC'), ('binance', 'LTC/BTC')]
+    # A false condition decides the and, even with a missing signal
+    assert matches[2][1] == [('binance', 'XRP/BTC'), ('binance', 'LTC/BTC')]
+
+
+def test_remove_rule():
+    engine = RuleEngine(SIGNALS)
+    engine.add_rule('usr_1', 'rsi_1h < 30')
+
+    engine.remove_rule('usr_1', 0)
+
+    assert engine.get_users() == list()
+    with pytest.raises(IndexError):
+        engine.remove_rule('usr_1', 0)
+
+
+def test_signals_of_a_user():
+    engine = RuleEngine(SIGNALS)
+    engine.add_rule('usr_1', 'rsi_1h < 30 and close > vwap_1h')
+    engine.add_rule('usr_1', 'not rsi_1h > 70')
+    engine.add_rule('usr_2', 'close_1d > 2')
+
+    assert engine.get_signals('usr_1') == {'rsi_1h', 'close', 'vwap_1h'}
+    assert engine.get_signals('usr_3') == set()
@@ -0,0 +1,76 @@
+from scheduling import NotificationScheduler, TimerWheel
+
+
+def test_fires_in_due_slot():
+    wheel = TimerWheel(resolution=1, slots=4, levels=3, now=0)
+    wheel.add('usr_1', 2)
+    wheel.add('usr_2', 2)
+    wheel.add('usr_3', 3)
+
+    assert wheel.advance(1) == list()
+    assert sorted(wheel.advance(2)[0]) == ['usr_1', 'usr_2']
+    assert wheel.advance(3) == [['usr_3']]
+    assert len(wheel) == 0
+
+
+def test_cascade_to_lower_levels():
+    wheel = TimerWheel(resolution=1, slots=4, levels=3, now=0)
+    wheel.add('usr_1', 37)
+
+    # 37 ticks away waits in the second level, 4 * 4 ticks per slot
+    assert list(wheel.get_backlog()) == [(2, 2)]
+
+    assert wheel.advance(36) == list()
+    assert 'usr_1' in wheel
+    assert list(wheel.get_backlog()) == [(0, 1)]
+
+    assert wheel.advance(37) == [['usr_1']]
+    assert 'usr_1' not in wheel
+
+
+def test_beyond_top_level_waits_in_last_slot():
+    wheel = TimerWheel(resolution=1, slots=4, levels=2, now=0)
+    wheel.add('usr_1', 100)
+
+    batches = list()
+    for now in range(1, 101):
+        batches.extend(wheel.advance(now))
+        if batches:
+            assert now == 100
+    assert batches == [['usr_1']]
+
+
+def test_past_due_fires_on_next_slot():
+    wheel = TimerWheel(resolution=1, slots=4, levels=2, now=10)
+    wheel.add('usr_1', 5)
+
+    assert wheel.advance(11) == [['usr_1']]
+
+
+def test_discard_and_move():
+    wheel = TimerWheel(resolution=1, slots=4, levels=2, now=0)
+    wheel.add('usr_1', 2)
+    wheel.add('usr_2', 2)
+    wheel.discard('usr_2')
+    wheel.add('usr_1', 6)
+
+    assert wheel.advance(5) == list()
+    assert wheel.advance(6) == [['usr_1']]
+
+
+def test_scheduler_spacing():
+    notified = list()
+    scheduler = NotificationScheduler(notified.append, resolution=1, slots=4, levels=3)
+    scheduler.wheel = TimerWheel(1, 4, 3, now=999)
+    scheduler.set_spacing('usr_1', 10)
+
+    scheduler.wake(['usr_1', 'usr_2'], now=999)
+    scheduler.tick(now=1000)
+    assert notified == [['usr_1']]
+
+    # Results within the spacing wait until it is over
+    scheduler.wake(['usr_1'], now=1002)
+    scheduler.tick(now=1009)
+    assert notified == [['usr_1']]
+    scheduler.tick(now=1010)
+    assert notified == [['usr_1'], ['usr_1']]
@@ -0,0 +1,38 @@
+from store import NotificationStore
+
+
+KEY = ('binance', 'ETH/BTC', 'indicators', 'rsi', 0)
+
+
+def test_statuses_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'state.db')
+
+    store = NotificationStore(path)
+    assert store.get_status(*KEY) == ''
+    store.set_statuses([(KEY, 'hot')])
+    store.connection.close()
+
+    store = NotificationStore(path)
+    assert store.get_status(*KEY) == 'hot'
+
+
+def test_unchanged_statuses_are_not_written(tmp_path):
+    store = NotificationStore(str(tmp_path / 'state.db'))
+    store.set_statuses([(KEY, 'hot')])
+    store.connection.execute('DELETE FROM alert_status')
+
+    store.set_statuses([(KEY, 'hot')])
+    assert store.connection.execute('SELECT COUNT(*) FROM alert_status').fetchone()[0] == 0
+
+
+def test_pending_deliveries_are_kept_until_removed(tmp_path):
+    path = str(tmp_path / 'state.db')
+
+    store = NotificationStore(path)
+    first = store.add_delivery(1, {'text': 'first'})
+    store.add_delivery(2, {'text': 'second'})
+    store.remove_delivery(first)
+    store.connection.close()
+
+    deliveries = NotificationStore(path).get_deliveries()
+    assert [(chat_id, payload) for _, chat_id, payload in deliveries] == [('2', {'text': 'second'})]
@@ -0,0 +1,80 @@
+import base64
+import socketserver
+import threading
+
+import pytest
+
+from notifiers.transport import SMTPSession
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP to record what a client sends."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost ready')
+        for line in self.rfile:
+            command = line.decode().strip()
+            self.server.commands.append(command.split(' ')[0].upper())
+
+            if command.upper().startswith('EHLO'):
+                self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN')
+            elif command.upper().startswith('AUTH PLAIN'):
+                self.server.logins.append(base64.b64decode(command.split(' ')[2]).split(b'\0')[1:])
+                self.reply('235 authenticated')
+            elif command.upper() == 'DATA':
+                self.reply('354 go ahead')
+                data = list()
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    data.append(data_line)
+                self.server.messages.append(b''.join(data).decode())
+                self.reply('250 queued')
+            elif command.upper() == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.commands = list()
+    server.logins = list()
+    server.messages = list()
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_logs_in_when_the_server_offers_auth(smtp_server):
+    session = SMTPSession('127.0.0.1:{}'.format(smtp_server.server_address[1]), 'bot', 'secret', starttls=False)
+
+    session.sendmail('bot@example.com', 'user@example.com', 'Subject: alert\n\nfirst')
+    session.sendmail('bot@example.com', 'user@example.com', 'Subject: alert\n\nsecond')
+    session.close()
+
+    assert smtp_server.logins == [[b'bot', b'secret']]
+    # One connection for both messages
+    assert smtp_server.commands.count('EHLO') == 1
+    assert smtp_server.commands.count('DATA') == 2
+    assert 'first' in smtp_server.messages[0] and 'second' in smtp_server.messages[1]
+
+
+def test_no_login_without_credentials(smtp_server):
+    session = SMTPSession('127.0.0.1:{}'.format(smtp_server.server_address[1]), starttls=False)
+
+    session.sendmail('bot@example.com', 'user@example.com', 'Subject: alert\n\nhello')
+    session.close()
+
+    assert smtp_server.logins == list()
+    assert len(smtp_server.messages) == 1
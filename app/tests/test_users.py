@@ -0,0 +1,35 @@
+from users import UserRepository
+
+
+def test_overrides_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'users.db')
+
+    users = UserRepository(path)
+    users.set(1, 'timeout', 600, default=3600)
+    users.set(1, 'exchanges', ['binance'])
+    users.set(2, 'timeout', 600, default=3600)
+    users.connection.close()
+
+    users = UserRepository(path)
+    assert users.get(1) == {'timeout': 600, 'exchanges': ['binance']}
+    assert sorted(users.get_chats('timeout')) == ['1', '2']
+
+
+def test_global_value_removes_the_override():
+    users = UserRepository()
+    users.set(1, 'timeout', 600, default=3600)
+
+    users.set(1, 'timeout', 3600, default=3600)
+
+    assert users.get(1) == dict()
+    assert users.get_chats('timeout') == list()
+
+
+def test_stored_value_is_a_copy():
+    users = UserRepository()
+    exchanges = ['binance']
+    users.set(1, 'exchanges', exchanges)
+
+    exchanges.append('bittrex')
+
+    assert users.get(1)['exchanges'] == ['binance']
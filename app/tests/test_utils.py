@@ -0,0 +1,26 @@
+from notifiers.utils import NotifierUtils
+
+
+def test_chunks_keep_every_character():
+    message = 'short line\n' + 'x' * 25 + '\nlast line\n'
+
+    chunks = NotifierUtils().chunk_message(message, 10)
+
+    assert ''.join(chunks) == message
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert chunks[0] == 'short line'
+
+
+def test_chunks_keep_lines_whole():
+    message = 'first\nsecond\nthird\n'
+
+    assert NotifierUtils().chunk_message(message, 13) == ['first\nsecond\n', 'third\n']
+    assert NotifierUtils().chunk_message(message, 100) == [message]
+
+
+def test_pack_sections():
+    sections = ['aaa', 'bbb', 'c' * 12]
+
+    messages = NotifierUtils().pack_sections(sections, 10, separator='\n')
+
+    assert messages == ['aaa\nbbb', 'c' * 10, 'cc']
@@ -0,0 +1,31 @@
+from notifiers.webhook_client import WebhookNotifier
+
+
+def test_only_changed_signals_are_sent():
+    notifier = WebhookNotifier('http://localhost/signals', None, None)
+
+    records = notifier.get_signal_records('binance', {'ETH/BTC': {'rsi': 30, 'macd': float('nan')}})
+    assert [(record['signal'], record['value']) for record in records] == [('rsi', 30.0), ('macd', None)]
+
+    records = notifier.get_signal_records('binance', {'ETH/BTC': {'rsi': 30, 'macd': 0.5}})
+    assert [(record['signal'], record['value']) for record in records] == [('macd', 0.5)]
+    assert records[0]['seq'] == 3
+
+
+def test_refused_records_are_sent_again():
+    notifier = WebhookNotifier('http://localhost/signals', None, None, batch_size=2)
+    payloads = list()
+
+    def notify(message):
+        payloads.append(message)
+        return len(payloads) > 1
+
+    notifier.notify = notify
+
+    signals = {'ETH/BTC': {'rsi': 30}, 'XRP/BTC': {'rsi': 70}, 'LTC/BTC': {'rsi': 50}}
+    notifier.notify_signals(notifier.get_signal_records('binance', signals))
+    assert [len(payload) for payload in payloads] == [2, 1]
+
+    # The first payload was refused, its records are changes again
+    records = notifier.get_signal_records('binance', signals)
+    assert sorted(record['market'] for record in records) == ['ETH/BTC', 'XRP/BTC']
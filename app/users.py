@@ -0,0 +1,110 @@
+"""What every user changed from the global config, kept between restarts
+"""
+
+import json
+import sqlite3
+import threading
+
+import structlog
+
+
+class UserRepository():
+    """Stores the overrides of each chat over the global config in SQLite.
+
+    Only the settings a user changed are stored, one row per setting, and every command
+    writes just the setting it changed. The overrides of a chat are read the first time the
+    chat is used, so nothing is loaded on start.
+    """
+
+    def __init__(self, path=':memory:', timeout=30):
+        """Initializes UserRepository class
+
+        Args:
+            path (str, optional): Defaults to an in-memory database, lost on restart. The
+                database file, created if it doesn't exist.
+            timeout (int, optional): Defaults to 30. Seconds to wait for another process
+                writing the database.
+        """
+
+        self.logger = structlog.get_logger()
+        self.overrides = dict()
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS user_state ('
+                'chat_id TEXT, key TEXT, value TEXT, PRIMARY KEY (chat_id, key))'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS user_state_key ON user_state (key)')
+
+
+    def get(self, chat_id):
+        """Returns the overrides of a chat, loaded from the database on first access.
+
+        Args:
+            chat_id (str): The chat, an empty string for the overrides of the whole bot.
+
+        Returns:
+            dict: A dictionary setting -> value, to be read only.
+        """
+
+        chat_id = str(chat_id)
+        with self.lock:
+            if chat_id not in self.overrides:
+                rows = self.connection.execute(
+                    'SELECT key, value FROM user_state WHERE chat_id = ?', (chat_id,)
+                ).fetchall()
+                self.overrides[chat_id] = {key: json.loads(value) for key, value in rows}
+                self.logger.debug('Loaded %d overrides of chat %s', len(rows), chat_id)
+
+            return self.overrides[chat_id]
+
+
+    def set(self, chat_id, key, value, default=None):
+        """Stores a setting of a chat, removing it when it is back to the global value.
+
+        Args:
+            chat_id (str): The chat, an empty string for the overrides of the whole bot.
+            key (str): The setting.
+            value (object): Its new value, serializable as json.
+            default (object, optional): The global value of the setting.
+        """
+
+        if value == default:
+            self.delete(chat_id, key)
+            return
+
+        data = json.dumps(value)
+        overrides = self.get(chat_id)
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO user_state VALUES (?, ?, ?)', (str(chat_id), key, data))
+            #A copy, later changes of the value are not stored until set again
+            overrides[key] = json.loads(data)
+
+
+    def delete(self, chat_id, key):
+        """Removes a setting of a chat, so the global value applies again."""
+
+        overrides = self.get(chat_id)
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM user_state WHERE chat_id = ? AND key = ?', (str(chat_id), key))
+            overrides.pop(key, None)
+
+
+    def get_chats(self, key):
+        """Returns the chats overriding a setting.
+
+        Args:
+            key (str): The setting.
+
+        Returns:
+            list: The chat ids, as stored.
+        """
+
+        with self.lock:
+            rows = self.connection.execute('SELECT chat_id FROM user_state WHERE key = ?', (key,)).fetchall()
+
+        return [chat_id for chat_id, in rows]